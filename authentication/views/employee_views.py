@@ -13,7 +13,7 @@ from authentication.serializers import *
 from authentication.filters import EmployeeFilter
 
 from commons.enums import PermissionEnum
-from commons.pagination import Pagination
+from commons.pagination import get_pagination
 
 from authentication.permissions import IsEmployee, IsAdmin
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
@@ -42,6 +42,8 @@ class EmployeeTokenObtainPairView(TokenObtainPairView):
 		OpenApiParameter("page"),
 		
 		OpenApiParameter("size"),
+		OpenApiParameter("cursor"),
+		OpenApiParameter("count"),
   ],
 	request=EmployeeListSerializer,
 	responses=EmployeeListSerializer
@@ -60,28 +62,8 @@ def getAllEmployee(request):
     # Filter employees for the specific user (assuming each employee is linked to a user via ForeignKey)
     employees = Employee.objects.filter(user=user)
     
-    # Debugging: Print the number of employees associated with the user
-    print(f"Employees found for User {user.id}: {employees.count()}")
-    
-    total_elements = employees.count()
-
-    # Pagination: Ensure page and size are integers
-    try:
-        page = int(request.query_params.get('page', 1))  # Default to 1 if page is not provided
-        size = int(request.query_params.get('size', 10))  # Default to 10 if size is not provided
-    except ValueError:
-        return Response(
-            {"detail": "Page and size must be integers."},
-            status=status.HTTP_400_BAD_REQUEST
-        )
-
-    # Debugging: Check the pagination values
-    print(f"Pagination - Page: {page}, Size: {size}")
-
-    # Pagination
-    pagination = Pagination()
-    pagination.page = page
-    pagination.size = size
+    # Pagination, keyset pagination when the client sends a cursor
+    pagination = get_pagination(request, ordering='id')
 
     # Apply pagination
     employees = pagination.paginate_data(employees)
@@ -98,7 +80,8 @@ def getAllEmployee(request):
         'page': pagination.page,
         'size': pagination.size,
         'total_pages': pagination.total_pages,
-        'total_elements': total_elements,
+        'total_elements': pagination.total_elements,
+        'next_cursor': pagination.next_cursor,
     }
 
     # Debugging: Print the response before returning it
@@ -154,15 +137,8 @@ def searchEmployee(request):
 
 	print('searched_products: ', employees)
 
-	total_elements = employees.count()
-
-	page = request.query_params.get('page')
-	size = request.query_params.get('size')
-
-	# Pagination
-	pagination = Pagination()
-	pagination.page = page
-	pagination.size = size
+	# Pagination, keyset pagination when the client sends a cursor
+	pagination = get_pagination(request, ordering='id')
 	employees = pagination.paginate_data(employees)
 
 	serializer = EmployeeListSerializer(employees, many=True)
@@ -172,7 +148,8 @@ def searchEmployee(request):
 		'page': pagination.page,
 		'size': pagination.size,
 		'total_pages': pagination.total_pages,
-		'total_elements': total_elements,
+		'total_elements': pagination.total_elements,
+		'next_cursor': pagination.next_cursor,
 	}
 
 	if len(employees) > 0:
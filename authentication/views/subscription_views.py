@@ -9,6 +9,7 @@ from authentication.models import Subscription, SubscriptionPlan
 from django.conf import settings
 import json
 from django.http import JsonResponse
+from commons.clients import stripe_client
 
 # Use Stripe secret key from settings
 stripe.api_key = settings.STRIPE_SECRET_KEY
@@ -68,14 +69,14 @@ def create_payment_intent(request):
             return JsonResponse({'error': 'Invalid plan.'}, status=400)
 
         # Create PaymentIntent with plan price and metadata
-        payment_intent = stripe.PaymentIntent.create(
-            amount=int(plan.price * 100),  # Stripe expects cents
-            currency='usd',
-            metadata={
+        payment_intent = stripe_client().payment_intents.create(params={
+            'amount': int(plan.price * 100),  # Stripe expects cents
+            'currency': 'usd',
+            'metadata': {
                 'user_id': str(user.id),
                 'plan_id': plan_id
             }
-        )
+        })
 
         return JsonResponse({
             'client_secret': payment_intent.client_secret
@@ -89,7 +90,7 @@ def create_stripe_customer(request):
     user = request.user
     try:
         # Create a new Stripe customer using the user's email
-        customer = stripe.Customer.create(email=user.email)
+        customer = stripe_client().customers.create(params={'email': user.email})
 
         # Respond with the customer ID (useful for later attachment of payment methods or subscription creation)
         return Response({"customer_id": customer.id}, status=200)
@@ -105,12 +106,12 @@ def attach_payment_method(request):
 
     try:
         # Attach the payment method to the customer
-        stripe.PaymentMethod.attach(payment_method_id, customer=customer_id)
+        stripe_client().payment_methods.attach(payment_method_id, params={'customer': customer_id})
 
         # Set the attached payment method as the default for the customer
-        stripe.Customer.modify(
+        stripe_client().customers.update(
             customer_id,
-            invoice_settings={'default_payment_method': payment_method_id},
+            params={'invoice_settings': {'default_payment_method': payment_method_id}},
         )
 
         return Response({"message": "Payment method attached successfully."}, status=200)
@@ -123,10 +124,10 @@ def create_payment_method(request):
     card_data = request.data.get('card_data')  # Card data is passed as a parameter (e.g., number, exp_month, exp_year, cvc)
     try:
         # Create a payment method using Stripe's API
-        payment_method = stripe.PaymentMethod.create(
-            type="card",
-            card=card_data
-        )
+        payment_method = stripe_client().payment_methods.create(params={
+            'type': "card",
+            'card': card_data
+        })
         return Response({"payment_method_id": payment_method.id}, status=200)
     except Exception as e:
         return Response({"error": str(e)}, status=400)
@@ -141,11 +142,11 @@ def create_subscription(request):
 
     try:
         # Create the subscription using the provided details
-        subscription = stripe.Subscription.create(
-            customer=customer_id,
-            items=[{"price": plan_id}],  # Stripe Price ID (Plan ID)
-            default_payment_method=payment_method_id  # Use the attached payment method
-        )
+        subscription = stripe_client().subscriptions.create(params={
+            'customer': customer_id,
+            'items': [{"price": plan_id}],  # Stripe Price ID (Plan ID)
+            'default_payment_method': payment_method_id  # Use the attached payment method
+        })
 
         return Response({"subscription_id": subscription.id}, status=200)
     except Exception as e:
@@ -25,7 +25,8 @@ from authentication.filters import UserFilter
 from utils.login_logout import get_all_logged_in_users
 
 from commons.enums import PermissionEnum
-from commons.pagination import Pagination
+from commons.pagination import get_pagination
+from commons.streaming import EXPORT_FORMATS, stream_export
 import random
 from django.core.mail import send_mail
 
@@ -81,6 +82,8 @@ class MyTokenObtainPairView(TokenObtainPairView):
 	parameters=[
 		OpenApiParameter("page"),
 		OpenApiParameter("size"),
+		OpenApiParameter("cursor"),
+		OpenApiParameter("count"),
   ],
 	request=AdminUserSerializer,
 	responses=AdminUserSerializer
@@ -90,15 +93,9 @@ class MyTokenObtainPairView(TokenObtainPairView):
 # @has_permissions([PermissionEnum.PERMISSION_LIST.name])
 def getAllUser(request):
 	users = User.objects.all()
-	total_elements = users.count()
 
-	page = request.query_params.get('page')
-	size = request.query_params.get('size')
-
-	# Pagination
-	pagination = Pagination()
-	pagination.page = page
-	pagination.size = size
+	# Pagination, keyset pagination when the client sends a cursor
+	pagination = get_pagination(request, ordering='id')
 	users = pagination.paginate_data(users)
 
 	serializer = AdminUserListSerializer(users, many=True)
@@ -108,7 +105,8 @@ def getAllUser(request):
 		'page': pagination.page,
 		'size': pagination.size,
 		'total_pages': pagination.total_pages,
-		'total_elements': total_elements,
+		'total_elements': pagination.total_elements,
+		'next_cursor': pagination.next_cursor,
 	}
 
 	return Response(response, status=status.HTTP_200_OK)
@@ -120,6 +118,8 @@ def getAllUser(request):
 	parameters=[
 		OpenApiParameter("page"),
 		OpenApiParameter("size"),
+		OpenApiParameter("cursor"),
+		OpenApiParameter("count"),
   ],
 	request=AdminUserSerializer,
 	responses=AdminUserSerializer
@@ -129,17 +129,11 @@ def getAllUser(request):
 # @has_permissions([PermissionEnum.PERMISSION_LIST.name])
 def getAllUserWithLoggedInStatus(request):
 	users = User.objects.all()
-	total_elements = users.count()
 
 	logged_in_user_ids = get_all_logged_in_users()
 
-	page = request.query_params.get('page')
-	size = request.query_params.get('size')
-
-	# Pagination
-	pagination = Pagination()
-	pagination.page = page
-	pagination.size = size
+	# Pagination, keyset pagination when the client sends a cursor
+	pagination = get_pagination(request, ordering='id')
 	users = pagination.paginate_data(users)
 
 	serializer = AdminUserListSerializer(users, many=True)
@@ -149,7 +143,8 @@ def getAllUserWithLoggedInStatus(request):
 		'page': pagination.page,
 		'size': pagination.size,
 		'total_pages': pagination.total_pages,
-		'total_elements': total_elements,
+		'total_elements': pagination.total_elements,
+		'next_cursor': pagination.next_cursor,
 	}
 
 	return Response(response, status=status.HTTP_200_OK)
@@ -161,6 +156,7 @@ def getAllUserWithLoggedInStatus(request):
 	parameters=[
 		OpenApiParameter("page"),
 		OpenApiParameter("size"),
+		OpenApiParameter("export"),
   ],
 	request=AdminUserSerializer,
 	responses=AdminUserSerializer
@@ -171,6 +167,12 @@ def getAllUserWithLoggedInStatus(request):
 def getAllUserWithoutPagination(request):
 	users = User.objects.all()
 
+	# ?export=ndjson|csv streams the rows instead of building one response in memory
+	export_format = request.query_params.get('export')
+	if export_format in EXPORT_FORMATS:
+		users = users.select_related('city', 'country', 'created_by', 'updated_by')
+		return stream_export(users, AdminUserListSerializer, export_format, filename='users')
+
 	serializer = AdminUserListSerializer(users, many=True)
 
 	return Response({'users': serializer.data}, status=status.HTTP_200_OK)
@@ -203,15 +205,8 @@ def searchUser(request):
 
 	print('searched_products: ', users)
 
-	total_elements = users.count()
-
-	page = request.query_params.get('page')
-	size = request.query_params.get('size')
-
-	# Pagination
-	pagination = Pagination()
-	pagination.page = page
-	pagination.size = size
+	# Pagination, keyset pagination when the client sends a cursor
+	pagination = get_pagination(request, ordering='id')
 	users = pagination.paginate_data(users)
 
 	serializer = AdminUserListSerializer(users, many=True)
@@ -221,7 +216,8 @@ def searchUser(request):
 		'page': pagination.page,
 		'size': pagination.size,
 		'total_pages': pagination.total_pages,
-		'total_elements': total_elements,
+		'total_elements': pagination.total_elements,
+		'next_cursor': pagination.next_cursor,
 	}
 
 	if len(users) > 0:
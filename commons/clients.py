@@ -0,0 +1,196 @@
+"""Process-wide clients for external services.
+
+Building a boto3 or OpenAI client resolves credentials, loads endpoint data and starts an
+empty connection pool, so the next call pays a TLS handshake. The registry builds each
+client once per process, with a keep-alive pool sized by ``EXTERNAL_CLIENT_POOL_SIZE``,
+and hands the same instance to every thread (boto3 clients, the OpenAI client and the
+Stripe client are thread safe).
+
+Pools must not cross a fork: a gunicorn worker forked from a preloaded master would share
+the master's sockets. The registry forgets its clients in the child, after the fork and
+whenever it notices a new pid, without closing them, closing would send TLS close_notify
+on the parent's connections.
+
+``timed(name)`` around a call records its latency, split between the first call of a
+client (new connection, handshake included) and later calls (reused connections).
+``client_stats()`` returns the counters. Limits, deadlines and circuit breaking of the
+calls themselves are in ``commons.resilience``.
+"""
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+import boto3
+import httpx
+import requests
+import stripe
+from botocore.config import Config
+from django.conf import settings
+from openai import DefaultHttpxClient, OpenAI
+from requests.adapters import HTTPAdapter
+
+from commons import resilience
+
+
+POOL_SIZE = getattr(settings, 'EXTERNAL_CLIENT_POOL_SIZE', 20)
+KEEPALIVE_SECONDS = getattr(settings, 'EXTERNAL_CLIENT_KEEPALIVE_SECONDS', 60)
+CONNECT_TIMEOUT = getattr(settings, 'EXTERNAL_CLIENT_CONNECT_TIMEOUT_SECONDS', 5)
+READ_TIMEOUT = getattr(settings, 'EXTERNAL_CLIENT_READ_TIMEOUT_SECONDS', 60)
+
+TEXTRACT = 'textract'
+OPENAI = 'openai'
+STRIPE = 'stripe'
+
+
+class ClientRegistry:
+
+    def __init__(self):
+        self._factories = {}
+        self._clients = {}
+        self._warm = set()
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._stats = defaultdict(lambda: dict.fromkeys(
+            ['constructed', 'construct_ms', 'first_calls', 'first_call_ms', 'reused_calls', 'reused_call_ms', 'errors'], 0,
+        ))
+
+    def register(self, name, factory):
+        self._factories[name] = factory
+
+    def reset(self):
+        """Forget every client without closing it, used in a forked child"""
+        with self._lock:
+            self._clients = {}
+            self._warm = set()
+            self._pid = os.getpid()
+
+    def get(self, name):
+        if self._pid != os.getpid():
+            self.reset()
+        client = self._clients.get(name)
+        if client is not None:
+            return client
+
+        with self._lock:
+            client = self._clients.get(name)
+            if client is None:
+                started = time.perf_counter()
+                client = self._factories[name]()
+                stats = self._stats[name]
+                stats['constructed'] += 1
+                stats['construct_ms'] += (time.perf_counter() - started) * 1000
+                self._clients[name] = client
+        return client
+
+    @contextmanager
+    def timed(self, name):
+        first = name not in self._warm
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            with self._lock:
+                self._stats[name]['errors'] += 1
+            raise
+        finally:
+            elapsed = (time.perf_counter() - started) * 1000
+            prefix = 'first_call' if first else 'reused_call'
+            with self._lock:
+                self._warm.add(name)
+                stats = self._stats[name]
+                stats[f'{prefix}s'] += 1
+                stats[f'{prefix}_ms'] += elapsed
+
+    def stats(self):
+        with self._lock:
+            stats = {name: dict(counters) for name, counters in self._stats.items()}
+        for counters in stats.values():
+            for prefix in ('construct', 'first_call', 'reused_call'):
+                count = counters['constructed' if prefix == 'construct' else f'{prefix}s']
+                total = counters.pop(f'{prefix}_ms')
+                counters[f'{prefix}_avg_ms'] = round(total / count, 2) if count else None
+        return stats
+
+
+registry = ClientRegistry()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=registry.reset)
+
+
+# Factories
+
+def _textract():
+    return boto3.session.Session().client(
+        'textract',
+        aws_access_key_id=getattr(settings, 'AWS_ACCESS_KEY_ID', None),
+        aws_secret_access_key=getattr(settings, 'AWS_SECRET_ACCESS_KEY', None),
+        region_name=getattr(settings, 'AWS_REGION', None),
+        endpoint_url=getattr(settings, 'TEXTRACT_ENDPOINT_URL', None),
+        config=Config(
+            max_pool_connections=POOL_SIZE,
+            tcp_keepalive=True,
+            connect_timeout=CONNECT_TIMEOUT,
+            # boto3 has no per-call timeout, a read may take at most the call's deadline
+            read_timeout=min(READ_TIMEOUT, resilience.dependency(TEXTRACT).timeout),
+            # Retrying inside the call would overrun its deadline, failed jobs are retried with backoff
+            retries={'max_attempts': 1, 'mode': 'standard'},
+        ),
+    )
+
+
+def _openai():
+    return OpenAI(
+        api_key=settings.OPENAI_API_KEY,
+        base_url=getattr(settings, 'OPENAI_BASE_URL', None),
+        max_retries=0,
+        timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+        http_client=DefaultHttpxClient(
+            limits=httpx.Limits(max_connections=POOL_SIZE, max_keepalive_connections=POOL_SIZE, keepalive_expiry=KEEPALIVE_SECONDS),
+        ),
+    )
+
+
+class _TimedStripeHTTPClient(stripe.RequestsClient):
+    """Stripe calls go through the services of one client, time them at the transport"""
+
+    def request(self, method, url, headers, post_data=None):
+        with registry.timed(STRIPE):
+            return super().request(method, url, headers, post_data)
+
+
+def _stripe():
+    session = requests.Session()
+    session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE))
+    return stripe.StripeClient(
+        settings.STRIPE_SECRET_KEY,
+        max_network_retries=2,
+        http_client=_TimedStripeHTTPClient(timeout=READ_TIMEOUT, session=session),
+    )
+
+
+registry.register(TEXTRACT, _textract)
+registry.register(OPENAI, _openai)
+registry.register(STRIPE, _stripe)
+
+
+def textract_client():
+    return registry.get(TEXTRACT)
+
+
+def openai_client():
+    return registry.get(OPENAI)
+
+
+def stripe_client():
+    return registry.get(STRIPE)
+
+
+def timed(name):
+    return registry.timed(name)
+
+
+def client_stats():
+    return registry.stats()
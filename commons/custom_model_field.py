@@ -0,0 +1,64 @@
+import json
+import zlib
+
+from django.db import models
+from django.db.models.expressions import Expression
+
+
+COMPRESSION_LEVEL = 6
+
+
+def _decompress(value):
+    value = bytes(value)
+    try:
+        return zlib.decompress(value).decode()
+    except zlib.error:
+        # Rows written before the column was compressed
+        return value.decode()
+
+
+class CompressedTextField(models.TextField):
+    """Text stored zlib-compressed in a binary column.
+
+    Meant for large payloads that are written once and read rarely, the column can't be
+    filtered on. Callers listing rows should ``defer()`` it.
+    """
+
+    def get_internal_type(self):
+        return 'BinaryField'
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        if value is None or isinstance(value, Expression):
+            return value
+        data = zlib.compress(str(value).encode(), COMPRESSION_LEVEL)
+        return connection.Database.Binary(data)
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return value
+        return _decompress(value)
+
+
+class CompressedJSONField(models.JSONField):
+    """JSON stored zlib-compressed in a binary column.
+
+    Behaves like a JSONField in Python, serializers and admin forms, but key lookups and
+    other JSON operators aren't available in queries. Callers listing rows should ``defer()`` it.
+    """
+
+    def get_internal_type(self):
+        return 'BinaryField'
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        if value is None or isinstance(value, Expression):
+            return value
+        data = zlib.compress(json.dumps(value, cls=self.encoder).encode(), COMPRESSION_LEVEL)
+        return connection.Database.Binary(data)
+
+    def get_db_prep_save(self, value, connection):
+        return self.get_db_prep_value(value, connection)
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return value
+        return json.loads(_decompress(value), cls=self.decoder)
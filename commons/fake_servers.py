@@ -0,0 +1,132 @@
+"""Local stand-in for Textract and OpenAI that answers with injected latency and errors.
+
+One HTTP server speaks just enough of both protocols for the calls this project makes:
+Textract ``DetectDocumentText`` (JSON 1.1, told apart by its ``X-Amz-Target`` header) and
+OpenAI chat completions, streamed or not. Point the clients at it with the
+``TEXTRACT_ENDPOINT_URL`` and ``OPENAI_BASE_URL`` settings (``<url>/v1`` for OpenAI) to
+see how the bulkheads and breakers of ``commons.resilience`` behave when a dependency is
+slow or failing. ``manage.py run_fake_dependencies`` runs one in the foreground, tests
+start one on a free port.
+"""
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+DEFAULT_LINES = ['FAKE SHOP', 'TOTAL 1.00']
+DEFAULT_COMPLETION = '{}'
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send_json(self, status, data, content_type='application/json'):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        try:
+            self._answer()
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up first, the timeouts under test do exactly that
+            self.close_connection = True
+
+    def _answer(self):
+        payload = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        textract = self.headers.get('X-Amz-Target', '').startswith('Textract.')
+        content_type = 'application/x-amz-json-1.1' if textract else 'application/json'
+
+        time.sleep(self.server.next_delay())
+        if self.server.next_fails():
+            self._send_json(500, {'__type': 'InternalServerError', 'message': 'Injected failure'} if textract else {'error': {'message': 'Injected failure', 'type': 'server_error'}}, content_type)
+            return
+
+        if textract:
+            blocks = [{'BlockType': 'PAGE', 'Id': 'page'}]
+            blocks += [{'BlockType': 'LINE', 'Id': f'line-{index}', 'Text': line, 'Confidence': 99.0} for index, line in enumerate(self.server.lines)]
+            self._send_json(200, {'DocumentMetadata': {'Pages': 1}, 'Blocks': blocks, 'DetectDocumentTextModelVersion': '1.0'}, content_type)
+        elif self.path.rstrip('/').endswith('/chat/completions'):
+            self._completion(json.loads(payload or b'{}'))
+        else:
+            self._send_json(404, {'error': {'message': f'Unknown path {self.path}', 'type': 'invalid_request_error'}})
+
+    def _completion(self, request):
+        answer = {'id': 'chatcmpl-fake', 'created': int(time.time()), 'model': request.get('model', 'gpt-4')}
+        if not request.get('stream'):
+            self._send_json(200, {**answer, 'object': 'chat.completion', 'choices': [
+                {'index': 0, 'message': {'role': 'assistant', 'content': self.server.completion}, 'finish_reason': 'stop'},
+            ]})
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        text = self.server.completion
+        for start in range(0, len(text), 20):
+            chunk = {**answer, 'object': 'chat.completion.chunk', 'choices': [{'index': 0, 'delta': {'content': text[start:start + 20]}, 'finish_reason': None}]}
+            self.wfile.write(f'data: {json.dumps(chunk)}\n\n'.encode())
+            self.wfile.flush()
+            time.sleep(self.server.chunk_delay)
+        self.wfile.write(b'data: [DONE]\n\n')
+        self.close_connection = True
+
+
+class FakeDependencyServer(ThreadingHTTPServer):
+    """``delays`` (seconds) are used for the first requests in order, later ones wait ``latency``
+    plus up to ``jitter`` seconds and fail with a 500 at ``error_rate``. Streamed completions
+    wait ``chunk_delay`` seconds between chunks."""
+    daemon_threads = True
+
+    def __init__(self, port=0, latency=0, jitter=0, error_rate=0, delays=(), chunk_delay=0, lines=DEFAULT_LINES, completion=DEFAULT_COMPLETION, verbose=False):
+        super().__init__(('127.0.0.1', port), _Handler)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.chunk_delay = chunk_delay
+        self.lines = list(lines)
+        self.completion = completion
+        self.verbose = verbose
+        self.requests = 0
+        self._delays = list(delays)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_port}'
+
+    def next_delay(self):
+        with self._lock:
+            self.requests += 1
+            if self._delays:
+                return self._delays.pop(0)
+        return self.latency + random.uniform(0, self.jitter)
+
+    def next_fails(self):
+        return random.random() < self.error_rate
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -0,0 +1,161 @@
+"""Cache for LLM generations keyed by a normalized prompt and a context hash.
+
+Each ``GenerationCache`` keeps an in-process LRU with a TTL in front of the Django cache,
+which is shared between workers. Identical requests arriving while a generation is in
+flight wait for it instead of starting their own (within one process). Hit and miss
+counters of every cache are available through ``generation_cache_stats()``.
+"""
+import hashlib
+import json
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from django.conf import settings
+from django.core.cache import cache as shared_cache
+
+
+DEFAULT_MAX_ENTRIES = getattr(settings, 'GENERATION_CACHE_MAX_ENTRIES', 1024)
+DEFAULT_TTL = getattr(settings, 'GENERATION_CACHE_TTL_SECONDS', 60 * 60 * 24)
+
+_registry = {}
+
+
+def normalize_prompt(prompt):
+    """Fold case, unicode forms, whitespace and trailing punctuation so near-identical prompts match"""
+    prompt = unicodedata.normalize('NFKC', str(prompt or '')).casefold()
+    prompt = re.sub(r'\s+', ' ', prompt)
+    return prompt.strip(' .,!?;:')
+
+
+def context_hash(context):
+    """Stable hash of any JSON serializable context"""
+    data = json.dumps(context, sort_keys=True, default=str, separators=(',', ':'))
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+class GenerationCache:
+
+    def __init__(self, name, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL, shared=True):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.shared = shared
+
+        self._entries = OrderedDict()  # key -> (expires_at, value), least recently used first
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self._counters = dict.fromkeys(['hits', 'shared_hits', 'misses', 'coalesced', 'evictions', 'expired'], 0)
+
+        _registry[name] = self
+
+    def key(self, prompt, context=None):
+        data = f'{normalize_prompt(prompt)}\0{context_hash(context)}'
+        return hashlib.sha256(data.encode()).hexdigest()
+
+    def _shared_key(self, key):
+        return f'generation:{self.name}:{key}'
+
+    def _count(self, counter):
+        self._counters[counter] += 1
+
+    def _get_local(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del self._entries[key]
+            self._count('expired')
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def _set_local(self, key, value):
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._count('evictions')
+
+    def get(self, key):
+        """Cached value of ``key`` or None, from this process first and then the shared cache"""
+        with self._lock:
+            value = self._get_local(key)
+            if value is not None:
+                self._count('hits')
+                return value
+
+        value = shared_cache.get(self._shared_key(key)) if self.shared else None
+        with self._lock:
+            if value is None:
+                self._count('misses')
+            else:
+                self._count('shared_hits')
+                self._set_local(key, value)
+        return value
+
+    def set(self, key, value):
+        if value is None:
+            return
+        with self._lock:
+            self._set_local(key, value)
+        if self.shared:
+            shared_cache.set(self._shared_key(key), value, self.ttl)
+
+    def get_or_generate(self, prompt, generate, context=None):
+        """Return ``(value, cached)``, calling ``generate()`` only on a miss.
+
+        Concurrent callers with the same key share one call. Failures and None results
+        aren't cached, waiting callers get the same exception.
+        """
+        key = self.key(prompt, context)
+        value = self.get(key)
+        if value is not None:
+            return value, True
+
+        with self._lock:
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = self._in_flight[key] = Future()
+            else:
+                self._count('coalesced')
+
+        if not leader:
+            return future.result(), True
+
+        try:
+            value = generate()
+            self.set(key, value)
+            future.set_result(value)
+            return value, False
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+            size = len(self._entries)
+        lookups = counters['hits'] + counters['shared_hits'] + counters['misses']
+        return {
+            **counters,
+            'size': size,
+            'max_entries': self.max_entries,
+            'ttl': self.ttl,
+            'hit_rate': round((counters['hits'] + counters['shared_hits']) / lookups, 4) if lookups else None,
+        }
+
+
+def generation_cache_stats():
+    return {name: generation_cache.stats() for name, generation_cache in _registry.items()}
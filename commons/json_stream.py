@@ -0,0 +1,53 @@
+import json
+
+
+class JSONArrayStream:
+    """Incremental parser yielding the objects of the first JSON array in a text stream.
+
+    Feed it the text chunks of a streamed completion, e.g. ``{"tasks": [{...}, {...}]}`` or
+    a bare array, and each call returns the objects completed by that chunk. Text outside
+    the array (markdown fences, keys, trailing prose) is ignored. Each character is looked
+    at once, only the object being read is buffered.
+    """
+
+    def __init__(self):
+        self.depth = 0
+        self.array_depth = None
+        self.finished = False
+        self.in_string = False
+        self.escaped = False
+        self.buffer = None
+
+    def feed(self, text):
+        items = []
+        for char in text or '':
+            if self.finished:
+                break
+            if self.buffer is not None:
+                self.buffer.append(char)
+
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == '\\':
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+                continue
+
+            if char == '"':
+                self.in_string = True
+            elif char in '[{':
+                self.depth += 1
+                if char == '[' and self.array_depth is None:
+                    self.array_depth = self.depth
+                elif char == '{' and self.array_depth is not None and self.depth == self.array_depth + 1:
+                    self.buffer = ['{']
+            elif char in ']}':
+                if char == '}' and self.buffer is not None and self.depth == self.array_depth + 1:
+                    items.append(json.loads(''.join(self.buffer)))
+                    self.buffer = None
+                elif char == ']' and self.depth == self.array_depth:
+                    self.finished = True
+                self.depth -= 1
+        return items
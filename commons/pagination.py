@@ -1,4 +1,65 @@
+import base64
+import binascii
+import json
+import math
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
 from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
+from django.db import connections
+from django.db.models import Q
+
+
+COUNT_EXACT = 'exact'
+COUNT_ESTIMATE = 'estimate'
+COUNT_NONE = 'none'
+COUNT_MODES = (COUNT_EXACT, COUNT_ESTIMATE, COUNT_NONE)
+
+
+def estimate_count(queryset):
+    """Return the planner's row estimate for a queryset instead of running COUNT(*).
+
+    Only PostgreSQL exposes a usable estimate, other backends fall back to an exact count.
+    """
+    if not hasattr(queryset, 'query'):
+        return len(queryset)
+
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return queryset.count()
+
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+        plan = cursor.fetchone()[0]
+
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def encode_cursor(payload):
+    """Serialize a JSON payload into an opaque url-safe token"""
+    data = json.dumps(payload, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+
+def decode_cursor(value):
+    """Inverse of encode_cursor, raises ValueError for a malformed token"""
+    try:
+        padded = value + '=' * (-len(value) % 4)
+        return json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (binascii.Error, UnicodeDecodeError) as e:
+        raise ValueError('Malformed cursor') from e
+
+
+def count_data(data, mode=COUNT_EXACT):
+    """Count a queryset (or list) according to the requested count mode, None when skipped"""
+    if mode == COUNT_NONE:
+        return None
+    if mode == COUNT_ESTIMATE:
+        return estimate_count(data)
+    return data.count() if hasattr(data, 'query') else len(data)
+
 
 class Pagination:
 
@@ -7,6 +68,8 @@ class Pagination:
         self._size = 10
         self._max_size = 100
         self._total_pages = 1
+        self._total_elements = None
+        self._count_mode = COUNT_EXACT
 
     @property
     def page(self):
@@ -26,9 +89,27 @@ class Pagination:
 
     @total_pages.setter
     def total_pages(self, value):
-        if isinstance(value, int):
+        if isinstance(value, int) or value is None:
             self._total_pages = value
 
+    @property
+    def total_elements(self):
+        return self._total_elements
+
+    @property
+    def count_mode(self):
+        return self._count_mode
+
+    @count_mode.setter
+    def count_mode(self, value):
+        # One of 'exact', 'estimate' or 'none', anything else keeps the exact count
+        self._count_mode = value if value in COUNT_MODES else COUNT_EXACT
+
+    @property
+    def next_cursor(self):
+        # Offset pagination has no cursor, kept so both paginators share one response envelope
+        return None
+
     @property
     def size(self):
         return self._size
@@ -48,7 +129,18 @@ class Pagination:
             self._size = 10  # Default to 10 if invalid value
 
     def paginate_data(self, data):
+        if self.count_mode == COUNT_NONE:
+            # Skip the count entirely, fetch one extra row only to know whether a next page exists
+            offset = (self.page - 1) * self.size
+            rows = list(data[offset:offset + self.size + 1])
+            self._total_elements = None
+            self.total_pages = None if len(rows) > self.size else self.page
+            return rows[:self.size]
+
         paginator = Paginator(data, self.size)
+        # Paginator caches its count, seeding it here means COUNT(*) runs at most once per request
+        paginator.count = count_data(data, self.count_mode)
+        self._total_elements = paginator.count
         self.total_pages = paginator.num_pages
 
         try:
@@ -61,3 +153,122 @@ class Pagination:
             data = paginator.page(self.total_pages)
 
         return data
+
+
+class KeysetPagination(Pagination):
+    """Cursor based pagination over an ``(ordering key, id)`` pair.
+
+    Each page is fetched with an indexed range predicate continuing after the last row of
+    the previous page, so deep pages cost the same as the first one. The opaque cursor also
+    carries the page number, which keeps the ``page/size/total_pages`` envelope meaningful.
+    The ordering key must not be nullable.
+    """
+
+    def __init__(self, ordering='id'):
+        super().__init__()
+        self._descending = ordering.startswith('-')
+        self._key = ordering.lstrip('-')
+        self._cursor = None
+        self._next_cursor = None
+
+    @property
+    def ordering(self):
+        direction = '-' if self._descending else ''
+        fields = [direction + self._key]
+        if self._key not in ('id', 'pk'):
+            fields.append(direction + 'id')
+        return fields
+
+    @property
+    def cursor(self):
+        return self._cursor
+
+    @cursor.setter
+    def cursor(self, value):
+        # An empty or unreadable cursor starts from the first page
+        self._cursor = self.decode_page_cursor(value) if value else None
+        self._page = self._cursor['page'] if self._cursor else 1
+
+    @property
+    def next_cursor(self):
+        return self._next_cursor
+
+    @staticmethod
+    def decode_page_cursor(value):
+        try:
+            payload = decode_cursor(value)
+            return {'page': max(int(payload['page']), 1), 'values': list(payload['values'])}
+        except (ValueError, TypeError, KeyError, AttributeError):
+            return None
+
+    def _seek_filter(self, model, values):
+        """Rows strictly after ``values`` in (key, id) order, i.e. key > k OR (key = k AND id > i)"""
+        lookup = 'lt' if self._descending else 'gt'
+        fields = [field.lstrip('-') for field in self.ordering]
+        if len(values) != len(fields):
+            raise ValueError('Cursor does not match the pagination ordering')
+        values = [model._meta.get_field(field).to_python(value) for field, value in zip(fields, values)]
+
+        condition = Q()
+        for position, field in enumerate(fields):
+            equal = {fields[i]: values[i] for i in range(position)}
+            condition |= Q(**equal, **{f'{field}__{lookup}': values[position]})
+        return condition
+
+    def _cursor_values(self, obj):
+        values = []
+        for field in self.ordering:
+            value = getattr(obj, field.lstrip('-'))
+            values.append(value.isoformat() if hasattr(value, 'isoformat') else value)
+        return values
+
+    def paginate_data(self, data):
+        self._total_elements = count_data(data, self.count_mode)
+        if self._total_elements is None:
+            self.total_pages = None
+        else:
+            self.total_pages = max(math.ceil(self._total_elements / self.size), 1)
+
+        queryset = data.order_by(*self.ordering)
+        if self._cursor:
+            try:
+                queryset = queryset.filter(self._seek_filter(data.model, self._cursor['values']))
+            except (ValidationError, FieldDoesNotExist, ValueError, TypeError):
+                # A cursor built for another ordering can't be applied, restart from the top
+                self._page = 1
+
+        rows = list(queryset[:self.size + 1])
+        has_next = len(rows) > self.size
+        rows = rows[:self.size]
+
+        self._next_cursor = None
+        if has_next and rows:
+            self._next_cursor = encode_cursor({
+                'page': self.page + 1,
+                'values': self._cursor_values(rows[-1]),
+            })
+        elif self._total_elements is None:
+            self.total_pages = self.page
+
+        return rows
+
+
+def get_pagination(request, ordering='id', keyset=True, default_count=None):
+    """Build the paginator for a list request.
+
+    Clients sending a ``cursor`` query parameter (empty for the first page) get keyset
+    pagination, everyone else keeps the classic ``page/size`` offset pagination.
+    ``keyset=False`` forces offset pagination, for results ordered by a computed value.
+    ``count`` selects how ``total_elements`` is computed: exact, estimate or none,
+    ``default_count`` when the client doesn't say.
+    """
+    params = request.query_params
+    if keyset and 'cursor' in params:
+        pagination = KeysetPagination(ordering=ordering)
+        pagination.cursor = params.get('cursor')
+    else:
+        pagination = Pagination()
+        pagination.page = params.get('page')
+    pagination.size = params.get('size')
+    pagination.count_mode = params.get('count', default_count)
+    return pagination
@@ -0,0 +1,281 @@
+"""Bulkheads, deadlines and circuit breakers around calls to external services.
+
+A slow Textract or OpenAI holds every thread that waits on it, until no worker is left for
+the cheap endpoints. Each dependency gets, per process:
+
+- a bulkhead: at most ``max_concurrent`` calls in flight. A call waits ``queue_seconds``
+  for a slot and then fails with ``BulkheadFull`` instead of queueing behind slow calls.
+- a deadline: the call gets ``timeout`` seconds, less when the caller passes a shorter one.
+  The seconds left are passed to the call, to be handed to the client.
+  Streamed responses hold their slot through ``slot()`` until the last chunk is read.
+- a circuit breaker: after ``failure_threshold`` failures in a row calls fail at once with
+  ``CircuitOpen`` for ``reset_seconds``, then a single trial call decides whether it closes.
+  Timeouts, connection errors, 5xx and throttling count as failures, rejected requests don't.
+
+``EXTERNAL_DEPENDENCIES`` in the settings overrides ``DEFAULTS`` per dependency name.
+``dependency_stats()`` returns the counters and recent latency percentiles of each.
+"""
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from django.conf import settings
+
+
+DEFAULTS = {
+    'textract': {'max_concurrent': 8, 'timeout': 20, 'queue_seconds': 1, 'failure_threshold': 5, 'reset_seconds': 30},
+    'openai': {'max_concurrent': 8, 'timeout': 60, 'queue_seconds': 1, 'failure_threshold': 5, 'reset_seconds': 30},
+}
+FALLBACK = {'max_concurrent': 8, 'timeout': 30, 'queue_seconds': 1, 'failure_threshold': 5, 'reset_seconds': 30}
+
+# Calls made while serving a request have to finish before gunicorn's 30 s worker timeout
+REQUEST_BUDGET_SECONDS = getattr(settings, 'EXTERNAL_REQUEST_BUDGET_SECONDS', 25)
+MIN_TIMEOUT = 0.05
+LATENCY_SAMPLES = 500
+THROTTLING_CODES = {'ThrottlingException', 'ProvisionedThroughputExceededException', 'LimitExceededException', 'RequestLimitExceeded'}
+
+
+class DependencyUnavailable(Exception):
+    """The call was refused or didn't finish in time"""
+
+
+class CircuitOpen(DependencyUnavailable):
+    pass
+
+
+class BulkheadFull(DependencyUnavailable):
+    pass
+
+
+class DeadlineExceeded(DependencyUnavailable, TimeoutError):
+    pass
+
+
+def is_failure(error):
+    """Whether an error says the dependency is down or overloaded, a rejected request (4xx) doesn't"""
+    status = getattr(error, 'status_code', None)
+    response = getattr(error, 'response', None)
+    if isinstance(response, dict):
+        # botocore ClientError
+        if response.get('Error', {}).get('Code') in THROTTLING_CODES:
+            return True
+        status = response.get('ResponseMetadata', {}).get('HTTPStatusCode', status)
+    return not isinstance(status, int) or status == 429 or status >= 500
+
+
+def is_timeout(error):
+    return isinstance(error, TimeoutError) or 'Timeout' in type(error).__name__
+
+
+class Deadline:
+
+    def __init__(self, name, at):
+        self.name = name
+        self.at = at
+
+    def remaining(self):
+        return max(self.at - time.monotonic(), MIN_TIMEOUT)
+
+    def check(self):
+        if time.monotonic() >= self.at:
+            raise DeadlineExceeded(f"{self.name} didn't finish within the deadline")
+
+
+class CircuitBreaker:
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold, reset_seconds):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_seconds:
+                self.state = self.HALF_OPEN
+                self._trial = False
+            if self.state == self.OPEN:
+                return False
+            if self.state == self.HALF_OPEN:
+                if self._trial:
+                    return False
+                self._trial = True
+            return True
+
+    def cancel(self):
+        """The allowed call wasn't made, let the next one be the trial"""
+        with self._lock:
+            self._trial = False
+
+    def retry_after(self):
+        if self.state != self.OPEN:
+            return 0
+        return max(self.reset_seconds - (time.monotonic() - self.opened_at), 0)
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self._trial = False
+
+
+class Dependency:
+
+    def __init__(self, name, max_concurrent, timeout, queue_seconds, failure_threshold, reset_seconds):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.timeout = timeout
+        self.queue_seconds = queue_seconds
+        self.breaker = CircuitBreaker(failure_threshold, reset_seconds)
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._latencies = deque(maxlen=LATENCY_SAMPLES)
+        self._stats = dict.fromkeys(
+            ['calls', 'successes', 'errors', 'timeouts', 'rejected_open', 'rejected_full', 'circuit_opened'], 0,
+        )
+
+    def _count(self, counter, value=1):
+        with self._lock:
+            self._stats[counter] += value
+
+    def _acquire(self, timeout):
+        if not self._slots.acquire(timeout=max(timeout, 0)):
+            return False
+        with self._lock:
+            self._in_flight += 1
+        return True
+
+    def _release(self):
+        with self._lock:
+            self._in_flight -= 1
+        self._slots.release()
+
+    def _record(self, started, error=None):
+        with self._lock:
+            self._latencies.append((time.monotonic() - started) * 1000)
+        if error is None or not is_failure(error):
+            self._count('successes' if error is None else 'errors')
+            self.breaker.record_success()
+            return
+        self._count('errors')
+        if is_timeout(error):
+            self._count('timeouts')
+        was_open = self.breaker.state == CircuitBreaker.OPEN
+        self.breaker.record_failure()
+        if not was_open and self.breaker.state == CircuitBreaker.OPEN:
+            self._count('circuit_opened')
+
+    def _admit(self, timeout=None):
+        """Take a slot, returns the monotonic deadline of the call"""
+        if not self.breaker.allow():
+            self._count('rejected_open')
+            raise CircuitOpen(f"{self.name} is failing, retry in {self.breaker.retry_after():.0f} s")
+
+        deadline = time.monotonic() + min(self.timeout, timeout if timeout is not None else self.timeout)
+        if not self._acquire(min(self.queue_seconds, deadline - time.monotonic())):
+            self.breaker.cancel()
+            self._count('rejected_full')
+            raise BulkheadFull(f"{self.name} has {self.max_concurrent} calls in flight")
+
+        self._count('calls')
+        return deadline
+
+    @contextmanager
+    def slot(self, timeout=None):
+        """Hold a slot for a call that doesn't fit in one function, e.g. a streamed response.
+
+        Yields the call's ``Deadline``. The slot is held until the block exits and an exception
+        leaving the block is recorded like a failed call. ``timeout`` shortens the deadline, e.g.
+        to what a request has left.
+        """
+        deadline = self._admit(timeout)
+        started = time.monotonic()
+        recorded = False
+        try:
+            yield Deadline(self.name, deadline)
+        except Exception as error:
+            recorded = True
+            self._record(started, error)
+            raise
+        else:
+            recorded = True
+            self._record(started)
+        finally:
+            if not recorded:
+                # Closed early (GeneratorExit), says nothing about the dependency
+                self.breaker.cancel()
+            self._release()
+
+    def call(self, fn):
+        """``fn(timeout)`` within the dependency's limits, ``timeout`` being the seconds it has left.
+
+        Raises ``DependencyUnavailable`` when the call is refused or runs out of time, otherwise
+        returns or raises what ``fn`` does.
+        """
+        with self.slot() as deadline:
+            return fn(deadline.remaining())
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            latencies = sorted(self._latencies)
+            stats['in_flight'] = self._in_flight
+        stats.update(state=self.breaker.state, max_concurrent=self.max_concurrent, timeout=self.timeout)
+        stats['latency_ms'] = {
+            f'p{percentile}': round(latencies[min(len(latencies) * percentile // 100, len(latencies) - 1)], 2) if latencies else None
+            for percentile in (50, 95, 99)
+        }
+        return stats
+
+
+_dependencies = {}
+_lock = threading.Lock()
+
+
+def dependency(name):
+    dependency_ = _dependencies.get(name)
+    if dependency_ is not None:
+        return dependency_
+    with _lock:
+        if name not in _dependencies:
+            options = {**DEFAULTS.get(name, FALLBACK), **getattr(settings, 'EXTERNAL_DEPENDENCIES', {}).get(name, {})}
+            _dependencies[name] = Dependency(name, **options)
+        return _dependencies[name]
+
+
+def call(name, fn):
+    return dependency(name).call(fn)
+
+
+def slot(name, timeout=None):
+    return dependency(name).slot(timeout)
+
+
+def reset():
+    """Forget every bulkhead and breaker, slots taken by threads of a parent process never come back"""
+    _dependencies.clear()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=reset)
+
+
+def dependency_stats():
+    return {name: dependency_.stats() for name, dependency_ in list(_dependencies.items())}
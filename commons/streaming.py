@@ -0,0 +1,83 @@
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+
+EXPORT_NDJSON = 'ndjson'
+EXPORT_CSV = 'csv'
+EXPORT_FORMATS = (EXPORT_NDJSON, EXPORT_CSV)
+
+CHUNK_SIZE = 500
+
+
+class Echo:
+    """File-like object whose write returns the value, lets csv.writer produce lines for a generator"""
+
+    def write(self, value):
+        return value
+
+
+def serialized_rows(queryset, serializer_class, chunk_size=CHUNK_SIZE):
+    """Yield serialized rows of a queryset read through a server-side cursor.
+
+    Rows are serialized ``chunk_size`` at a time, so memory holds one chunk however large
+    the table is.
+    """
+    chunk = []
+    for obj in queryset.iterator(chunk_size=chunk_size):
+        chunk.append(obj)
+        if len(chunk) == chunk_size:
+            yield from serializer_class(chunk, many=True).data
+            chunk = []
+    if chunk:
+        yield from serializer_class(chunk, many=True).data
+
+
+def _ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps(row, cls=DjangoJSONEncoder) + '\n'
+
+
+def _csv_cell(value):
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, cls=DjangoJSONEncoder)
+    return '' if value is None else value
+
+
+def _csv_lines(rows):
+    writer = csv.writer(Echo())
+    header = None
+    for row in rows:
+        if header is None:
+            header = list(row.keys())
+            yield writer.writerow(header)
+        yield writer.writerow([_csv_cell(row.get(key)) for key in header])
+
+
+def sse_event(event, data):
+    """One server-sent event carrying ``data`` as JSON"""
+    return f'event: {event}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n'
+
+
+def sse_response(events):
+    response = StreamingHttpResponse(events, content_type='text/event-stream')
+    # Keep proxies from buffering or caching the stream
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def stream_export(queryset, serializer_class, export_format, filename='export', chunk_size=CHUNK_SIZE):
+    """Build a StreamingHttpResponse writing the queryset as NDJSON or CSV row by row"""
+    rows = serialized_rows(queryset, serializer_class, chunk_size=chunk_size)
+
+    if export_format == EXPORT_CSV:
+        response = StreamingHttpResponse(_csv_lines(rows), content_type='text/csv')
+        response['Content-Disposition'] = f'attachment; filename="{filename}.csv"'
+    else:
+        response = StreamingHttpResponse(_ndjson_lines(rows), content_type='application/x-ndjson')
+        response['Content-Disposition'] = f'attachment; filename="{filename}.ndjson"'
+
+    return response
@@ -1,3 +1,20 @@
 from django.contrib import admin
 
+from core.models import OcrResult, ReceiptJob, ReceiptTemplate
+
 # Register your models here.
+
+# Register ReceiptJob model
+@admin.register(ReceiptJob)
+class ReceiptJobAdmin(admin.ModelAdmin):
+    list_display = [field.name for field in ReceiptJob._meta.fields]
+
+# Register ReceiptTemplate model
+@admin.register(ReceiptTemplate)
+class ReceiptTemplateAdmin(admin.ModelAdmin):
+    list_display = [field.name for field in ReceiptTemplate._meta.fields]
+
+# Register OcrResult model
+@admin.register(OcrResult)
+class OcrResultAdmin(admin.ModelAdmin):
+    list_display = ['id', 'digest', 'engine', 'line_count', 'created_at']
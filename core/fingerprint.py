@@ -0,0 +1,76 @@
+"""Content fingerprints of receipt images.
+
+``sha256`` catches byte-identical re-uploads. ``dhash`` is a 64 bit difference hash of a
+9x8 grayscale thumbnail: re-encoded, resized or recompressed copies of a photo land within
+a few bits of each other. The hash is also split into ``PHASH_BANDS`` 16 bit bands stored
+in indexed columns, two hashes within ``PHASH_BANDS - 1`` bits always share at least one
+band exactly, so near matches are found with index lookups instead of a table scan.
+
+Decoding a full resolution photo for ``dhash`` is left to the worker, the upload request
+only hashes the bytes (``content_fingerprint``).
+"""
+import hashlib
+from collections import namedtuple
+from io import BytesIO
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+
+PHASH_BITS = 64
+PHASH_BANDS = 4
+BAND_BITS = PHASH_BITS // PHASH_BANDS
+
+Fingerprint = namedtuple('Fingerprint', ['sha256', 'phash', 'bands'])
+
+
+def dhash(image_bytes):
+    """Unsigned 64 bit difference hash, None when the bytes aren't a readable image"""
+    try:
+        with Image.open(BytesIO(image_bytes)) as image:
+            # Same photo taken sideways must hash the same
+            image = ImageOps.exif_transpose(image).convert('L').resize((9, 8), Image.Resampling.LANCZOS)
+            pixels = list(image.getdata())
+    except (UnidentifiedImageError, OSError, ValueError):
+        return None
+
+    value = 0
+    for row in range(8):
+        for column in range(8):
+            left, right = pixels[row * 9 + column], pixels[row * 9 + column + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+
+def bands(phash):
+    mask = (1 << BAND_BITS) - 1
+    return [(phash >> (BAND_BITS * band)) & mask for band in range(PHASH_BANDS)]
+
+
+def to_signed(phash):
+    """Fit an unsigned hash into a bigint column"""
+    return phash - (1 << PHASH_BITS) if phash >= 1 << (PHASH_BITS - 1) else phash
+
+
+def to_unsigned(phash):
+    return phash + (1 << PHASH_BITS) if phash < 0 else phash
+
+
+def distance(first, second):
+    return bin(to_unsigned(first) ^ to_unsigned(second)).count('1')
+
+
+def content_fingerprint(chunks):
+    """Fingerprint without the perceptual hash, from the bytes read in chunks"""
+    digest = hashlib.sha256()
+    for chunk in chunks:
+        digest.update(chunk)
+    return Fingerprint(digest.hexdigest(), None, None)
+
+
+def fingerprint(image_bytes):
+    phash = dhash(image_bytes)
+    return Fingerprint(
+        hashlib.sha256(image_bytes).hexdigest(),
+        None if phash is None else to_signed(phash),
+        None if phash is None else bands(phash),
+    )
@@ -0,0 +1,156 @@
+"""DB-backed queue of receipt processing jobs.
+
+Uploads only store the image and enqueue a ``ReceiptJob``. Workers started with
+``manage.py process_receipt_jobs`` claim due jobs with ``SELECT ... FOR UPDATE SKIP LOCKED``,
+so any number of them can share the table without a broker. A job runs its OCR stage and
+then its categorization stage, the stage is stored after each step so a retry resumes where
+the last attempt failed. Failed attempts are retried with exponential backoff up to
+``max_attempts``, jobs of a worker that died are put back on the queue after
+``RECEIPT_JOB_LOCK_TIMEOUT_SECONDS``.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from core import receipts
+from core.fingerprint import fingerprint
+from core.preprocessing import preprocess
+from core.models import ReceiptJob
+
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = getattr(settings, 'RECEIPT_JOB_MAX_ATTEMPTS', 3)
+RETRY_BASE_SECONDS = getattr(settings, 'RECEIPT_JOB_RETRY_BASE_SECONDS', 30)
+RETRY_MAX_SECONDS = getattr(settings, 'RECEIPT_JOB_RETRY_MAX_SECONDS', 60 * 30)
+LOCK_TIMEOUT = timedelta(seconds=getattr(settings, 'RECEIPT_JOB_LOCK_TIMEOUT_SECONDS', 60 * 10))
+
+
+def enqueue_receipt(receipt, user=None):
+    return ReceiptJob.objects.create(receipt=receipt, created_by=user, max_attempts=MAX_ATTEMPTS)
+
+
+def record_duplicate(receipt, user=None):
+    """Finished job for an upload answered from an earlier receipt, so polling works the same"""
+    return ReceiptJob.objects.create(
+        receipt=receipt,
+        created_by=user,
+        max_attempts=MAX_ATTEMPTS,
+        status=ReceiptJob.STATUS_SUCCEEDED,
+        stage=ReceiptJob.STAGE_DONE,
+        finished_at=timezone.now(),
+    )
+
+
+def retry_delay(attempts):
+    return timedelta(seconds=min(RETRY_BASE_SECONDS * 2 ** max(attempts - 1, 0), RETRY_MAX_SECONDS))
+
+
+def claim_jobs(worker, limit=1):
+    """Lock up to ``limit`` due jobs for ``worker``, jobs locked by other workers are skipped"""
+    now = timezone.now()
+    with transaction.atomic():
+        ids = list(
+            ReceiptJob.objects.select_for_update(skip_locked=True)
+            .filter(status=ReceiptJob.STATUS_QUEUED, run_after__lte=now)
+            .order_by('run_after', 'id')
+            .values_list('id', flat=True)[:limit]
+        )
+        if not ids:
+            return []
+        ReceiptJob.objects.filter(id__in=ids).update(
+            status=ReceiptJob.STATUS_RUNNING,
+            attempts=F('attempts') + 1,
+            locked_by=worker,
+            locked_at=now,
+            updated_at=now,
+        )
+    return list(ReceiptJob.objects.select_related('receipt').filter(id__in=ids).order_by('run_after', 'id'))
+
+
+def _run_stages(job):
+    receipt = job.receipt
+
+    if job.stage == ReceiptJob.STAGE_OCR:
+        image_bytes = receipts.read_image(receipt)
+        image_fingerprint = fingerprint(image_bytes)
+        receipt.set_fingerprint(image_fingerprint)
+        # The original may have finished while this upload was queued
+        original = receipts.find_duplicate(image_fingerprint, receipt.created_by_id, exclude_id=receipt.pk)
+        if original is not None:
+            receipts.reuse_extraction(receipt, original)
+            receipts.save_extraction(receipt)
+            job.stage = ReceiptJob.STAGE_DONE
+            return
+        response = receipts.detect_document(preprocess(image_bytes))
+        receipt.ocr_digest = receipts.store_ocr_result(response)
+        receipt.extracted_text = '\n'.join(receipts.response_lines(response))
+        receipt.save()
+        job.stage = ReceiptJob.STAGE_CATEGORIZATION
+        job.save(update_fields=['stage', 'updated_at'])
+
+    if job.stage == ReceiptJob.STAGE_CATEGORIZATION:
+        receipts.apply_extraction(receipt, receipts.categorize(receipt.extracted_text or ''))
+        receipts.save_extraction(receipt)
+        job.stage = ReceiptJob.STAGE_DONE
+
+
+def run_job(job):
+    """Run a claimed job to success, a scheduled retry or failure. Returns the job"""
+    try:
+        _run_stages(job)
+    except Exception as e:
+        logger.warning('Receipt job %s failed on attempt %s/%s: %s', job.id, job.attempts, job.max_attempts, e)
+        job.last_error = f'{type(e).__name__}: {e}'
+        if job.attempts >= job.max_attempts:
+            job.status = ReceiptJob.STATUS_FAILED
+            job.finished_at = timezone.now()
+        else:
+            job.status = ReceiptJob.STATUS_QUEUED
+            job.run_after = timezone.now() + retry_delay(job.attempts)
+    else:
+        job.status = ReceiptJob.STATUS_SUCCEEDED
+        job.last_error = None
+        job.finished_at = timezone.now()
+
+    job.locked_by = None
+    job.locked_at = None
+    job.save(update_fields=['status', 'stage', 'run_after', 'last_error', 'locked_by', 'locked_at', 'finished_at', 'updated_at'])
+    return job
+
+
+def requeue_stale(now=None):
+    """Release the jobs of workers that died mid-job, returns how many were released"""
+    now = now or timezone.now()
+    stale = ReceiptJob.objects.filter(status=ReceiptJob.STATUS_RUNNING, locked_at__lt=now - LOCK_TIMEOUT)
+    released = stale.filter(attempts__lt=F('max_attempts')).update(
+        status=ReceiptJob.STATUS_QUEUED, run_after=now, locked_by=None, locked_at=None, updated_at=now,
+    )
+    failed = stale.update(
+        status=ReceiptJob.STATUS_FAILED, last_error='Worker stopped responding', finished_at=now,
+        locked_by=None, locked_at=None, updated_at=now,
+    )
+    return released + failed
+
+
+def job_status(job):
+    """Polling payload of a job, with the extracted fields once it succeeded"""
+    data = {
+        'job_id': job.id,
+        'receipt_id': job.receipt_id,
+        'status': job.status,
+        'stage': job.stage,
+        'attempts': job.attempts,
+        'max_attempts': job.max_attempts,
+        'run_after': job.run_after,
+        'last_error': job.last_error,
+        'created_at': job.created_at,
+        'finished_at': job.finished_at,
+    }
+    if job.status == ReceiptJob.STATUS_SUCCEEDED:
+        data['result'] = job.receipt.extracted_data
+    return data
@@ -0,0 +1,133 @@
+"""Line items of extracted receipts.
+
+The categorization answer lists items and services as loosely shaped JSON (names,
+quantities and prices under varying keys, numbers as strings with currency signs).
+``line_items`` turns one receipt's lists into ``ReceiptItem`` rows, ``store_line_items``
+replaces a receipt's rows in one bulk insert and ``rebuild_line_items`` backfills receipts
+processed before the table existed. A user's re-upload of their own receipt gets no rows,
+its spend is already on the original.
+"""
+import re
+import unicodedata
+
+from django.db import transaction
+from django.utils import timezone
+
+from task.models import Receipt, ReceiptItem
+
+
+BULK_BATCH_SIZE = 500
+
+NAME_KEYS = ['name', 'item', 'item_name', 'product', 'product_name', 'description', 'service', 'service_name']
+QUANTITY_KEYS = ['quantity', 'qty', 'count', 'units']
+UNIT_PRICE_KEYS = ['unit_price', 'price_per_unit', 'price', 'unit_cost']
+TOTAL_KEYS = ['total_price', 'total', 'line_total', 'amount', 'total_cost', 'cost']
+CATEGORY_KEYS = ['category', 'type']
+
+# Sizes and pack counts don't make a different product for spend purposes
+UNIT_TOKENS = {'l', 'ltr', 'ml', 'cl', 'g', 'gr', 'kg', 'lb', 'oz', 'pc', 'pcs', 'pk', 'pack', 'x', 'ea'}
+SIZE_TOKEN = re.compile(r'^x?\d+([.,]\d+)?([a-z]{1,4})?$')
+
+
+def normalize_name(name):
+    name = unicodedata.normalize('NFKC', str(name or '')).casefold()
+    tokens = re.sub(r'[^\w]+', ' ', name).split()
+    return ' '.join(token for token in tokens if token not in UNIT_TOKENS and not SIZE_TOKEN.match(token))[:255]
+
+
+def to_number(value):
+    """Float from numbers or strings like "£1,20" or "2 x", None when there is none"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = re.search(r'-?\d+(?:[.,]\d+)?', str(value or ''))
+    return float(match.group().replace(',', '.')) if match else None
+
+
+def _first(item, keys):
+    for key in keys:
+        if item.get(key) not in (None, ''):
+            return item[key]
+    return None
+
+
+def purchase_day(receipt):
+    # The upload day stands in for an unreadable printed date
+    return timezone.localdate(receipt.purchased_at or receipt.uploaded_at or timezone.now())
+
+
+def line_items(receipt):
+    """Unsaved ``ReceiptItem`` rows for the items and services of an extracted receipt"""
+    rows = []
+    purchased_on = purchase_day(receipt)
+    shop_key = normalize_name(receipt.shop_name)
+    entries = [(ReceiptItem.KIND_ITEM, item) for item in receipt.items or []]
+    entries += [(ReceiptItem.KIND_SERVICE, service) for service in receipt.services or []]
+
+    for position, (kind, item) in enumerate(entries):
+        if not isinstance(item, dict):
+            item = {'name': item}
+        name = str(_first(item, NAME_KEYS) or '').strip()
+        if not name:
+            continue
+
+        quantity = to_number(_first(item, QUANTITY_KEYS))
+        quantity = quantity if quantity and quantity > 0 else 1
+        unit_price = to_number(_first(item, UNIT_PRICE_KEYS))
+        line_total = to_number(_first(item, TOTAL_KEYS))
+        if line_total is None and unit_price is not None:
+            line_total = round(unit_price * quantity, 2)
+        elif unit_price is None and line_total is not None:
+            unit_price = round(line_total / quantity, 2)
+
+        category = _first(item, CATEGORY_KEYS)
+        rows.append(ReceiptItem(
+            receipt_id=receipt.id,
+            kind=kind,
+            position=position,
+            product_name=name[:255],
+            product_key=normalize_name(name) or name.casefold()[:255],
+            category=str(category).strip().casefold()[:100] if category else None,
+            quantity=quantity,
+            unit_price=unit_price,
+            line_total=line_total,
+            shop_name=receipt.shop_name,
+            shop_key=shop_key,
+            purchased_on=purchased_on,
+            created_by_id=receipt.created_by_id,
+        ))
+    return rows
+
+
+def store_line_items(receipt):
+    """Replace the line items of a saved receipt, returns how many were written"""
+    duplicate = receipt.duplicate_of_id is not None and Receipt.objects.own_duplicates().filter(pk=receipt.pk).exists()
+    rows = [] if duplicate else line_items(receipt)
+    with transaction.atomic():
+        ReceiptItem.objects.filter(receipt_id=receipt.id).delete()
+        ReceiptItem.objects.bulk_create(rows, batch_size=BULK_BATCH_SIZE)
+    return len(rows)
+
+
+def rebuild_line_items(receipts=None, chunk_size=BULK_BATCH_SIZE):
+    """Recreate the line items of processed receipts chunk by chunk, returns ``(receipts, items)``"""
+    receipts = (receipts if receipts is not None else Receipt.objects.all()).processed()
+    receipts = receipts.only('id', 'shop_name', 'items', 'services', 'purchased_at', 'uploaded_at', 'created_by_id').order_by('id')
+
+    receipt_count = item_count = 0
+    last_id = 0
+    while True:
+        chunk = list(receipts.filter(id__gt=last_id)[:chunk_size])
+        if not chunk:
+            break
+        ids = [receipt.id for receipt in chunk]
+        duplicates = set(Receipt.objects.own_duplicates().filter(id__in=ids).values_list('id', flat=True))
+        rows = [row for receipt in chunk if receipt.id not in duplicates for row in line_items(receipt)]
+        with transaction.atomic():
+            ReceiptItem.objects.filter(receipt_id__in=ids).delete()
+            ReceiptItem.objects.bulk_create(rows, batch_size=BULK_BATCH_SIZE)
+        last_id = chunk[-1].id
+        receipt_count += len(chunk)
+        item_count += len(rows)
+    return receipt_count, item_count
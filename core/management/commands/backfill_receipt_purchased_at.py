@@ -0,0 +1,48 @@
+from itertools import groupby
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from core.purchase_dates import parse_purchased_at
+from task.models import Receipt, ReceiptItem
+
+
+class Command(BaseCommand):
+    help = "Parse purchased_at from the date and time text of receipts that don't have it yet"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help="Receipts read and updated per transaction")
+        parser.add_argument('--dry-run', action='store_true', help="Only report how many receipts would be updated")
+
+    def handle(self, *args, **options):
+        receipts = Receipt.objects.filter(purchased_at__isnull=True, date__isnull=False).exclude(date='')
+        receipts = receipts.only('id', 'date', 'time').order_by('id')
+
+        last_id = scanned = updated = 0
+        while True:
+            chunk = list(receipts.filter(id__gt=last_id)[:options['chunk_size']])
+            if not chunk:
+                break
+            last_id = chunk[-1].id
+            scanned += len(chunk)
+
+            parsed = []
+            for receipt in chunk:
+                receipt.purchased_at = parse_purchased_at(receipt.date, receipt.time)
+                if receipt.purchased_at is not None:
+                    parsed.append(receipt)
+            updated += len(parsed)
+
+            if parsed and not options['dry_run']:
+                by_day = sorted((timezone.localdate(receipt.purchased_at), receipt.id) for receipt in parsed)
+                with transaction.atomic():
+                    Receipt.objects.bulk_update(parsed, ['purchased_at'])
+                    # Line items were dated by upload day so far
+                    for day, rows in groupby(by_day, key=lambda row: row[0]):
+                        ReceiptItem.objects.filter(receipt_id__in=[row[1] for row in rows]).update(purchased_on=day)
+
+            self.stdout.write(f"Scanned {scanned} receipt(s), {updated} with a readable date")
+
+        action = "Would update" if options['dry_run'] else "Updated"
+        self.stdout.write(self.style.SUCCESS(f"{action} {updated} of {scanned} receipt(s)"))
@@ -0,0 +1,102 @@
+import random
+import time
+from io import BytesIO
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+from PIL import Image, ImageDraw, ImageFont
+
+from core.preprocessing import preprocess
+from core.receipts import extract_text
+
+
+IMAGE_SUFFIXES = {'.jpg', '.jpeg', '.png', '.webp', '.heic', '.tif', '.tiff'}
+
+
+def synthetic_receipt(seed):
+    """Phone-photo-like receipt: 12 MP colour JPEG, slightly rotated, on a dark table"""
+    rng = random.Random(seed)
+    font = ImageFont.load_default(size=28)
+    lines = ['SUPERSTORE LTD', '12 HIGH STREET', f'{rng.randint(1, 28):02d}-07-2025 {rng.randint(8, 21):02d}:{rng.randint(0, 59):02d}', '']
+    total = 0
+    for number in range(rng.randint(8, 30)):
+        price = rng.randint(50, 2000) / 100
+        total += price
+        lines.append(f'ITEM {number + 1:<3} {"x" * rng.randint(4, 14):<16} {price:>7.2f}')
+    lines += ['', f'TOTAL {total:>26.2f}', 'CARD PAYMENT', 'THANK YOU']
+
+    paper = Image.new('RGB', (640, 40 * len(lines) + 80), (246, 242, 232))
+    draw = ImageDraw.Draw(paper)
+    for row, line in enumerate(lines):
+        draw.text((30, 40 + 40 * row), line, fill=(30, 30, 30), font=font)
+
+    paper = paper.resize((paper.width * 3, paper.height * 3), Image.Resampling.BICUBIC)
+    paper = paper.rotate(rng.uniform(-4, 4), resample=Image.Resampling.BICUBIC, expand=True, fillcolor=(70, 55, 45))
+    photo = Image.new('RGB', (3024, 4032), (70, 55, 45))
+    paper.thumbnail((2600, 3800))
+    photo.paste(paper, ((photo.width - paper.width) // 2, (photo.height - paper.height) // 2))
+
+    buffer = BytesIO()
+    photo.save(buffer, format='JPEG', quality=92)
+    return buffer.getvalue()
+
+
+class Command(BaseCommand):
+    help = "Compare OCR payload size (and with --ocr, Textract latency and output) with and without preprocessing"
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='*', help="Receipt images or directories of them")
+        parser.add_argument('--synthetic', type=int, default=0, help="Also benchmark this many generated receipt photos")
+        parser.add_argument('--ocr', action='store_true', help="Send both versions to Textract")
+
+    def samples(self, options):
+        for path in map(Path, options['paths']):
+            files = sorted(path.iterdir()) if path.is_dir() else [path]
+            for file in files:
+                if file.suffix.lower() in IMAGE_SUFFIXES:
+                    yield file.name, file.read_bytes()
+        for seed in range(options['synthetic']):
+            yield f'synthetic-{seed}', synthetic_receipt(seed)
+
+    def ocr(self, image_bytes):
+        started = time.perf_counter()
+        lines = extract_text(image_bytes).splitlines()
+        return (time.perf_counter() - started) * 1000, lines
+
+    def handle(self, *args, **options):
+        totals = dict.fromkeys(['original', 'processed', 'preprocess_ms', 'ocr_ms', 'processed_ocr_ms'], 0)
+        count = 0
+
+        for name, original in self.samples(options):
+            started = time.perf_counter()
+            processed = preprocess(original)
+            preprocess_ms = (time.perf_counter() - started) * 1000
+
+            count += 1
+            totals['original'] += len(original)
+            totals['processed'] += len(processed)
+            totals['preprocess_ms'] += preprocess_ms
+            row = f"{name}: {len(original) / 1024:.0f} KB -> {len(processed) / 1024:.0f} KB in {preprocess_ms:.0f} ms"
+
+            if options['ocr']:
+                ocr_ms, lines = self.ocr(original)
+                processed_ocr_ms, processed_lines = self.ocr(processed)
+                totals['ocr_ms'] += ocr_ms
+                totals['processed_ocr_ms'] += processed_ocr_ms
+                # Share of the original OCR lines read identically from the processed image
+                kept = len(set(lines) & set(processed_lines)) / len(set(lines)) if lines else 1
+                row += f", OCR {ocr_ms:.0f} ms -> {processed_ocr_ms:.0f} ms, {kept:.0%} of lines identical"
+
+            self.stdout.write(row)
+
+        if not count:
+            self.stdout.write("No images, pass paths or --synthetic N")
+            return
+
+        summary = (
+            f"{count} receipt(s): payload {totals['original'] / 1024 / count:.0f} KB -> {totals['processed'] / 1024 / count:.0f} KB "
+            f"on average ({1 - totals['processed'] / totals['original']:.0%} smaller), preprocessing {totals['preprocess_ms'] / count:.0f} ms"
+        )
+        if options['ocr']:
+            summary += f", OCR {totals['ocr_ms'] / count:.0f} ms -> {totals['processed_ocr_ms'] / count:.0f} ms"
+        self.stdout.write(self.style.SUCCESS(summary))
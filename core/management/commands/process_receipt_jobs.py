@@ -0,0 +1,53 @@
+import os
+import socket
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from core.jobs import claim_jobs, requeue_stale, run_job
+
+
+class Command(BaseCommand):
+    help = "Run OCR and categorization of uploaded receipts from the job table, runs until stopped"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2, help="Number of worker threads")
+        parser.add_argument('--interval', type=float, default=2, help="Sleep of an idle worker between polls, in seconds")
+        parser.add_argument('--once', action='store_true', help="Drain the due jobs and exit")
+
+    def handle(self, *args, **options):
+        prefix = f'{socket.gethostname()}:{os.getpid()}'
+        released = requeue_stale()
+        if released:
+            self.stdout.write(f"Released {released} stale job(s)")
+
+        threads = [
+            threading.Thread(target=self.work, args=(f'{prefix}:{number}', options), daemon=True)
+            for number in range(max(options['workers'], 1))
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            while any(thread.is_alive() for thread in threads):
+                time.sleep(options['interval'])
+                if not options['once']:
+                    requeue_stale()
+        except KeyboardInterrupt:
+            self.stdout.write("Stopping, running jobs are released after the lock timeout")
+
+    def work(self, worker, options):
+        try:
+            while True:
+                close_old_connections()
+                jobs = claim_jobs(worker)
+                for job in jobs:
+                    job = run_job(job)
+                    self.stdout.write(f"[{worker}] Receipt job {job.id}: {job.status} ({job.stage})")
+                if not jobs:
+                    if options['once']:
+                        break
+                    time.sleep(options['interval'])
+        finally:
+            connection.close()
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from core.line_items import rebuild_line_items
+from task.models import Receipt
+
+
+class Command(BaseCommand):
+    help = "Recreate receipt line items from the extracted items and services of processed receipts"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, help="Only rebuild the receipts of this user id")
+        parser.add_argument('--chunk-size', type=int, default=500, help="Receipts per bulk insert")
+
+    def handle(self, *args, **options):
+        receipts = Receipt.objects.all()
+        if options['user']:
+            receipts = receipts.filter(created_by_id=options['user'])
+
+        receipt_count, item_count = rebuild_line_items(receipts, chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {item_count} line item(s) of {receipt_count} receipt(s)"))
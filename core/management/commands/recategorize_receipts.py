@@ -0,0 +1,91 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from core.models import ReceiptJob
+from core.receipts import recategorize
+from task.models import Receipt
+
+
+class Command(BaseCommand):
+    help = "Re-run categorization of receipts on their stored OCR output, without calling Textract"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ids', type=int, nargs='+', help="Receipt ids")
+        parser.add_argument('--user', type=int, help="Only receipts of this user id")
+        parser.add_argument('--failed', action='store_true', help="Only receipts with OCR output but no categorization or a failed job")
+        parser.add_argument('--since', help="Only receipts uploaded on or after this date (YYYY-MM-DD)")
+        parser.add_argument('--limit', type=int, help="Stop after this many receipts")
+        parser.add_argument('--workers', type=int, default=4, help="Receipts categorized concurrently")
+        parser.add_argument('--fresh', action='store_true', help="Ask GPT again instead of using templates and cached answers")
+        parser.add_argument('--progress', type=int, default=25, help="Report progress every this many receipts")
+        parser.add_argument('--dry-run', action='store_true', help="Only report how many receipts would be re-categorized")
+
+    def receipts(self, options):
+        receipts = Receipt.objects.filter(Q(ocr_digest__isnull=False) | (Q(extracted_text__isnull=False) & ~Q(extracted_text='')))
+        if options['ids']:
+            receipts = receipts.filter(id__in=options['ids'])
+        if options['user']:
+            receipts = receipts.filter(created_by_id=options['user'])
+        if options['since']:
+            try:
+                since = datetime.strptime(options['since'], '%Y-%m-%d')
+            except ValueError:
+                raise CommandError("--since must be a date as YYYY-MM-DD")
+            receipts = receipts.filter(uploaded_at__gte=timezone.make_aware(since))
+        if options['failed']:
+            failed_jobs = ReceiptJob.objects.filter(receipt_id=OuterRef('pk'), status=ReceiptJob.STATUS_FAILED)
+            receipts = receipts.filter(Q(extracted_data__isnull=True) | Exists(failed_jobs))
+        receipts = receipts.order_by('id').values_list('id', flat=True)
+        return receipts[:options['limit']] if options['limit'] else receipts
+
+    def recategorize(self, receipt_id, fresh):
+        close_old_connections()
+        try:
+            recategorize(Receipt.objects.get(pk=receipt_id), fresh=fresh)
+        finally:
+            connection.close()
+
+    def handle(self, *args, **options):
+        receipt_ids = list(self.receipts(options))
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f"Would re-categorize {len(receipt_ids)} receipt(s)"))
+            return
+
+        total = len(receipt_ids)
+        workers = max(options['workers'], 1)
+        done = failed = 0
+        started = time.monotonic()
+        pending = {}
+        ids = iter(receipt_ids)
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            while True:
+                # At most two receipts per worker in flight, the id list itself can be long
+                for receipt_id in ids:
+                    pending[executor.submit(self.recategorize, receipt_id, options['fresh'])] = receipt_id
+                    if len(pending) >= 2 * workers:
+                        break
+                if not pending:
+                    break
+
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    receipt_id = pending.pop(future)
+                    done += 1
+                    error = future.exception()
+                    if error is not None:
+                        failed += 1
+                        self.stderr.write(f"Receipt {receipt_id}: {type(error).__name__}: {error}")
+                    if done % max(options['progress'], 1) == 0 or done == total:
+                        elapsed = time.monotonic() - started
+                        self.stdout.write(f"{done}/{total} receipt(s), {failed} failed, {done / max(elapsed, 0.001):.1f}/s")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Re-categorized {done - failed} of {total} receipt(s), {failed} failed in {time.monotonic() - started:.0f} s"
+        ))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from commons.fake_servers import FakeDependencyServer
+
+
+class Command(BaseCommand):
+    help = "Serve fake Textract and OpenAI endpoints with injected latency and errors, for local load drills"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--latency', type=float, default=0.5, help="Seconds before every answer")
+        parser.add_argument('--jitter', type=float, default=0, help="Up to this many seconds added at random")
+        parser.add_argument('--error-rate', type=float, default=0, help="Share of requests answered with a 500")
+
+    def handle(self, *args, **options):
+        server = FakeDependencyServer(
+            port=options['port'], latency=options['latency'], jitter=options['jitter'], error_rate=options['error_rate'], verbose=True,
+        )
+        self.stdout.write(
+            f"Serving on {server.url}, set TEXTRACT_ENDPOINT_URL={server.url} and OPENAI_BASE_URL={server.url}/v1, Ctrl+C to stop"
+        )
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
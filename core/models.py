@@ -1,3 +1,101 @@
+from django.conf import settings
 from django.db import models
+from django.db.models import Q
+from django.utils import timezone
+
+from commons.custom_model_field import CompressedJSONField
 
 # Create your models here.
+
+
+class ReceiptJob(models.Model):
+    """Background OCR and categorization of one uploaded receipt, processed by process_receipt_jobs"""
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_SUCCEEDED = 'succeeded'
+    STATUS_FAILED = 'failed'
+
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_SUCCEEDED, 'Succeeded'),
+        (STATUS_FAILED, 'Failed')
+    ]
+
+    STAGE_OCR = 'ocr'
+    STAGE_CATEGORIZATION = 'categorization'
+    STAGE_DONE = 'done'
+
+    STAGE_CHOICES = [
+        (STAGE_OCR, 'Text extraction'),
+        (STAGE_CATEGORIZATION, 'Categorization'),
+        (STAGE_DONE, 'Done')
+    ]
+
+    receipt = models.ForeignKey('task.Receipt', on_delete=models.CASCADE, related_name='jobs')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    stage = models.CharField(max_length=20, choices=STAGE_CHOICES, default=STAGE_OCR)
+
+    # Retries
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now)  # Pushed back after a failed attempt
+    last_error = models.TextField(blank=True, null=True)
+
+    # Worker holding the job while it runs
+    locked_by = models.CharField(max_length=100, blank=True, null=True)
+    locked_at = models.DateTimeField(blank=True, null=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete= models.SET_NULL, related_name="+", null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            # Workers claim the oldest due job
+            models.Index(fields=['run_after', 'id'], condition=Q(status='queued'), name='receipt_job_queue_idx'),
+            # Jobs of crashed workers are found by their lock age
+            models.Index(fields=['locked_at'], condition=Q(status='running'), name='receipt_job_running_idx'),
+        ]
+
+    def __str__(self):
+        return f"Receipt job {self.id} - {self.status} ({self.stage})"
+
+
+class ReceiptTemplate(models.Model):
+    """Layout of one shop's receipts, learned from LLM parses, see core/receipt_templates.py"""
+    header_key = models.CharField(max_length=255, unique=True)  # Normalized header line naming the shop
+    shop_name = models.CharField(max_length=255)
+    rules = models.JSONField(default=dict)  # Labels of the total, subtotal, VAT, discount and payment lines
+
+    samples = models.PositiveIntegerField(default=0)  # LLM parses the template reproduced
+    hits = models.PositiveIntegerField(default=0)  # Receipts parsed without the LLM
+    fallbacks = models.PositiveIntegerField(default=0)  # Matches parsed with too little confidence
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Receipt template {self.shop_name} ({self.samples} samples, {self.hits} hits)"
+
+
+class OcrResult(models.Model):
+    """Full OCR response of a receipt image, stored once per distinct content.
+
+    Receipts point at it through ``Receipt.ocr_digest``, so they can be re-parsed without
+    another Textract call.
+    """
+    digest = models.CharField(max_length=64, unique=True)  # SHA-256 of the canonical JSON response
+    engine = models.CharField(max_length=20, default='textract')
+    response = CompressedJSONField()  # zlib-compressed, Blocks with geometry and confidence
+    line_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"OCR result {self.digest[:12]} ({self.line_count} lines)"
+
+    def text(self):
+        return '\n'.join(block['Text'] for block in self.response.get('Blocks', []) if block.get('BlockType') == 'LINE')
@@ -0,0 +1,99 @@
+"""In-memory clean-up of receipt photos before OCR.
+
+Phone photos are several megabytes of colour pixels, most of them table or background.
+``preprocess`` applies the EXIF orientation, converts to grayscale, crops to the paper,
+straightens small rotations, stretches the contrast and scales the receipt down to
+``RECEIPT_OCR_MAX_WIDTH`` pixels wide, a width at which a 40 character receipt line still
+has glyphs well above Textract's minimum text height. The result is re-encoded as a
+grayscale JPEG, all in memory. ``manage.py benchmark_receipt_preprocessing`` reports the
+payload and OCR latency gains on sample receipts.
+"""
+from io import BytesIO
+
+from django.conf import settings
+from PIL import Image, ImageFilter, ImageOps
+
+MAX_WIDTH = getattr(settings, 'RECEIPT_OCR_MAX_WIDTH', 1000)
+MAX_HEIGHT = 10000  # Textract limit
+JPEG_QUALITY = getattr(settings, 'RECEIPT_OCR_JPEG_QUALITY', 80)
+MAX_SKEW_DEGREES = 5
+
+ANALYSIS_SIZE = 400  # Crop and skew are measured on a thumbnail this size
+PAPER_LEVEL = 150  # Thumbnail pixels brighter than this count as paper after autocontrast
+INK_LEVEL = 110
+SKEW_INSET = 0.08
+MIN_CROP_AREA = 0.2  # Smaller paper boxes are taken for noise and not cropped to
+
+
+def _thumbnail(image):
+    thumbnail = image.copy()
+    thumbnail.thumbnail((ANALYSIS_SIZE, ANALYSIS_SIZE))
+    return thumbnail
+
+
+def paper_box(gray):
+    """Bounding box of the bright paper in full image coordinates, None to keep everything"""
+    thumbnail = ImageOps.autocontrast(_thumbnail(gray), cutoff=1).filter(ImageFilter.MedianFilter(5))
+    box = thumbnail.point(lambda value: 255 if value > PAPER_LEVEL else 0).getbbox()
+    if box is None:
+        return None
+
+    left, top, right, bottom = box
+    if (right - left) * (bottom - top) < MIN_CROP_AREA * thumbnail.width * thumbnail.height:
+        return None
+    scale = gray.width / thumbnail.width
+    margin = 0.01 * max(gray.size)
+    return (
+        max(int(left * scale - margin), 0),
+        max(int(top * scale - margin), 0),
+        min(int(right * scale + margin), gray.width),
+        min(int(bottom * scale + margin), gray.height),
+    )
+
+
+def skew_angle(gray):
+    """Rotation in degrees that levels the text lines, found by maximizing row profile contrast"""
+    thumbnail = ImageOps.autocontrast(_thumbnail(gray), cutoff=1)
+    # Leave out the edges, background left around tilted paper would dominate the profile
+    inset_x, inset_y = int(thumbnail.width * SKEW_INSET), int(thumbnail.height * SKEW_INSET)
+    thumbnail = thumbnail.crop((inset_x, inset_y, thumbnail.width - inset_x, thumbnail.height - inset_y))
+    ink = thumbnail.point(lambda value: 255 if value < INK_LEVEL else 0)
+
+    best_angle, best_score = 0.0, -1
+    for step in range(-2 * MAX_SKEW_DEGREES, 2 * MAX_SKEW_DEGREES + 1):
+        angle = step / 2
+        rotated = ink.rotate(angle, resample=Image.Resampling.BILINEAR, fillcolor=0)
+        # Mean ink per row, aligned lines give sharp steps between text and gaps
+        rows = list(rotated.resize((1, rotated.height), Image.Resampling.BOX).getdata())
+        score = sum((below - above) ** 2 for above, below in zip(rows, rows[1:]))
+        if score > best_score:
+            best_angle, best_score = angle, score
+    return best_angle
+
+
+def preprocess(image_bytes):
+    """Compact grayscale JPEG for OCR, or ``image_bytes`` unchanged if it isn't smaller or can't be read"""
+    try:
+        with Image.open(BytesIO(image_bytes)) as image:
+            gray = ImageOps.exif_transpose(image).convert('L')
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return image_bytes
+
+    # Work at no more than twice the output width, the rest only costs time
+    gray.thumbnail((2 * MAX_WIDTH, 2 * MAX_HEIGHT), Image.Resampling.BILINEAR)
+
+    box = paper_box(gray)
+    if box is not None:
+        gray = gray.crop(box)
+
+    angle = skew_angle(gray)
+    if angle:
+        gray = gray.rotate(angle, resample=Image.Resampling.BICUBIC, expand=True, fillcolor=255)
+
+    gray = ImageOps.autocontrast(gray, cutoff=1)
+    gray.thumbnail((MAX_WIDTH, MAX_HEIGHT), Image.Resampling.LANCZOS)
+
+    buffer = BytesIO()
+    gray.save(buffer, format='JPEG', quality=JPEG_QUALITY, optimize=True)
+    processed = buffer.getvalue()
+    return processed if len(processed) < len(image_bytes) else image_bytes
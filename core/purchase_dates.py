@@ -0,0 +1,52 @@
+"""Purchase timestamps from the free-text date and time printed on receipts.
+
+Day-first formats are tried before month-first ones, receipts here are mostly European.
+Dates before 2000 or in the future are taken for OCR misreads and dropped.
+"""
+from datetime import datetime, time, timedelta
+
+from django.utils import timezone
+
+
+DATE_FORMATS = [
+    '%d-%m-%Y', '%d/%m/%Y', '%d.%m.%Y', '%Y-%m-%d', '%Y/%m/%d', '%Y.%m.%d',
+    '%d-%m-%y', '%d/%m/%y', '%d.%m.%y',
+    '%d %b %Y', '%d %B %Y', '%b %d, %Y', '%B %d, %Y', '%b %d %Y', '%B %d %Y',
+    '%m/%d/%Y', '%m-%d-%Y',
+]
+TIME_FORMATS = ['%H:%M', '%H:%M:%S', '%I:%M %p', '%I:%M%p', '%I:%M:%S %p', '%H.%M']
+
+MIN_YEAR = 2000
+
+
+def _parse(value, formats):
+    value = ' '.join(str(value or '').replace(',', ', ').split()).replace(' ,', ',')
+    for fmt in formats:
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+    return None
+
+
+def parse_purchase_date(value):
+    parsed = _parse(value, DATE_FORMATS)
+    if parsed is None:
+        return None
+    day = parsed.date()
+    if day.year < MIN_YEAR or day > timezone.localdate() + timedelta(days=1):
+        return None
+    return day
+
+
+def parse_purchase_time(value):
+    parsed = _parse(value, TIME_FORMATS)
+    return parsed.time() if parsed else None
+
+
+def parse_purchased_at(date_value, time_value=None):
+    """Aware datetime in the current timezone, midnight when the time is missing, None without a date"""
+    day = parse_purchase_date(date_value)
+    if day is None:
+        return None
+    return timezone.make_aware(datetime.combine(day, parse_purchase_time(time_value) or time.min))
@@ -0,0 +1,298 @@
+"""Deterministic receipt parsing from learned per-shop templates.
+
+Chain stores print the same layout on every receipt: the shop name in the header, one
+line per item ending in its price, then subtotal, VAT and total lines with fixed labels.
+After a successful LLM parse, ``learn_template`` finds which OCR lines carried the total,
+subtotal, VAT, discount and payment method and stores their labels under the header line
+naming the shop, along with the LLM's category of each item name (matched to the OCR item
+lines by name, else by price). The template is only counted when parsing the same text with
+it gives the LLM's answer back.
+
+``template_parse`` looks the header lines of new OCR text up among templates with at least
+``RECEIPT_TEMPLATE_MIN_SAMPLES`` samples and parses with the stored labels. The result is
+used only when the item prices add up to the subtotal or total (``confidence``) and at least
+``RECEIPT_TEMPLATE_MIN_CATEGORIZED`` of the items have a learned category, anything less
+goes to the LLM, whose answer then teaches the template the new items.
+"""
+import re
+
+from django.conf import settings
+from django.db.models import F
+
+from core.line_items import normalize_name, to_number
+from core.models import ReceiptTemplate
+from core.purchase_dates import parse_purchase_date, parse_purchase_time
+
+
+MIN_SAMPLES = getattr(settings, 'RECEIPT_TEMPLATE_MIN_SAMPLES', 2)
+MIN_CONFIDENCE = getattr(settings, 'RECEIPT_TEMPLATE_MIN_CONFIDENCE', 0.8)
+# Share of items that need a known category, spend by category has no other source for them
+MIN_CATEGORIZED = getattr(settings, 'RECEIPT_TEMPLATE_MIN_CATEGORIZED', 1.0)
+HEADER_LINES = 6  # The shop name is looked for this far down
+MAX_LABELS = 5  # Labels kept per field
+MAX_CATEGORIES = 1000  # Item names kept per template, the most recently learned win
+TOLERANCE = 0.02
+
+AMOUNT = r'-?[£$€]?\s?\d{1,6}[.,]\d{2}'
+AMOUNT_RE = re.compile(AMOUNT)
+ITEM_RE = re.compile(
+    r'^(?P<name>.*?[^\W\d_].*?)\s+'
+    r'(?:(?P<quantity>\d{1,3})\s*[x@*]\s*(?:(?P<unit>' + AMOUNT + r')\s+)?)?'
+    r'(?P<total>' + AMOUNT + r')(?:\s+[A-Z*]{1,2})?$',
+    re.IGNORECASE,
+)
+DATE_RE = re.compile(r'\b(\d{1,2}[-/.]\d{1,2}[-/.]\d{2,4}|\d{4}-\d{2}-\d{2})\b')
+TIME_RE = re.compile(r'\b(\d{1,2}:\d{2}(?::\d{2})?(?:\s?[ap]m)?)\b', re.IGNORECASE)
+
+AMOUNT_FIELDS = ['subtotal', 'vat_amount', 'discount', 'total_cost']  # Learning order, "sub total" isn't the total
+# Word starts that name the line of a field, used when learning
+FIELD_WORDS = {
+    'total_cost': ('total', 'balance', 'due', 'amount', 'pay'),
+    'subtotal': ('sub',),
+    'vat_amount': ('vat', 'tax', 'gst'),
+    'discount': ('discount', 'saving', 'off', 'promo'),
+}
+# Lines after the items that never are items even without a learned label
+STOP_WORDS = ('change', 'cash', 'card', 'tender', 'visa', 'mastercard', 'rounding')
+
+
+def normalize_label(text):
+    text = AMOUNT_RE.sub(' ', str(text or '').casefold())
+    return ' '.join(re.sub(r'[^a-z]+', ' ', text).split())
+
+
+def normalize_header(line):
+    return ' '.join(re.sub(r'[^\w]+', ' ', str(line or '').casefold()).split())[:255]
+
+
+def to_amount(text):
+    return float(re.sub(r'[^\d.,-]', '', text).replace(',', '.'))
+
+
+def amounts(line):
+    return [to_amount(match) for match in AMOUNT_RE.findall(line)]
+
+
+def same_amount(first, second):
+    return first is not None and second is not None and abs(first - second) <= TOLERANCE
+
+
+def ocr_lines(text):
+    return [line.strip() for line in str(text or '').splitlines() if line.strip()]
+
+
+def header_keys(lines):
+    return [normalize_header(line) for line in lines[:HEADER_LINES] if normalize_header(line)]
+
+
+# Parsing
+
+def parse_with_rules(lines, rules):
+    """Structured receipt fields from OCR lines and a template's rules, plus a confidence in [0, 1]"""
+    labels = {field: set(rules.get(field, [])) for field in AMOUNT_FIELDS}
+    known_labels = set().union(*labels.values())
+    categories = rules.get('categories', {})
+    values = dict.fromkeys(AMOUNT_FIELDS)
+    items = []
+    items_done = False
+
+    for index, line in enumerate(lines[1:], start=1):
+        label = normalize_label(line)
+        line_amounts = amounts(line)
+        field = next((field for field in AMOUNT_FIELDS if label in labels[field]), None)
+        if field is not None and line_amounts:
+            # The first total line wins, later ones repeat it on the payment slip
+            if values[field] is None:
+                values[field] = abs(line_amounts[-1])
+            items_done = items_done or field in ('subtotal', 'total_cost')
+            continue
+        if items_done or label in known_labels or any(word in label.split() for word in STOP_WORDS):
+            continue
+
+        match = ITEM_RE.match(line)
+        if match and index >= rules.get('items_after', 1):
+            quantity = int(match.group('quantity') or 1) or 1
+            total = to_amount(match.group('total'))
+            unit = to_amount(match.group('unit')) if match.group('unit') else round(total / quantity, 2)
+            name = match.group('name').strip()
+            items.append({
+                'name': name, 'quantity': quantity, 'unit_price': unit, 'total_price': total,
+                'category': categories.get(normalize_name(name)),
+            })
+
+    date = time = None
+    for line in lines:
+        date = date or next((value for value in DATE_RE.findall(line) if parse_purchase_date(value)), None)
+        time = time or next((value for value in TIME_RE.findall(line) if parse_purchase_time(value)), None)
+
+    payment_method = None
+    for label, method in rules.get('payment', []):
+        if any(label in normalize_label(line) for line in lines):
+            payment_method = method
+            break
+
+    structured = {
+        'date': date,
+        'time': time,
+        'shop_name': rules.get('shop_name'),
+        'address': rules.get('address'),
+        'payment_method': payment_method,
+        'items': items,
+        'services': [],
+        'vat_percentage': rules.get('vat_percentage'),
+        'vat_amount': values['vat_amount'],
+        'subtotal': values['subtotal'],
+        'tax': values['vat_amount'],
+        'discount': values['discount'] or 0.0,
+        'total_cost': values['total_cost'],
+    }
+    return structured, confidence(structured)
+
+
+def confidence(structured):
+    """0 without a total, otherwise mostly decided by the items adding up"""
+    total = structured['total_cost']
+    if total is None:
+        return 0.0
+
+    score = 0.3
+    item_sum = round(sum(item['total_price'] for item in structured['items']), 2)
+    discount = structured['discount'] or 0
+    targets = [value for value in (structured['subtotal'], total) if value is not None]
+    if structured['items'] and any(same_amount(item_sum - discount, target) or same_amount(item_sum, target) for target in targets):
+        score += 0.5
+    if structured['date']:
+        score += 0.1
+    subtotal, vat = structured['subtotal'], structured['vat_amount'] or 0
+    if subtotal is None or same_amount(subtotal, total) or same_amount(subtotal + vat, total) or same_amount(subtotal - discount, total):
+        score += 0.05
+    if structured['payment_method']:
+        score += 0.05
+    return round(score, 2)
+
+
+def categorized_share(items):
+    return sum(1 for item in items if item['category']) / len(items) if items else 1.0
+
+
+def find_template(lines):
+    keys = header_keys(lines)
+    templates = {template.header_key: template for template in ReceiptTemplate.objects.filter(header_key__in=keys, samples__gte=MIN_SAMPLES)}
+    return next((templates[key] for key in keys if key in templates), None)
+
+
+def template_parse(text):
+    """Structured fields of ``text`` from a learned template, None when the LLM is needed"""
+    lines = ocr_lines(text)
+    template = find_template(lines)
+    if template is None:
+        return None
+
+    structured, score = parse_with_rules(lines, template.rules)
+    usable = score >= MIN_CONFIDENCE and categorized_share(structured['items']) >= MIN_CATEGORIZED
+    counter = 'hits' if usable else 'fallbacks'
+    ReceiptTemplate.objects.filter(pk=template.pk).update(**{counter: F(counter) + 1})
+    return structured if usable else None
+
+
+# Learning
+
+def _field_label(lines, value, words, taken):
+    """Label of the line printing ``value``, preferring lines that say what they are"""
+    if value in (None, '', 0):
+        return None
+    try:
+        value = abs(float(value))
+    except (TypeError, ValueError):
+        return None
+    candidates = [normalize_label(line) for line in lines if any(same_amount(abs(amount), value) for amount in amounts(line))]
+    candidates = [label for label in candidates if label and label not in taken]
+    named = [label for label in candidates if any(part.startswith(word) for part in label.split() for word in words)]
+    return (named or candidates or [None])[0]
+
+
+def item_categories(parsed_items, answer_items):
+    """Category of each OCR item name, taken from the LLM's item of the same name or else the same price"""
+    unused = [item for item in answer_items or [] if isinstance(item, dict) and item.get('category')]
+    categories = {}
+    for item in parsed_items:
+        key = normalize_name(item['name'])
+        match = next((answer for answer in unused if normalize_name(answer.get('name')) == key), None)
+        if match is None:
+            match = next((answer for answer in unused if same_amount(to_number(answer.get('total_price')), item['total_price'])), None)
+        if match is not None and key:
+            unused.remove(match)
+            categories[key] = str(match['category']).strip().casefold()[:100]
+    return categories
+
+
+def derive_rules(lines, structured):
+    """Template rules that would read ``structured`` off ``lines``, None when the header doesn't name the shop"""
+    shop_words = set(normalize_label(structured.get('shop_name')).split())
+    header_index = next(
+        (index for index, line in enumerate(lines[:HEADER_LINES]) if shop_words & set(normalize_label(line).split())),
+        None,
+    )
+    if header_index is None:
+        return None, None
+
+    rules = {'shop_name': structured.get('shop_name'), 'address': structured.get('address'), 'items_after': header_index + 1}
+    taken = set()
+    for field in AMOUNT_FIELDS:
+        label = _field_label(lines, structured.get(field), FIELD_WORDS[field], taken)
+        rules[field] = [label] if label else []
+        taken.update(rules[field])
+    if structured.get('vat_percentage'):
+        rules['vat_percentage'] = structured['vat_percentage']
+
+    rules['categories'] = item_categories(parse_with_rules(lines, rules)[0]['items'], structured.get('items'))
+
+    payment_method = str(structured.get('payment_method') or '')
+    payment_words = set(normalize_label(payment_method).split())
+    payment_label = next((normalize_label(line) for line in lines if payment_words and payment_words <= set(normalize_label(line).split())), None)
+    rules['payment'] = [[payment_label, payment_method]] if payment_label else []
+
+    return normalize_header(lines[header_index]), rules
+
+
+def merge_rules(current, new):
+    merged = {**current, **{key: value for key, value in new.items() if key not in AMOUNT_FIELDS + ['payment', 'categories']}}
+    for field in AMOUNT_FIELDS:
+        merged[field] = list(dict.fromkeys(current.get(field, []) + new.get(field, [])))[:MAX_LABELS]
+    payments = {label: method for label, method in current.get('payment', []) + new.get('payment', [])}
+    merged['payment'] = [[label, method] for label, method in payments.items()][:MAX_LABELS]
+    categories = {name: category for name, category in current.get('categories', {}).items() if name not in new.get('categories', {})}
+    categories.update(new.get('categories', {}))
+    merged['categories'] = dict(list(categories.items())[-MAX_CATEGORIES:])
+    merged['items_after'] = min(current.get('items_after', new['items_after']), new['items_after'])
+    return merged
+
+
+def learn_template(text, structured):
+    """Fold a successful LLM parse into its shop's template, returns the template or None"""
+    if not isinstance(structured, dict) or not structured.get('shop_name'):
+        return None
+    lines = ocr_lines(text)
+    header_key, rules = derive_rules(lines, structured)
+    if header_key is None:
+        return None
+
+    template = ReceiptTemplate.objects.filter(header_key=header_key).first()
+    if template is not None:
+        rules = merge_rules(template.rules, rules)
+
+    # Only layouts the rules actually reproduce count as samples
+    parsed, score = parse_with_rules(lines, rules)
+    try:
+        expected_total = float(structured.get('total_cost'))
+    except (TypeError, ValueError):
+        return None
+    if score < MIN_CONFIDENCE or not same_amount(parsed['total_cost'], expected_total):
+        return None
+
+    if template is None:
+        template, _ = ReceiptTemplate.objects.get_or_create(header_key=header_key, defaults={'shop_name': structured['shop_name']})
+    template.rules = rules
+    template.samples = F('samples') + 1
+    template.save(update_fields=['rules', 'samples', 'updated_at'])
+    return template
@@ -0,0 +1,220 @@
+"""Receipt OCR and categorization, run by the receipt job worker"""
+import hashlib
+import json
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from commons import clients, resilience
+from commons.generation_cache import GenerationCache
+from core.fingerprint import PHASH_BANDS, distance
+from core.line_items import store_line_items
+from core.models import OcrResult, ReceiptJob
+from core.purchase_dates import parse_purchased_at
+from core.receipt_templates import learn_template, template_parse
+from task.models import Receipt
+
+
+logger = logging.getLogger(__name__)
+
+# The same receipt text always categorizes the same way (temperature 0), reuse the answer
+RECEIPT_CATEGORIZATION_CACHE = GenerationCache('receipts')
+
+# Bands only guarantee finding hashes up to PHASH_BANDS - 1 bits apart
+PHASH_MAX_DISTANCE = min(getattr(settings, 'RECEIPT_PHASH_MAX_DISTANCE', 3), PHASH_BANDS - 1)
+PHASH_MAX_CANDIDATES = 50
+
+CATEGORIZATION_PROMPT = """
+You are an AI specialized in extracting and categorizing receipt data and fixing any text that may be unclear due to light, scars, or other issues.
+Fix unrelated and unreadable texts with your knowledge of what it should be. Always check unit price and total price correction.
+Given the following receipt text, extract these fields as JSON: date, time, shop_name, address, payment_method, items (list of objects with name, quantity, unit_price, total_price and category), services (list of the same objects), vat_percentage, vat_amount, subtotal, tax, discount, total_cost.
+Receipt text:
+\"\"\"{extracted_text}\"\"\"
+Return only well-formed JSON. Do not add any explanation or text outside JSON.
+"""
+
+
+class ReceiptParseError(Exception):
+    """The categorization answer wasn't the JSON object asked for"""
+
+
+def read_image(receipt):
+    # Through the storage API, works for local media as well as S3
+    with receipt.image.open('rb') as image:
+        return image.read()
+
+
+def detect_document(image_bytes):
+    """Textract response for the image, without the per-request metadata"""
+    def detect(timeout):
+        with clients.timed(clients.TEXTRACT):
+            return clients.textract_client().detect_document_text(Document={'Bytes': image_bytes})
+
+    response = resilience.call(clients.TEXTRACT, detect)
+    return {key: value for key, value in response.items() if key != 'ResponseMetadata'}
+
+
+def response_lines(response):
+    return [block['Text'] for block in response.get('Blocks', []) if block.get('BlockType') == 'LINE']
+
+
+def extract_text(image_bytes):
+    return '\n'.join(response_lines(detect_document(image_bytes)))
+
+
+def store_ocr_result(response):
+    """Store a Textract response content-addressed, returns its digest"""
+    data = json.dumps(response, sort_keys=True, separators=(',', ':'), default=str)
+    digest = hashlib.sha256(data.encode()).hexdigest()
+    OcrResult.objects.get_or_create(
+        digest=digest,
+        defaults={'response': json.loads(data), 'line_count': len(response_lines(response))},
+    )
+    return digest
+
+
+def ocr_text(receipt):
+    """OCR text of a receipt, rebuilt from the stored response if the text column is empty"""
+    if receipt.extracted_text:
+        return receipt.extracted_text
+    if receipt.ocr_digest:
+        ocr_result = OcrResult.objects.filter(digest=receipt.ocr_digest).first()
+        if ocr_result is not None:
+            return ocr_result.text()
+    return None
+
+
+def categorize_receipt_with_gpt(extracted_text):
+    def complete(timeout):
+        with clients.timed(clients.OPENAI):
+            return clients.openai_client().with_options(timeout=timeout).chat.completions.create(
+                model="gpt-4",
+                messages=[{"role": "user", "content": CATEGORIZATION_PROMPT.format(extracted_text=extracted_text)}],
+                temperature=0,
+                max_tokens=1500,
+            )
+
+    response = resilience.call(clients.OPENAI, complete)
+    return response.choices[0].message.content
+
+
+def safe_parse_json(raw_json):
+    try:
+        data = json.loads(raw_json)
+    except (TypeError, json.JSONDecodeError):
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def categorize(extracted_text):
+    """Structured receipt fields for the OCR text, raises ReceiptParseError on a malformed answer.
+
+    Layouts of shops with a learned template are parsed locally, the rest goes to GPT and
+    every fresh GPT answer is offered to template learning.
+    """
+    structured_data = template_parse(extracted_text)
+    if structured_data is not None:
+        return structured_data
+
+    structured_data, cached = RECEIPT_CATEGORIZATION_CACHE.get_or_generate(
+        extracted_text,
+        lambda: safe_parse_json(categorize_receipt_with_gpt(extracted_text)),
+    )
+    if structured_data is None:
+        raise ReceiptParseError('Failed to parse GPT response.')
+
+    if not cached:
+        try:
+            learn_template(extracted_text, structured_data)
+        except Exception:
+            # Learning is an optimization, never a reason to fail the receipt
+            logger.exception('Receipt template learning failed')
+    return structured_data
+
+
+def recategorize(receipt, fresh=False):
+    """Re-run categorization on the stored OCR output of a receipt, Textract isn't called.
+
+    ``fresh`` asks GPT again, skipping templates and cached answers (e.g. after a prompt
+    change). Failed jobs of the receipt are closed as succeeded.
+    """
+    text = ocr_text(receipt)
+    if not text:
+        raise ReceiptParseError('No stored OCR output.')
+
+    if fresh:
+        structured_data = safe_parse_json(categorize_receipt_with_gpt(text))
+        if structured_data is None:
+            raise ReceiptParseError('Failed to parse GPT response.')
+        RECEIPT_CATEGORIZATION_CACHE.set(RECEIPT_CATEGORIZATION_CACHE.key(text), structured_data)
+    else:
+        structured_data = categorize(text)
+
+    receipt.extracted_text = text
+    apply_extraction(receipt, structured_data)
+    save_extraction(receipt)
+    receipt.jobs.filter(status=ReceiptJob.STATUS_FAILED).update(
+        status=ReceiptJob.STATUS_SUCCEEDED, stage=ReceiptJob.STAGE_DONE, last_error=None, finished_at=timezone.now(),
+    )
+    return structured_data
+
+
+def apply_extraction(receipt, structured_data):
+    receipt.extracted_data = structured_data
+    date, time = structured_data.get('date') or '', structured_data.get('time') or ''
+    receipt.purchased_at = parse_purchased_at(date, time)
+    # The text columns only fit short forms like 17-07-2025 and 02:06
+    receipt.date = str(date)[:10]
+    receipt.time = str(time)[:5]
+    receipt.shop_name = structured_data.get('shop_name', '')
+    receipt.address = structured_data.get('address', '')
+    receipt.payment_method = structured_data.get('payment_method', '')
+    receipt.items = structured_data.get('items', [])
+    receipt.services = structured_data.get('services', [])
+    receipt.vat_percentage = structured_data.get('vat_percentage', 0.0)
+    receipt.vat_amount = structured_data.get('vat_amount', 0.0)
+    receipt.subtotal = structured_data.get('subtotal', 0.0)
+    receipt.tax = structured_data.get('tax', 0.0)
+    receipt.discount = structured_data.get('discount', 0.0)
+    receipt.total_cost = structured_data.get('total_cost', 0.0)
+    receipt.processed_at = timezone.now()
+
+
+def save_extraction(receipt):
+    """Save an extracted receipt together with its line items"""
+    with transaction.atomic():
+        receipt.save()
+        store_line_items(receipt)
+
+
+def find_duplicate(fingerprint, user=None, exclude_id=None):
+    """Processed receipt with the same image, byte-identical or perceptually close.
+
+    Byte-identical images match across users. Perceptual matches are only looked up among
+    the user's own receipts, two shops' receipts can look alike at 9x8 pixels.
+    """
+    processed = Receipt.objects.processed().exclude(pk=exclude_id).order_by('-id')
+
+    original = processed.filter(content_sha256=fingerprint.sha256).first()
+    if original is not None or fingerprint.phash is None or user is None:
+        return original
+
+    same_band = Q()
+    for band, value in enumerate(fingerprint.bands):
+        same_band |= Q(**{f'phash_band_{band}': value})
+    candidates = processed.filter(same_band, created_by=user).only('id', 'phash')[:PHASH_MAX_CANDIDATES]
+
+    best = min(candidates, key=lambda candidate: distance(candidate.phash, fingerprint.phash), default=None)
+    if best is None or distance(best.phash, fingerprint.phash) > PHASH_MAX_DISTANCE:
+        return None
+    return Receipt.objects.get(pk=best.pk)
+
+
+def reuse_extraction(receipt, original):
+    receipt.duplicate_of = original
+    receipt.extracted_text = original.extracted_text
+    receipt.ocr_digest = original.ocr_digest
+    apply_extraction(receipt, original.extracted_data)
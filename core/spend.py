@@ -0,0 +1,81 @@
+"""Spend analytics over receipt line items, aggregated in SQL.
+
+Every query is scoped to one user and a purchase date range, the leading columns of the
+composite (created_by, <group>, purchased_on) indexes on ``ReceiptItem``.
+"""
+from django.db.models import Count, F, Max, Sum
+from django.db.models.functions import TruncMonth
+
+from core.line_items import normalize_name
+from task.models import ReceiptItem
+
+
+GROUP_SHOP = 'shop'
+GROUP_PRODUCT = 'product'
+GROUP_CATEGORY = 'category'
+GROUP_MONTH = 'month'
+
+# group -> (key expression, label expression)
+GROUPS = {
+    GROUP_SHOP: (F('shop_key'), Max('shop_name')),
+    GROUP_PRODUCT: (F('product_key'), Max('product_name')),
+    GROUP_CATEGORY: (F('category'), Max('category')),
+    GROUP_MONTH: (TruncMonth('purchased_on'), Max('purchased_on')),
+}
+
+DEFAULT_LIMIT = 50
+
+
+def _round(value):
+    return round(value, 2) if value is not None else 0
+
+
+def spend_items(user, start=None, end=None, product=None, shop=None, category=None):
+    items = ReceiptItem.objects.filter(created_by=user, line_total__isnull=False)
+    if start:
+        items = items.filter(purchased_on__gte=start)
+    if end:
+        items = items.filter(purchased_on__lte=end)
+    if product:
+        items = items.filter(product_key__contains=normalize_name(product))
+    if shop:
+        items = items.filter(shop_key=normalize_name(shop))
+    if category:
+        items = items.filter(category=category.strip().casefold())
+    return items
+
+
+def spend_summary(user, group_by=GROUP_CATEGORY, start=None, end=None, product=None, shop=None, category=None, limit=DEFAULT_LIMIT):
+    """Total spend plus one row per shop, product, category or month, biggest first (months in order)"""
+    items = spend_items(user, start, end, product, shop, category)
+    key, label = GROUPS[group_by]
+
+    totals = items.aggregate(total=Sum('line_total'), lines=Count('id'), receipts=Count('receipt_id', distinct=True))
+    rows = (
+        items.order_by()
+        .values(key=key)
+        .annotate(
+            label=label,
+            total=Sum('line_total'),
+            quantity=Sum('quantity'),
+            lines=Count('id'),
+            receipts=Count('receipt_id', distinct=True),
+        )
+    )
+    rows = rows.order_by('key') if group_by == GROUP_MONTH else rows.order_by('-total', 'key')[:limit]
+
+    results = []
+    for row in rows:
+        if group_by == GROUP_MONTH:
+            row['key'] = row['label'] = row['key'].strftime('%Y-%m')
+        row['total'] = _round(row['total'])
+        row['quantity'] = _round(row['quantity'])
+        results.append(row)
+
+    return {
+        'group_by': group_by,
+        'total': _round(totals['total']),
+        'lines': totals['lines'],
+        'receipts': totals['receipts'],
+        'results': results,
+    }
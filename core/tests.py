@@ -1,3 +1,417 @@
-from django.test import TestCase
+import shutil
+import tempfile
+import threading
+import time
+from datetime import datetime
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+import boto3
+from openai import APITimeoutError, OpenAI
+from PIL import Image, ImageDraw
+from rest_framework.test import APIClient
+
+from commons.clients import ClientRegistry
+from commons.fake_servers import FakeDependencyServer
+from commons.resilience import BulkheadFull, CircuitBreaker, CircuitOpen, DeadlineExceeded, Dependency
+from authentication.models import User
+from core import jobs, receipts
+from core.line_items import line_items, normalize_name, store_line_items
+from core.spend import GROUP_MONTH, GROUP_PRODUCT, spend_summary
+from core.fingerprint import content_fingerprint, distance, fingerprint
+from core.purchase_dates import parse_purchased_at
+from core.receipt_templates import MIN_SAMPLES, derive_rules, learn_template, ocr_lines, parse_with_rules, template_parse
+from core.preprocessing import MAX_WIDTH, preprocess, skew_angle
+from core.models import OcrResult, ReceiptJob
+from task.models import Receipt, ReceiptItem
 
 # Create your tests here.
+
+# Uploaded test images go here instead of the project's media directory
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def tearDownModule():
+	shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+
+def receipt_image(format='PNG', size=(300, 600), quality=95):
+	image = Image.new('L', (300, 600), 255)
+	draw = ImageDraw.Draw(image)
+	for line in range(12):
+		draw.rectangle((20, 40 + line * 45, 60 + (line * 37) % 200, 60 + line * 45), fill=0)
+	buffer = BytesIO()
+	image.resize(size).save(buffer, format=format, quality=quality)
+	return buffer.getvalue()
+
+
+def textract_response(*lines):
+	return {'Blocks': [{'BlockType': 'PAGE'}] + [{'BlockType': 'LINE', 'Text': line, 'Confidence': 99.5} for line in lines]}
+
+
+class FingerprintTest(SimpleTestCase):
+
+	def test_re_encoded_copies_stay_close(self):
+		original = fingerprint(receipt_image())
+		copy = fingerprint(receipt_image('JPEG', size=(150, 300), quality=60))
+
+		self.assertNotEqual(original.sha256, copy.sha256)
+		self.assertLessEqual(distance(original.phash, copy.phash), 3)
+		self.assertTrue(set(enumerate(original.bands)) & set(enumerate(copy.bands)))
+		self.assertIsNone(fingerprint(b'not an image').phash)
+
+
+class PreprocessTest(SimpleTestCase):
+
+	def test_photo_is_shrunk_and_levelled(self):
+		photo = Image.open(BytesIO(receipt_image(size=(1500, 3000)))).convert('RGB').rotate(3, expand=True, fillcolor=(60, 50, 40))
+		buffer = BytesIO()
+		photo.save(buffer, format='JPEG', quality=95)
+
+		processed = Image.open(BytesIO(preprocess(buffer.getvalue())))
+		self.assertEqual(processed.mode, 'L')
+		self.assertLessEqual(processed.width, MAX_WIDTH)
+		self.assertLess(processed.width * processed.height, photo.width * photo.height)
+		self.assertAlmostEqual(skew_angle(photo.convert('L')), -3, delta=0.5)
+		self.assertEqual(preprocess(b'not an image'), b'not an image')
+
+
+class LineItemTest(SimpleTestCase):
+
+	def test_loose_item_shapes(self):
+		receipt = Receipt(shop_name='Super Store', uploaded_at=timezone.now(), items=[
+			{'name': 'MILK 2 L', 'qty': '2', 'price': '£1,20', 'category': 'Dairy'},
+			{'item': 'Bread', 'total': 2.5},
+			'Eggs x6',
+			{'price': 3},
+		], services=[{'service': 'Delivery', 'amount': '4.99'}])
+
+		rows = [(row.kind, row.product_key, row.category, row.quantity, row.unit_price, row.line_total) for row in line_items(receipt)]
+		self.assertEqual(rows, [
+			('item', 'milk', 'dairy', 2, 1.2, 2.4),
+			('item', 'bread', None, 1, 2.5, 2.5),
+			('item', 'eggs', None, 1, None, None),
+			('service', 'delivery', None, 1, 4.99, 4.99),
+		])
+		self.assertEqual(normalize_name('Milk 2L'), normalize_name('milk  2 l'))
+
+
+class PurchaseDateTest(SimpleTestCase):
+
+	def test_printed_formats(self):
+		expected = timezone.make_aware(datetime(2025, 7, 17, 14, 6))
+		for date_text, time_text in [('17-07-2025', '14:06'), ('17/07/25', '2:06 PM'), ('17 Jul 2025', '14:06:00'), ('2025-07-17', '14.06')]:
+			self.assertEqual(parse_purchased_at(date_text, time_text), expected, date_text)
+
+		self.assertEqual(parse_purchased_at('17.07.2025', None), expected.replace(hour=0, minute=0))
+		self.assertIsNone(parse_purchased_at('31-02-2025'))
+		self.assertIsNone(parse_purchased_at('17-07-1925'))
+		self.assertIsNone(parse_purchased_at(''))
+
+
+RECEIPT_TEXT = """SUPERSTORE LTD
+12 High Street
+MILK 2L 1.20
+BREAD 2 x 0.90 1.80
+EGGS 6PK {eggs} A
+SUBTOTAL {total}
+VAT 20% 0.85
+TOTAL {total}
+CARD PAYMENT {total}
+17/07/2025 14:06"""
+
+RECEIPT_LLM_ANSWER = {
+	'shop_name': 'Superstore', 'address': '12 High Street', 'payment_method': 'Card', 'date': '17-07-2025', 'time': '14:06',
+	'subtotal': 5.10, 'vat_amount': 0.85, 'vat_percentage': 20, 'discount': 0, 'total_cost': 5.10,
+	'items': [
+		{'name': 'Milk', 'quantity': 1, 'total_price': 1.20, 'category': 'Dairy'},
+		{'name': 'White bread', 'quantity': 2, 'unit_price': 0.90, 'total_price': 1.80, 'category': 'Bakery'},
+		{'name': 'Eggs 6 pack', 'quantity': 1, 'total_price': 2.10, 'category': 'Dairy'},
+	],
+}
+
+
+class ReceiptTemplateTest(SimpleTestCase):
+
+	def test_rules_read_the_llm_answer_back(self):
+		lines = ocr_lines(RECEIPT_TEXT.format(eggs='2.10', total='5.10'))
+		header_key, rules = derive_rules(lines, RECEIPT_LLM_ANSWER)
+		self.assertEqual(header_key, 'superstore ltd')
+		self.assertEqual((rules['subtotal'], rules['total_cost'], rules['vat_amount']), (['subtotal'], ['total'], ['vat']))
+
+		structured, score = parse_with_rules(lines, rules)
+		self.assertEqual(score, 1.0)
+		self.assertEqual((structured['total_cost'], structured['payment_method'], structured['date']), (5.10, 'Card', '17/07/2025'))
+		self.assertEqual([(item['name'], item['quantity'], item['total_price']) for item in structured['items']], [('MILK 2L', 1, 1.2), ('BREAD', 2, 1.8), ('EGGS 6PK', 1, 2.1)])
+		# Matched by name, or by price where the LLM renamed the item
+		self.assertEqual(rules['categories'], {'milk': 'dairy', 'bread': 'bakery', 'eggs': 'dairy'})
+		self.assertEqual([item['category'] for item in structured['items']], ['dairy', 'bakery', 'dairy'])
+
+		# Items that don't add up to the total go to the LLM
+		_, score = parse_with_rules(ocr_lines(RECEIPT_TEXT.format(eggs='2.70', total='5.10')), rules)
+		self.assertLess(score, 0.8)
+
+
+class ClientRegistryTest(SimpleTestCase):
+
+	def test_one_client_per_process(self):
+		registry = ClientRegistry()
+		registry.register('service', object)
+		client = registry.get('service')
+		for _ in range(2):
+			with registry.timed('service'):
+				self.assertIs(registry.get('service'), client)
+
+		stats = registry.stats()['service']
+		self.assertEqual((stats['constructed'], stats['first_calls'], stats['reused_calls']), (1, 1, 1))
+
+		# As seen from a forked child
+		registry._pid = -1
+		self.assertIsNot(registry.get('service'), client)
+		self.assertEqual(registry.stats()['service']['constructed'], 2)
+
+
+class ResilienceTest(SimpleTestCase):
+
+	def dependency(self, **options):
+		return Dependency('fake', **{'max_concurrent': 2, 'timeout': 0.3, 'queue_seconds': 0, 'failure_threshold': 2, 'reset_seconds': 60, **options})
+
+	def test_slow_dependency_opens_circuit(self):
+		dependency = self.dependency()
+		with FakeDependencyServer(latency=1) as server:
+			client = OpenAI(api_key='test', base_url=f'{server.url}/v1', max_retries=0)
+			complete = lambda timeout: client.with_options(timeout=timeout).chat.completions.create(model='gpt-4', messages=[])
+			for _ in range(2):
+				self.assertRaises(APITimeoutError, dependency.call, complete)
+
+			started = time.monotonic()
+			self.assertRaises(CircuitOpen, dependency.call, complete)
+			self.assertLess(time.monotonic() - started, 0.05)
+			self.assertEqual(server.requests, 2)
+
+		stats = dependency.stats()
+		self.assertEqual((stats['state'], stats['timeouts'], stats['rejected_open'], stats['circuit_opened']), (CircuitBreaker.OPEN, 2, 1, 1))
+
+	def test_stream_holds_slot_until_drained(self):
+		dependency = self.dependency(max_concurrent=1)
+		with FakeDependencyServer(chunk_delay=0.1, completion='x' * 100) as server:
+			client = OpenAI(api_key='test', base_url=f'{server.url}/v1', max_retries=0)
+			with self.assertRaises(DeadlineExceeded):
+				with dependency.slot() as deadline:
+					stream = client.with_options(timeout=deadline.remaining()).chat.completions.create(model='gpt-4', messages=[], stream=True)
+					with stream:
+						for chunk in stream:
+							self.assertRaises(BulkheadFull, dependency.call, lambda timeout: None)
+							deadline.check()
+
+		stats = dependency.stats()
+		self.assertEqual((stats['in_flight'], stats['timeouts'], stats['calls']), (0, 1, 1))
+		self.assertGreater(stats['rejected_full'], 0)
+
+	def test_full_bulkhead_rejects_calls(self):
+		with FakeDependencyServer(delays=[0.5]) as server:
+			client = boto3.client('textract', endpoint_url=server.url, region_name='eu-west-2', aws_access_key_id='test', aws_secret_access_key='test')
+			detect = lambda timeout: client.detect_document_text(Document={'Bytes': b'image'})
+
+			dependency = self.dependency(max_concurrent=1, timeout=2)
+			slow = threading.Thread(target=dependency.call, args=(detect,))
+			slow.start()
+			time.sleep(0.1)
+			self.assertRaises(BulkheadFull, dependency.call, detect)
+			slow.join()
+
+			self.assertEqual(receipts.response_lines(dependency.call(detect)), ['FAKE SHOP', 'TOTAL 1.00'])
+			self.assertEqual((dependency.stats()['calls'], dependency.stats()['rejected_full']), (2, 1))
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class ReceiptJobTest(TestCase):
+
+	def setUp(self):
+		self.receipt = Receipt.objects.create(image=SimpleUploadedFile('receipt.jpg', b'image', content_type='image/jpeg'))
+		self.job = jobs.enqueue_receipt(self.receipt)
+
+	def claim(self):
+		claimed = jobs.claim_jobs('test-worker')
+		self.assertEqual([job.id for job in claimed], [self.job.id])
+		return claimed[0]
+
+	@mock.patch('core.receipts.read_image', return_value=b'image')
+	@mock.patch('core.receipts.detect_document', return_value=textract_response('SHOP', 'TOTAL 10.00'))
+	@mock.patch('core.receipts.categorize', return_value={'shop_name': 'Shop', 'total_cost': 10.0})
+	def test_runs_both_stages(self, categorize, detect_document, read_image):
+		job = jobs.run_job(self.claim())
+
+		self.assertEqual((job.status, job.stage, job.attempts), (ReceiptJob.STATUS_SUCCEEDED, ReceiptJob.STAGE_DONE, 1))
+		self.assertEqual(jobs.claim_jobs('test-worker'), [])
+		self.receipt.refresh_from_db()
+		self.assertEqual((self.receipt.shop_name, self.receipt.total_cost), ('Shop', 10.0))
+		self.assertEqual(jobs.job_status(job)['result'], {'shop_name': 'Shop', 'total_cost': 10.0})
+		self.assertEqual(OcrResult.objects.get(digest=self.receipt.ocr_digest).text(), 'SHOP\nTOTAL 10.00')
+
+	@mock.patch('core.receipts.read_image', return_value=b'image')
+	@mock.patch('core.receipts.detect_document', return_value=textract_response('SHOP'))
+	@mock.patch('core.receipts.categorize', side_effect=RuntimeError('timeout'))
+	def test_retries_resume_at_failed_stage(self, categorize, detect_document, read_image):
+		for attempt in range(1, self.job.max_attempts + 1):
+			job = jobs.run_job(self.claim())
+			self.assertEqual((job.attempts, job.stage), (attempt, ReceiptJob.STAGE_CATEGORIZATION))
+			if job.status == ReceiptJob.STATUS_QUEUED:
+				self.assertGreater(job.run_after, timezone.now())
+				ReceiptJob.objects.filter(pk=job.pk).update(run_after=timezone.now())
+
+		self.assertEqual(job.status, ReceiptJob.STATUS_FAILED)
+		self.assertEqual(job.last_error, 'RuntimeError: timeout')
+		self.assertEqual(detect_document.call_count, 1)
+		self.assertEqual(categorize.call_count, self.job.max_attempts)
+
+	def test_stale_jobs_are_released(self):
+		self.claim()
+		self.assertEqual(jobs.requeue_stale(), 0)
+		self.assertEqual(jobs.requeue_stale(timezone.now() + jobs.LOCK_TIMEOUT * 2), 1)
+		self.assertEqual(ReceiptJob.objects.get(pk=self.job.pk).status, ReceiptJob.STATUS_QUEUED)
+
+	@mock.patch('core.receipts.detect_document')
+	@mock.patch('core.receipts.read_image', return_value=receipt_image())
+	def test_duplicate_reuses_extraction(self, read_image, detect_document):
+		original = Receipt.objects.create(image='receipts/original.png', extracted_text='SHOP', extracted_data={'shop_name': 'Shop'}, processed_at=timezone.now())
+		original.set_fingerprint(fingerprint(receipt_image()))
+		original.save()
+
+		job = jobs.run_job(self.claim())
+
+		self.assertEqual(job.status, ReceiptJob.STATUS_SUCCEEDED)
+		detect_document.assert_not_called()
+		self.receipt.refresh_from_db()
+		self.assertEqual((self.receipt.duplicate_of_id, self.receipt.shop_name), (original.id, 'Shop'))
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class ReceiptSpendTest(TestCase):
+
+	def test_spend_grouped_in_sql(self):
+		user = User.objects.create_user(email='spend@example.com', password='secret', image=None)
+		for shop, items in [('Shop A', [{'name': 'Milk 1L', 'total_price': 1.5}, {'name': 'Tea', 'total_price': 4}]), ('Shop B', [{'name': 'MILK 2L', 'total_price': 2.5}])]:
+			receipt = Receipt.objects.create(image='receipts/spend.png', shop_name=shop, items=items, extracted_data={'items': items}, processed_at=timezone.now(), created_by=user)
+			store_line_items(receipt)
+
+		summary = spend_summary(user, GROUP_PRODUCT)
+		self.assertEqual((summary['total'], summary['receipts']), (8, 2))
+		self.assertEqual([(row['key'], row['total'], row['receipts']) for row in summary['results']], [('milk', 4, 2), ('tea', 4, 1)])
+
+		self.assertEqual(spend_summary(user, GROUP_MONTH, product='milk')['results'][0]['total'], 4)
+
+	def test_rebuild_backfills_processed_receipts(self):
+		items = [{'name': 'Milk 1L', 'total_price': 1.5}, {'name': 'Tea', 'total_price': 4}]
+		processed = [
+			Receipt.objects.create(image='receipts/rebuild.png', shop_name='Shop', items=items, extracted_data={'items': items}, processed_at=timezone.now())
+			for _ in range(3)
+		]
+		Receipt.objects.create(image='receipts/pending.png', items=items)
+		store_line_items(processed[0])
+
+		out = StringIO()
+		call_command('rebuild_receipt_items', '--chunk-size', '2', stdout=out)
+
+		self.assertIn('Rebuilt 6 line item(s) of 3 receipt(s)', out.getvalue())
+		self.assertEqual(ReceiptItem.objects.count(), 6)
+		self.assertEqual(set(ReceiptItem.objects.values_list('receipt_id', flat=True)), {receipt.id for receipt in processed})
+
+
+	@mock.patch('core.receipts.detect_document', return_value=textract_response('SHOP', 'TEA 4.00'))
+	@mock.patch('core.receipts.categorize', return_value={'shop_name': 'Shop', 'items': [{'name': 'Tea', 'total_price': 4}]})
+	def test_re_upload_is_not_counted_twice(self, categorize, detect_document):
+		user = User.objects.create_user(email='spend@example.com', password='secret', image=None)
+		client = APIClient()
+		client.force_authenticate(user)
+		upload = lambda: client.post('/ocr/upload_receipt/', {'image': SimpleUploadedFile('receipt.png', receipt_image(), 'image/png')}, format='multipart')
+		self.assertEqual(upload().status_code, 202)
+		jobs.run_job(jobs.claim_jobs('test-worker')[0])
+		self.assertEqual(spend_summary(user)['total'], 4)
+
+		self.assertEqual(upload().status_code, 200)
+		self.assertEqual(spend_summary(user)['total'], 4)
+		call_command('rebuild_receipt_items', stdout=StringIO())
+		self.assertEqual(spend_summary(user)['total'], 4)
+
+
+class ReceiptTemplateLearningTest(TestCase):
+
+	def test_template_used_after_enough_samples(self):
+		text = RECEIPT_TEXT.format(eggs='2.10', total='5.10')
+		for _ in range(MIN_SAMPLES):
+			self.assertIsNone(template_parse(text))
+			self.assertIsNotNone(learn_template(text, RECEIPT_LLM_ANSWER))
+
+		structured = template_parse(RECEIPT_TEXT.format(eggs='3.10', total='6.10'))
+		self.assertEqual((structured['shop_name'], structured['total_cost']), ('Superstore', 6.10))
+		self.assertEqual([item['category'] for item in structured['items']], ['dairy', 'bakery', 'dairy'])
+
+		# An item the template has no category for goes to the LLM
+		self.assertIsNone(template_parse(RECEIPT_TEXT.format(eggs='2.10', total='5.10').replace('EGGS 6PK', 'CHEESE')))
+
+
+class RecategorizeTest(TestCase):
+
+	@mock.patch('core.receipts.categorize', return_value={'shop_name': 'Shop', 'total_cost': 10.0})
+	def test_uses_stored_ocr_output(self, categorize):
+		digest = receipts.store_ocr_result(textract_response('SHOP', 'TOTAL 10.00'))
+		self.assertEqual(receipts.store_ocr_result(textract_response('SHOP', 'TOTAL 10.00')), digest)
+		receipt = Receipt.objects.create(image='receipts/stored.png', ocr_digest=digest)
+		job = ReceiptJob.objects.create(receipt=receipt, status=ReceiptJob.STATUS_FAILED, stage=ReceiptJob.STAGE_CATEGORIZATION)
+
+		receipts.recategorize(receipt)
+
+		categorize.assert_called_once_with('SHOP\nTOTAL 10.00')
+		receipt.refresh_from_db()
+		self.assertEqual((receipt.shop_name, receipt.extracted_text), ('Shop', 'SHOP\nTOTAL 10.00'))
+		self.assertEqual(ReceiptJob.objects.get(pk=job.pk).status, ReceiptJob.STATUS_SUCCEEDED)
+		self.assertEqual(OcrResult.objects.count(), 1)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class ReceiptAccessTest(TestCase):
+
+	def test_receipts_and_jobs_of_other_users_are_hidden(self):
+		owner = User.objects.create_user(email='owner@example.com', password='secret', image=None)
+		other = User.objects.create_user(email='other@example.com', password='secret', image=None)
+		receipt = Receipt.objects.create(image='receipts/owned.png', extracted_text='SHOP', created_by=owner)
+		job = jobs.enqueue_receipt(receipt, owner)
+
+		client = APIClient()
+		for url in [f'/ocr/receipt/{receipt.id}/extraction/', f'/ocr/receipt/job/{job.id}/']:
+			self.assertIn(client.get(url).status_code, (401, 403))
+			client.force_authenticate(other)
+			self.assertEqual(client.get(url).status_code, 404)
+			client.force_authenticate(owner)
+			self.assertEqual(client.get(url).status_code, 200)
+			client.force_authenticate(None)
+
+	@mock.patch('core.fingerprint.dhash')
+	def test_upload_shares_files_only_with_own_receipts(self, dhash):
+		owner = User.objects.create_user(email='owner@example.com', password='secret', image=None)
+		other = User.objects.create_user(email='other@example.com', password='secret', image=None)
+		image = receipt_image()
+		original = Receipt(image='receipts/original.png', created_by=owner, processed_at=timezone.now(), extracted_data={'shop_name': 'Shop'})
+		original.set_fingerprint(content_fingerprint([image])._replace(phash=7, bands=[7, 0, 0, 0]))
+		original.save()
+
+		client = APIClient()
+		self.assertIn(client.post('/ocr/upload_receipt/', {'image': SimpleUploadedFile('receipt.png', image, 'image/png')}, format='multipart').status_code, (401, 403))
+		for user in (owner, other):
+			client.force_authenticate(user)
+			response = client.post('/ocr/upload_receipt/', {'image': SimpleUploadedFile('receipt.png', image, 'image/png')}, format='multipart')
+			self.assertEqual(response.status_code, 200)
+
+		# The upload request never decodes the photo
+		dhash.assert_not_called()
+		own, others = Receipt.objects.exclude(pk=original.pk).get(created_by=owner), Receipt.objects.get(created_by=other)
+		self.assertEqual(own.duplicate_of, original)
+		self.assertEqual(own.image.name, original.image.name)
+		self.assertNotEqual(others.image.name, original.image.name)
+		self.assertEqual((own.phash, others.phash), (original.phash, original.phash))
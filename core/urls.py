@@ -1,7 +1,13 @@
 # urls.py in the 'ocr' app
 from django.urls import path
-from .views import ReceiptUploadView
+from .views import ReceiptUploadView, ReceiptExtractionView, ReceiptJobView, ReceiptListView, ReceiptSpendView, ClientStatsView, DependencyStatsView
 
 urlpatterns = [
     path('upload_receipt/', ReceiptUploadView.as_view(), name='upload_receipt'),
+    path('receipt/<int:pk>/extraction/', ReceiptExtractionView.as_view(), name='receipt_extraction'),
+    path('receipt/job/<int:pk>/', ReceiptJobView.as_view(), name='receipt_job'),
+    path('receipt/', ReceiptListView.as_view(), name='receipt_list'),
+    path('receipt/spend/', ReceiptSpendView.as_view(), name='receipt_spend'),
+    path('clients/stats/', ClientStatsView.as_view(), name='client_stats'),
+    path('dependencies/stats/', DependencyStatsView.as_view(), name='dependency_stats'),
 ]
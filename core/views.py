@@ -1,101 +1,181 @@
 # views.py in the 'ocr' app
-import os
-import boto3
-from openai import OpenAI
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.parsers import MultiPartParser, FormParser
-from task.models import Recipe,Receipt
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from django.db.models import F, Sum
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from datetime import datetime, time, timedelta
+from task.models import Receipt
 # from task.serializers import ReceiptSerializer
-import json
-from datetime import datetime
+from commons.clients import client_stats
+from commons.resilience import dependency_stats
+from commons.pagination import get_pagination
+from core.fingerprint import content_fingerprint
+from core.jobs import enqueue_receipt, job_status, record_duplicate
+from core.spend import DEFAULT_LIMIT, GROUP_CATEGORY, GROUPS, spend_summary
+from core.receipts import find_duplicate, reuse_extraction, save_extraction
+from core.models import ReceiptJob
+
+
+RECEIPT_LIST_FIELDS = ['id', 'shop_name', 'purchased_at', 'payment_method', 'total_cost', 'processed_at', 'created_at']
+
 
 class ReceiptUploadView(APIView):
+    """Stores the image and queues OCR and categorization, poll the returned job for the result"""
+    permission_classes = [IsAuthenticated]
     parser_classes = (MultiPartParser, FormParser)
 
     def post(self, request, *args, **kwargs):
-        # Step 1: Get the image from the request
         image = request.FILES.get('image')
 
         if not image:
             return Response({"error": "No image provided."}, status=400)
 
-        # Step 2: Save the image to the server (optional if you want to store it in your database)
-        receipt = Receipt.objects.create(image=image)
-
-        # Step 3: Run your OCR function
-        image_path = os.path.join("media", str(receipt.image))  # Adjust based on your media path
-        extracted_text = self.extract_text_from_local_image(image_path)
-
-        # Step 4: Categorize the receipt with GPT-4
-        raw_json = self.categorize_receipt_with_gpt(extracted_text)
-        structured_data = self.safe_parse_json(raw_json)
-
-        # Step 5: Save the extracted data in the database
-        receipt.extracted_text = extracted_text
-        receipt.extracted_data = structured_data
-        receipt.date = structured_data.get('date', '')
-        receipt.time = structured_data.get('time', '')
-        receipt.shop_name = structured_data.get('shop_name', '')
-        receipt.address = structured_data.get('address', '')
-        receipt.payment_method = structured_data.get('payment_method', '')
-        receipt.items = structured_data.get('items', [])
-        receipt.services = structured_data.get('services', [])
-        receipt.vat_percentage = structured_data.get('vat_percentage', 0.0)
-        receipt.vat_amount = structured_data.get('vat_amount', 0.0)
-        receipt.subtotal = structured_data.get('subtotal', 0.0)
-        receipt.tax = structured_data.get('tax', 0.0)
-        receipt.discount = structured_data.get('discount', 0.0)
-        receipt.total_cost = structured_data.get('total_cost', 0.0)
-
-        # Set processed_at when receipt is processed
-        receipt.processed_at = datetime.now()
-
+        user = request.user
+        # The perceptual hash needs the decoded photo, the worker computes it
+        image_fingerprint = content_fingerprint(image.chunks())
+        image.seek(0)
+
+        # A byte-identical re-upload of a processed receipt is answered from it, without OCR or GPT calls
+        original = find_duplicate(image_fingerprint, user)
+        if original is not None:
+            # Only the user's own receipts share the stored file, deleting one mustn't take another user's image
+            same_owner = original.created_by_id == user.id
+            receipt = Receipt(image=original.image.name if same_owner else image, created_by=user)
+            # Same bytes, so the original's perceptual hash is this image's too
+            receipt.set_fingerprint(image_fingerprint._replace(
+                phash=original.phash,
+                bands=[original.phash_band_0, original.phash_band_1, original.phash_band_2, original.phash_band_3],
+            ))
+            reuse_extraction(receipt, original)
+            save_extraction(receipt)
+            job = record_duplicate(receipt, user)
+            return Response({**job_status(job), "duplicate_of": original.id}, status=200)
+
+        receipt = Receipt(image=image, created_by=user)
+        receipt.set_fingerprint(image_fingerprint)
         receipt.save()
+        job = enqueue_receipt(receipt, user)
+
+        return Response({"job_id": job.id, "receipt_id": receipt.id, "status": job.status}, status=202)
+
+
+class ReceiptJobView(APIView):
+    """Progress of one of the user's receipt jobs, with the extracted fields once it succeeded"""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk, *args, **kwargs):
+        job = ReceiptJob.objects.select_related('receipt').filter(pk=pk, created_by=request.user).first()
+        if job is None:
+            return Response({"error": f"Receipt job id - {pk} doesn't exists"}, status=404)
+        return Response(job_status(job), status=200)
+
+
+class ReceiptExtractionView(APIView):
+    """Raw OCR text and extraction payload of one of the user's receipts, kept out of every list query"""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk, *args, **kwargs):
+        receipt = Receipt.objects.filter(pk=pk, created_by=request.user).values('id', 'extracted_text', 'extracted_data').first()
+        if receipt is None:
+            return Response({"error": f"Receipt id - {pk} doesn't exists"}, status=404)
+        return Response(receipt, status=200)
+
 
-        # Return the structured data in the response
-        if structured_data:
-            return Response(structured_data, status=200)
+class ReceiptListView(APIView):
+    """The user's receipts by purchase time, newest first, for statements and date ranges"""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        receipts = Receipt.objects.for_list().filter(created_by=request.user)
+
+        month = request.query_params.get('month')
+        if month:
+            first_day = parse_date(f'{month}-01')
+            if first_day is None:
+                return Response({"error": "month must be YYYY-MM"}, status=400)
+            start, end = first_day, (first_day + timedelta(days=31)).replace(day=1)
         else:
-            return Response({"error": "Failed to parse GPT response."}, status=500)
-
-    def extract_text_from_local_image(self, image_path):
-        textract_client = boto3.client(
-            'textract',
-            aws_access_key_id=AWS_ACCESS_KEY_ID,
-            aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
-            region_name=AWS_REGION
-        )
-        with open(image_path, 'rb') as img_file:
-            img_bytes = img_file.read()
-
-        response = textract_client.detect_document_text(Document={'Bytes': img_bytes})
-
-        lines = [block['Text'] for block in response['Blocks'] if block['BlockType'] == 'LINE']
-        return '\n'.join(lines)
-
-    def categorize_receipt_with_gpt(self, extracted_text):
-        openai_client = OpenAI(api_key=OPENAI_API_KEY)
-
-        prompt = f"""
-        You are an AI specialized in extracting and categorizing receipt data and fixing any text that may be unclear due to light, scars, or other issues.
-        Fix unrelated and unreadable texts with your knowledge of what it should be. Always check unit price and total price correction.
-        Given the following receipt text, extract these fields as JSON: date, time, shop_name, address, payment_method, items (list), services (list), vat_percentage, vat_amount, subtotal, tax, discount, total_cost.
-        Receipt text:
-        \"\"\"{extracted_text}\"\"\"
-        Return only well-formed JSON. Do not add any explanation or text outside JSON.
-        """
-        response = openai_client.chat.completions.create(
-            model="gpt-4",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0,
-            max_tokens=1500,
-        )
-        return response.choices[0].message.content
+            start, end = None, None
+            for param in ('date_from', 'date_to'):
+                value = request.query_params.get(param)
+                if value and parse_date(value) is None:
+                    return Response({"error": f"{param} must be a date (YYYY-MM-DD)"}, status=400)
+            if request.query_params.get('date_from'):
+                start = parse_date(request.query_params['date_from'])
+            if request.query_params.get('date_to'):
+                end = parse_date(request.query_params['date_to']) + timedelta(days=1)
+
+        # Range over (created_by, purchased_at), day bounds taken in the current timezone
+        if start:
+            receipts = receipts.filter(purchased_at__gte=timezone.make_aware(datetime.combine(start, time.min)))
+        if end:
+            receipts = receipts.filter(purchased_at__lt=timezone.make_aware(datetime.combine(end, time.min)))
+        receipts = receipts.order_by(F('purchased_at').desc(nulls_last=True), '-id')
+
+        total_cost = receipts.aggregate(total=Sum('total_cost'))['total'] if start or end else None
+
+        pagination = get_pagination(request, keyset=False)
+        page = pagination.paginate_data(receipts.values(*RECEIPT_LIST_FIELDS))
+
+        response = {
+            'receipts': list(page),
+            'total_cost': round(total_cost, 2) if total_cost is not None else None,
+            'page': pagination.page,
+            'size': pagination.size,
+            'total_pages': pagination.total_pages,
+            'total_elements': pagination.total_elements,
+        }
+        return Response(response, status=200)
+
+
+class ReceiptSpendView(APIView):
+    """Spend of the user's receipts grouped by shop, product, category or month"""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        group_by = request.query_params.get('group_by', GROUP_CATEGORY)
+        if group_by not in GROUPS:
+            return Response({"error": f"group_by must be one of {', '.join(GROUPS)}"}, status=400)
+
+        dates = {}
+        for param in ('date_from', 'date_to'):
+            value = request.query_params.get(param)
+            dates[param] = parse_date(value) if value else None
+            if value and dates[param] is None:
+                return Response({"error": f"{param} must be a date (YYYY-MM-DD)"}, status=400)
 
-    def safe_parse_json(self, raw_json):
         try:
-            return json.loads(raw_json)
-        except json.JSONDecodeError as e:
-            print("JSON decode error:", e)
-            return None
\ No newline at end of file
+            limit = min(max(int(request.query_params.get('limit', DEFAULT_LIMIT)), 1), 500)
+        except ValueError:
+            return Response({"error": "limit must be a number"}, status=400)
+
+        summary = spend_summary(
+            request.user,
+            group_by=group_by,
+            start=dates['date_from'],
+            end=dates['date_to'],
+            product=request.query_params.get('product'),
+            shop=request.query_params.get('shop'),
+            category=request.query_params.get('category'),
+            limit=limit,
+        )
+        return Response(summary, status=200)
+
+
+class ClientStatsView(APIView):
+    """Construction and call timings of the shared Textract, OpenAI and Stripe clients of this process"""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        return Response(client_stats(), status=200)
+
+
+class DependencyStatsView(APIView):
+    """Bulkhead, circuit breaker and latency figures of the Textract and OpenAI calls of this process"""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        return Response(dependency_stats(), status=200)
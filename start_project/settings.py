@@ -44,6 +44,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'whitenoise.runserver_nostatic',  # For serving static files in development
 
     # 3rd party
@@ -306,6 +307,9 @@ INTERNAL_IPS = [
 
 
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
+# Point at `manage.py run_fake_dependencies` to drill slow or failing dependencies locally
+OPENAI_BASE_URL = os.getenv('OPENAI_BASE_URL')
+TEXTRACT_ENDPOINT_URL = os.getenv('TEXTRACT_ENDPOINT_URL')
 
 # Stripe settings
 STRIPE_PUBLIC_KEY = os.getenv('STRIPE_PUBLIC_KEY')
@@ -12,6 +12,21 @@ class TaskCategoryAdmin(admin.ModelAdmin):
 class TaskAdmin(admin.ModelAdmin):
     list_display = [field.name for field in Task._meta.fields]
 
+# Register TaskOccurrenceException model
+@admin.register(TaskOccurrenceException)
+class TaskOccurrenceExceptionAdmin(admin.ModelAdmin):
+    list_display = [field.name for field in TaskOccurrenceException._meta.fields]
+
+# Register TaskTombstone model
+@admin.register(TaskTombstone)
+class TaskTombstoneAdmin(admin.ModelAdmin):
+    list_display = [field.name for field in TaskTombstone._meta.fields]
+
+# Register TaskDailyStat model
+@admin.register(TaskDailyStat)
+class TaskDailyStatAdmin(admin.ModelAdmin):
+    list_display = [field.name for field in TaskDailyStat._meta.fields]
+
 # Register TaskBatch model
 @admin.register(TaskBatch)
 class TaskBatchAdmin(admin.ModelAdmin):
@@ -34,4 +49,9 @@ class RecipeAdmin(admin.ModelAdmin):
     
 @admin.register(Receipt)
 class ReceiptAdmin(admin.ModelAdmin):
-    list_display = [field.name for field in Receipt._meta.fields]
\ No newline at end of file
+    list_display = [field.name for field in Receipt._meta.fields]
+
+# Register ReceiptItem model
+@admin.register(ReceiptItem)
+class ReceiptItemAdmin(admin.ModelAdmin):
+    list_display = [field.name for field in ReceiptItem._meta.fields]
@@ -0,0 +1,175 @@
+"""Streamed AI task generation.
+
+The completion is requested with ``stream=True`` and its text fed to a
+``JSONArrayStream``, so each task (with its optional recipe) is validated, saved and sent to
+the client as soon as its closing brace arrives instead of after the whole completion.
+"""
+import json
+import uuid
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from authentication.models import Child, Partner
+from commons import clients, resilience
+from commons.json_stream import JSONArrayStream
+from commons.streaming import sse_event
+from task.generation import cached_generation, remember_generation
+from task.models import Recipe, Task, TaskBatch, TaskCategory
+from task.serializers import TaskBatchItemSerializer, TaskListSerializer
+
+
+GENERATION_MODEL = getattr(settings, 'TASK_GENERATION_MODEL', 'gpt-4o-mini')
+MAX_GENERATED_TASKS = getattr(settings, 'TASK_BATCH_MAX_TASKS', 500)
+
+SYSTEM_PROMPT = """You plan tasks for a family. Answer with JSON only, shaped as {{"tasks": [...]}}.
+Each task has: task_name, description, scheduled_date (YYYY-MM-DD), scheduled_time (HH:MM or null),
+duration_minutes, assigned_to_type (self, partner, child or family), assigned_partner (id or null),
+assigned_child (id or null), priority (low, medium, high or urgent), category, is_recurring,
+recurrence_pattern (daily, weekly, monthly or null) and, for meals only, recipe: {{name, meal_type
+(breakfast, brunch, lunch, dinner or snack), items_available, items_needed, instructions,
+cooking_time_minutes, servings, kid_friendly_tip, serving_suggestion}}.
+Today is {today}. Partners: {partners}. Children: {children}."""
+
+RECIPE_FIELDS = [
+    'name', 'meal_type', 'items_available', 'items_needed', 'instructions', 'cooking_time_minutes', 'servings',
+    'kid_friendly_tip', 'serving_suggestion',
+]
+
+
+def _completion_text(prompt, partners, children):
+    """Yield the text deltas of a streamed completion"""
+    system = SYSTEM_PROMPT.format(
+        today=timezone.localdate().isoformat(),
+        partners=json.dumps([{'id': partner.id, 'name': partner.name} for partner in partners.values()]),
+        children=json.dumps([{'id': child.id, 'name': child.name} for child in children.values()]),
+    )
+
+    # Runs inside the request: the slot is held and the request budget enforced until the
+    # last chunk, a stalled stream would otherwise pin the worker past gunicorn's timeout
+    with resilience.slot(clients.OPENAI, timeout=resilience.REQUEST_BUDGET_SECONDS) as deadline:
+        # Times the wait for the response headers, the tokens arrive afterwards
+        with clients.timed(clients.OPENAI):
+            stream = clients.openai_client().with_options(timeout=deadline.remaining()).chat.completions.create(
+                model=GENERATION_MODEL,
+                messages=[{'role': 'system', 'content': system}, {'role': 'user', 'content': prompt}],
+                response_format={'type': 'json_object'},
+                temperature=0.2,
+                stream=True,
+            )
+        with stream:
+            for chunk in stream:
+                deadline.check()
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+
+
+class _TaskWriter:
+    """Saves generated items one by one into a batch, foreign keys resolved from preloaded rows"""
+
+    def __init__(self, user, batch, partners, children):
+        self.user = user
+        self.batch = batch
+        self.partners = partners
+        self.children = children
+        self.categories = {category.name.casefold(): category for category in TaskCategory.objects.filter(created_by=user)}
+        self.task_ids = []
+        self.raw_items = []
+
+    def save(self, raw):
+        serializer = TaskBatchItemSerializer(data=raw)
+        if not serializer.is_valid():
+            return None, serializer.errors
+        item = serializer.validated_data
+
+        with transaction.atomic():
+            task = Task.objects.create(
+                task_name=item['task_name'],
+                description=item.get('description'),
+                scheduled_date=item['scheduled_date'],
+                scheduled_time=item.get('scheduled_time'),
+                duration_minutes=item.get('duration_minutes'),
+                assigned_to_type=item['assigned_to_type'],
+                priority=item['priority'],
+                # Ids the model made up are dropped rather than failing the task
+                assigned_partner=self.partners.get(item.get('assigned_partner')),
+                assigned_child=self.children.get(item.get('assigned_child')),
+                task_category=self.categories.get((item.get('category') or '').casefold()),
+                is_recurring=item['is_recurring'],
+                recurrence_pattern=item.get('recurrence_pattern') or None,
+                created_by=self.user,
+                generated_by_ai=True,
+                ai_session_id=self.batch.batch_id,
+                batch=self.batch,
+                raw_ai_response=raw,
+            )
+            recipe = raw.get('recipe')
+            if isinstance(recipe, dict) and recipe.get('name'):
+                self._save_recipe(task, recipe)
+
+        self.task_ids.append(task.id)
+        self.raw_items.append(raw)
+        return task, None
+
+    def _save_recipe(self, task, recipe):
+        values = {field: recipe.get(field) for field in RECIPE_FIELDS if recipe.get(field) not in (None, '')}
+        if values.get('meal_type') not in dict(Recipe.MEAL_TYPES):
+            values['meal_type'] = 'dinner'
+        for field in ('items_available', 'items_needed', 'instructions'):
+            if isinstance(values.get(field), list):
+                values[field] = '\n'.join(str(value) for value in values[field])
+        values.setdefault('items_available', '')
+        values.setdefault('instructions', '')
+        Recipe.objects.create(task=task, ai_generated=True, created_by=self.user, **values)
+
+
+def stream_task_generation(user, prompt):
+    """Yield server-sent events while tasks for ``prompt`` are generated and saved.
+
+    Events: ``batch`` once with the batch id, ``task`` per saved task, ``invalid`` per item
+    failing validation, ``error`` when the completion breaks off and ``done`` at the end.
+    A prompt answered earlier today for the same family replays the stored items without
+    calling the model.
+    """
+    partners = Partner.objects.filter(user=user).in_bulk()
+    children = Child.objects.filter(user=user).in_bulk()
+    batch = TaskBatch.objects.create(
+        batch_id=uuid.uuid4().hex,
+        created_by=user,
+        ai_prompt=prompt,
+        total_tasks=0,
+        generated_at=timezone.now(),
+    )
+    writer = _TaskWriter(user, batch, partners, children)
+    yield sse_event('batch', {'batch_id': batch.batch_id})
+
+    cached = cached_generation(user, prompt)
+    parser = JSONArrayStream()
+    chunks = [json.dumps(cached)] if cached is not None else _completion_text(prompt, partners, children)
+    try:
+        for chunk in chunks:
+            for raw in parser.feed(chunk):
+                if len(writer.task_ids) >= MAX_GENERATED_TASKS:
+                    break
+                task, errors = writer.save(raw if isinstance(raw, dict) else {})
+                if task is None:
+                    yield sse_event('invalid', {'item': raw, 'errors': errors})
+                else:
+                    yield sse_event('task', TaskListSerializer(task).data)
+            if len(writer.task_ids) >= MAX_GENERATED_TASKS:
+                # Stop reading, and paying for, the rest of the completion
+                break
+    except Exception as e:
+        yield sse_event('error', {'detail': str(e)})
+    finally:
+        # Closes the completion stream, also when the client went away mid-stream
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+    batch.total_tasks = len(writer.task_ids)
+    batch.save(update_fields=['total_tasks', 'updated_at'])
+    if cached is None and writer.raw_items:
+        remember_generation(user, prompt, writer.raw_items)
+
+    yield sse_event('done', {'batch_id': batch.batch_id, 'task_ids': writer.task_ids, 'cached': cached is not None})
@@ -0,0 +1,135 @@
+"""Greedy placement of tasks into a family's free time.
+
+Tasks are taken by priority (then date, longest first) and each one goes into the first
+gap of its day, or a later day, where its member and the whole family are free inside the
+working window. Timed tasks that don't collide keep their slot, the rest are moved. Busy
+time is kept as sorted, merged blocks per member and day, so placing a task costs one
+bisect plus a walk over that day's blocks. Nothing calls out to the LLM.
+"""
+import heapq
+from bisect import insort
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from task.models import Task, TaskQuerySet
+from task.recurrence import invalidate_user_occurrences
+from task.scheduling import (
+    DEFAULT_DURATION_MINUTES, MAX_SEARCH_DAYS, MEMBER_FAMILY, MINUTES_PER_DAY, WORKDAY_END, WORKDAY_START,
+    day_schedule, invalidate_user_schedule, member_key, to_minutes, to_time,
+)
+
+
+class _Calendar:
+    """Busy blocks per (day, member), loaded from the cached day schedule on first use"""
+
+    def __init__(self, user, excluded_ids):
+        self.user = user
+        self.excluded_ids = excluded_ids
+        self.days = {}
+
+    def _day(self, day):
+        if day not in self.days:
+            self.days[day] = {
+                member: sorted(interval[:2] for interval in index.intervals if interval[2] not in self.excluded_ids)
+                for member, index in day_schedule(self.user, day).items()
+            }
+        return self.days[day]
+
+    def blocks(self, day, member):
+        members = self._day(day)
+        if member == MEMBER_FAMILY:
+            return heapq.merge(*members.values())
+        return heapq.merge(members.get(member, []), members.get(MEMBER_FAMILY, []))
+
+    def is_free(self, day, member, start, end):
+        return all(block_end <= start or block_start >= end for block_start, block_end in self.blocks(day, member))
+
+    def first_fit(self, day, member, duration, window_start, window_end):
+        cursor = window_start
+        for block_start, block_end in self.blocks(day, member):
+            if block_start >= window_end:
+                break
+            if block_start - cursor >= duration:
+                break
+            cursor = max(cursor, block_end)
+        return cursor if cursor + duration <= window_end else None
+
+    def reserve(self, day, member, start, end):
+        insort(self._day(day).setdefault(member, []), (start, end))
+
+
+def _placement_order(task):
+    return (-task.priority_rank, task.scheduled_date, -(task.duration_minutes or DEFAULT_DURATION_MINUTES), task.id)
+
+
+def auto_schedule(user, tasks, start_day=None, day_start=None, day_end=None, max_days=MAX_SEARCH_DAYS, commit=True):
+    """Give every task in ``tasks`` a free date and time, returns ``(placed, unplaced)``.
+
+    ``placed`` holds ``(task, moved)`` pairs, ``moved`` being False for timed tasks that
+    kept their slot. Tasks are never placed before ``start_day`` (today by default), before
+    now, or before their own scheduled date. With ``commit`` the new slots are written with
+    one ``bulk_update``, otherwise the tasks are only changed in memory.
+    """
+    now = timezone.localtime().replace(tzinfo=None)
+    start_day = max(start_day or now.date(), now.date())
+    window_start = to_minutes(day_start or WORKDAY_START)
+    window_end = to_minutes(day_end or WORKDAY_END) or MINUTES_PER_DAY
+
+    tasks = sorted(
+        (task for task in tasks if not task.is_recurring and task.status in TaskQuerySet.OPEN_STATUSES),
+        key=_placement_order,
+    )
+    calendar = _Calendar(user, {task.id for task in tasks})
+
+    def earliest(day):
+        if day == now.date():
+            return max(window_start, to_minutes(now) + 1)
+        return window_start
+
+    placed, pending, unplaced = [], [], []
+
+    # Timed tasks that still fit where they are stay there
+    for task in tasks:
+        duration = task.duration_minutes or DEFAULT_DURATION_MINUTES
+        if task.scheduled_time is not None and task.scheduled_date >= start_day:
+            start = to_minutes(task.scheduled_time)
+            end = min(start + duration, MINUTES_PER_DAY)
+            in_future = task.scheduled_date > now.date() or start > to_minutes(now)
+            if in_future and calendar.is_free(task.scheduled_date, member_key(task), start, end):
+                calendar.reserve(task.scheduled_date, member_key(task), start, end)
+                placed.append((task, False))
+                continue
+        pending.append(task)
+
+    for task in pending:
+        duration = task.duration_minutes or DEFAULT_DURATION_MINUTES
+        member = member_key(task)
+        first_day = max(task.scheduled_date, start_day)
+        for offset in range(max_days):
+            day = first_day + timedelta(days=offset)
+            start = calendar.first_fit(day, member, duration, earliest(day), window_end)
+            if start is not None:
+                calendar.reserve(day, member, start, start + duration)
+                task.scheduled_date, task.scheduled_time = day, to_time(start)
+                if task.status == 'overdue':
+                    # Placed in the future, so it is due again
+                    task.status = 'pending'
+                placed.append((task, True))
+                break
+        else:
+            unplaced.append(task)
+
+    moved = [task for task, was_moved in placed if was_moved]
+    if commit and moved:
+        updated_at = timezone.now()
+        for task in moved:
+            task.updated_at = updated_at
+        with transaction.atomic():
+            Task.objects.bulk_update(moved, ['scheduled_date', 'scheduled_time', 'status', 'updated_at'])
+        # bulk_update skips post_save
+        invalidate_user_occurrences(user.id)
+        invalidate_user_schedule(user.id)
+
+    return placed, unplaced
@@ -0,0 +1,138 @@
+"""Bulk task mutations.
+
+Each operation turns into one set-based ``UPDATE`` or ``DELETE`` over the ids it names,
+all of them inside one transaction. Updates go through ``TaskQuerySet.update`` so the daily
+rollup follows, and set ``updated_at`` so the change feed picks the rows up. Deletes write
+tombstones and rollup deltas for the whole set at once instead of per row signals.
+"""
+from datetime import timedelta
+
+from django.db import connections, models, transaction
+from django.db.models import Case, DateField, ExpressionWrapper, F, Value, When
+from django.utils import timezone
+from rest_framework.serializers import ValidationError
+
+from authentication.models import Child, Partner, User
+from task.models import Task, TaskDailyStat, TaskTombstone, TASK_ROLLUP_FIELDS, rollup_deltas
+from task.recurrence import invalidate_user_occurrences
+from task.scheduling import invalidate_user_schedule
+from task.serializers import TaskBulkOperationSerializer as Op
+
+
+RESULT_UPDATED = 'updated'
+RESULT_DELETED = 'deleted'
+RESULT_NOT_FOUND = 'not_found'
+
+
+def _status_values(status, now):
+    # completed_at follows the status, reopening a task clears it
+    return {'status': status, 'completed_at': now if status == 'completed' else None}
+
+
+def _reassign_values(user, operation):
+    values = {'assigned_to_type': operation['assigned_to_type']}
+    errors = {}
+    for field, model, owner_field in (
+        ('assigned_partner', Partner, 'user'),
+        ('assigned_child', Child, 'user'),
+        ('assigned_user', User, None),
+    ):
+        pk = operation.get(field)
+        values[f'{field}_id'] = pk
+        if pk is None:
+            continue
+        queryset = model.objects.filter(pk=pk)
+        if owner_field:
+            queryset = queryset.filter(**{owner_field: user})
+        if not queryset.exists():
+            errors[field] = [f"{field} pk - {pk} doesn't exists"]
+    if errors:
+        raise ValidationError(errors)
+    return values
+
+
+def _update_values(user, operation, now):
+    op = operation['op']
+    if op == Op.OP_COMPLETE:
+        return _status_values('completed', now)
+    if op == Op.OP_STATUS:
+        return _status_values(operation['status'], now)
+    if op == Op.OP_RESCHEDULE:
+        if 'shift_days' in operation:
+            values = {'scheduled_date': ExpressionWrapper(
+                F('scheduled_date') + timedelta(days=operation['shift_days']), output_field=DateField(),
+            )}
+        else:
+            values = {'scheduled_date': operation['scheduled_date']}
+        if 'scheduled_time' in operation:
+            values['scheduled_time'] = operation['scheduled_time']
+        # A moved task is due again, the overdue sweep flags it anew if the new slot has passed too
+        values['status'] = Case(When(status='overdue', then=Value('pending')), default=F('status'))
+        return values
+    return _reassign_values(user, operation)
+
+
+def _delete_tasks(rows, user):
+    """Delete the locked ``(id, *rollup key)`` rows with one statement per table"""
+    ids = [row[0] for row in rows]
+    TaskTombstone.objects.bulk_create([TaskTombstone(task_id=pk, created_by=user) for pk in ids])
+    TaskDailyStat.objects.apply_deltas(rollup_deltas(removed=[row[1:] for row in rows]))
+
+    # Cascade by hand, a plain queryset delete would fetch every task to send per row signals
+    for relation in Task._meta.related_objects:
+        on_delete = getattr(relation, 'on_delete', None)
+        if on_delete is models.DO_NOTHING:
+            continue
+        if on_delete not in (models.CASCADE, models.SET_NULL):
+            name = getattr(on_delete, '__name__', on_delete)
+            raise NotImplementedError(f"Bulk delete doesn't handle {relation.related_model.__name__}.{relation.field.name} (on_delete={name})")
+        related = relation.related_model._base_manager.filter(**{f'{relation.field.name}__in': ids})
+        if on_delete is models.CASCADE:
+            related.delete()
+        else:
+            related.update(**{relation.field.name: None})
+
+    database = connections[Task.objects.db]
+    with database.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {database.ops.quote_name(Task._meta.db_table)} WHERE id = ANY(%s)', [ids])
+
+
+def apply_bulk_operations(user, operations):
+    """Apply validated ``TaskBulkSerializer`` operations to ``user``'s tasks, all or nothing.
+
+    Returns one ``{'op', 'id', 'result'}`` item per requested id, ``result`` being
+    'updated', 'deleted' or 'not_found' (unknown, someone else's, or deleted by an earlier
+    operation of the same request). Raises ``ValidationError`` for unknown assignees.
+    """
+    now = timezone.now()
+    # Resolve assignees before taking any lock
+    values = [None if operation['op'] == Op.OP_DELETE else _update_values(user, operation, now) for operation in operations]
+
+    results = []
+    with transaction.atomic():
+        for operation, update in zip(operations, values):
+            ids = list(dict.fromkeys(operation['ids']))
+            tasks = Task.objects.filter(created_by=user, pk__in=ids)
+
+            if update is None:
+                rows = list(tasks.order_by('pk').select_for_update().values_list('id', *TASK_ROLLUP_FIELDS))
+                if rows:
+                    _delete_tasks(rows, user)
+                found = {row[0] for row in rows}
+                result = RESULT_DELETED
+            else:
+                found = set(tasks.order_by('pk').select_for_update().values_list('id', flat=True))
+                if found:
+                    Task.objects.filter(pk__in=found).update(**update, updated_at=now)
+                result = RESULT_UPDATED
+
+            results.extend(
+                {'op': operation['op'], 'id': pk, 'result': result if pk in found else RESULT_NOT_FOUND}
+                for pk in ids
+            )
+
+    # update() and raw deletes skip the Task signals
+    invalidate_user_occurrences(user.id)
+    invalidate_user_schedule(user.id)
+
+    return results
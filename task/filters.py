@@ -1,8 +1,50 @@
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db.models import F
+
 from task.models import *
 from django_filters import rest_framework as filters
+
+
+class CharInFilter(filters.BaseInFilter, filters.CharFilter):
+    pass
+
+
 class TaskFilter(filters.FilterSet):
-    name = filters.CharFilter(field_name="name", lookup_expr='icontains')
+    """Task search, every filter narrows on a column leading one of the Task indexes.
+
+    Owner and category filters are plain ids so validating them costs no query,
+    ``status``/``priority`` take comma separated values and ``q`` runs a ranked full text
+    search over task_name and description.
+    """
+    q = filters.CharFilter(method='filter_text')
+    # Kept for older clients, same as q without ranking
+    name = filters.CharFilter(field_name="task_name", lookup_expr='icontains')
+
+    status = CharInFilter(field_name="status", lookup_expr='in')
+    priority = CharInFilter(field_name="priority", lookup_expr='in')
+    assigned_to_type = filters.ChoiceFilter(field_name="assigned_to_type", choices=Task.ASSIGNED_TO_CHOICES)
+    assigned_user = filters.NumberFilter(field_name="assigned_user_id")
+    assigned_partner = filters.NumberFilter(field_name="assigned_partner_id")
+    assigned_child = filters.NumberFilter(field_name="assigned_child_id")
+    created_by = filters.NumberFilter(field_name="created_by_id")
+    task_category = filters.NumberFilter(field_name="task_category_id")
+    generated_by_ai = filters.BooleanFilter(field_name="generated_by_ai")
+    date_from = filters.DateFilter(field_name="scheduled_date", lookup_expr='gte')
+    date_to = filters.DateFilter(field_name="scheduled_date", lookup_expr='lte')
+    # Needs a queryset annotated with Task.objects.with_overdue()
+    overdue = filters.BooleanFilter(field_name="overdue")
 
     class Meta:
         model = Task
-        fields = ['name', ]
\ No newline at end of file
+        fields = [
+            'q', 'name', 'status', 'priority', 'assigned_to_type', 'assigned_user', 'assigned_partner',
+            'assigned_child', 'created_by', 'task_category', 'generated_by_ai', 'date_from', 'date_to', 'overdue',
+        ]
+
+    def filter_text(self, queryset, name, value):
+        query = SearchQuery(value, config=TASK_SEARCH_CONFIG, search_type='websearch')
+        return (
+            queryset.filter(search_vector=query)
+            .annotate(rank=SearchRank(F('search_vector'), query))
+            .order_by('-rank', 'scheduled_date', 'id')
+        )
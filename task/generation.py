@@ -0,0 +1,37 @@
+"""Reuse of earlier AI task generations for repeated prompts.
+
+Generated batches are remembered under the normalized prompt plus the family context
+(members and the current day, since plans are relative to it), so a client about to ask
+the LLM for "plan my week" again can get the stored tasks back instead.
+"""
+from django.conf import settings
+from django.utils import timezone
+
+from authentication.models import Child, Partner
+from commons.generation_cache import GenerationCache
+
+
+TASK_GENERATION_CACHE = GenerationCache(
+    'tasks',
+    max_entries=getattr(settings, 'TASK_GENERATION_CACHE_MAX_ENTRIES', 1024),
+    ttl=getattr(settings, 'TASK_GENERATION_CACHE_TTL_SECONDS', 60 * 60 * 6),
+)
+
+
+def family_context(user, day=None):
+    return {
+        'user': user.id,
+        'partners': sorted(Partner.objects.filter(user=user).values_list('id', 'name')),
+        'children': sorted(Child.objects.filter(user=user).values_list('id', 'name')),
+        'day': (day or timezone.localdate()).isoformat(),
+    }
+
+
+def remember_generation(user, prompt, tasks):
+    if prompt and tasks:
+        TASK_GENERATION_CACHE.set(TASK_GENERATION_CACHE.key(prompt, family_context(user)), tasks)
+
+
+def cached_generation(user, prompt):
+    """Tasks generated earlier today for the same prompt and family, or None"""
+    return TASK_GENERATION_CACHE.get(TASK_GENERATION_CACHE.key(prompt, family_context(user)))
@@ -0,0 +1,110 @@
+import uuid
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework.serializers import ValidationError
+
+from authentication.models import Child, Partner
+from task.models import Task, TaskBatch, TaskCategory
+from task.recurrence import invalidate_user_occurrences
+from task.scheduling import invalidate_schedule_days, invalidate_user_schedule
+
+
+def _resolve_ids(model, ids, user, owner_field):
+    """Fetch every referenced row of one model with a single query, limited to the user's own rows"""
+    ids = {pk for pk in ids if pk is not None}
+    if not ids:
+        return {}
+    return model.objects.filter(**{owner_field: user}).in_bulk(ids)
+
+
+def _duplicate_batch(batch_id):
+    return ValidationError({'batch_id': [f"Batch {batch_id} already exists"]})
+
+
+def ingest_task_batch(user, data, raw_tasks=None):
+    """Create a TaskBatch and all of its tasks in one transaction.
+
+    ``data`` is the validated ``TaskBatchIngestSerializer`` payload and ``raw_tasks`` the
+    untouched task objects of the AI response, stored on each task as ``raw_ai_response``.
+    Foreign keys are resolved with one query per model and the tasks are written with a
+    single ``bulk_create``, so a batch costs a handful of queries whatever its size.
+    Raises ``ValidationError`` with per-task errors when a reference can't be resolved.
+    """
+    items = data['tasks']
+    if not isinstance(raw_tasks, list) or len(raw_tasks) != len(items):
+        raw_tasks = [None] * len(items)
+
+    partners = _resolve_ids(Partner, (item.get('assigned_partner') for item in items), user, 'user')
+    children = _resolve_ids(Child, (item.get('assigned_child') for item in items), user, 'user')
+    categories = _resolve_ids(TaskCategory, (item.get('task_category') for item in items), user, 'created_by')
+
+    category_names = {item['category'] for item in items if item.get('category') and not item.get('task_category')}
+    categories_by_name = {}
+    if category_names:
+        for category in TaskCategory.objects.filter(created_by=user, name__in=category_names):
+            categories_by_name.setdefault(category.name, category)
+
+    errors = {}
+    for index, item in enumerate(items):
+        item_errors = {}
+        for field, resolved in (('assigned_partner', partners), ('assigned_child', children), ('task_category', categories)):
+            pk = item.get(field)
+            if pk is not None and pk not in resolved:
+                item_errors[field] = [f"{field} pk - {pk} doesn't exists"]
+        if item_errors:
+            errors[index] = item_errors
+    if errors:
+        raise ValidationError({'tasks': errors})
+
+    if data.get('batch_id') and TaskBatch.objects.filter(batch_id=data['batch_id']).exists():
+        raise _duplicate_batch(data['batch_id'])
+
+    with transaction.atomic():
+        try:
+            with transaction.atomic():
+                batch = TaskBatch.objects.create(
+                    batch_id=data.get('batch_id') or uuid.uuid4().hex,
+                    created_by=user,
+                    ai_prompt=data.get('ai_prompt', ''),
+                    total_tasks=len(items),
+                    generated_at=data.get('generated_at') or timezone.now(),
+                )
+        except IntegrityError:
+            # A concurrent request with the same batch_id got past the check above first
+            if data.get('batch_id') and TaskBatch.objects.filter(batch_id=data['batch_id']).exists():
+                raise _duplicate_batch(data['batch_id'])
+            raise
+
+        tasks = [
+            Task(
+                task_name=item['task_name'],
+                description=item.get('description'),
+                scheduled_date=item['scheduled_date'],
+                scheduled_time=item.get('scheduled_time'),
+                duration_minutes=item.get('duration_minutes'),
+                assigned_to_type=item['assigned_to_type'],
+                priority=item['priority'],
+                assigned_partner=partners.get(item.get('assigned_partner')),
+                assigned_child=children.get(item.get('assigned_child')),
+                task_category=categories.get(item.get('task_category')) or categories_by_name.get(item.get('category')),
+                is_recurring=item['is_recurring'],
+                recurrence_pattern=item.get('recurrence_pattern') or None,
+                created_by=user,
+                generated_by_ai=True,
+                ai_session_id=batch.batch_id,
+                batch=batch,
+                raw_ai_response=raw,
+            )
+            for item, raw in zip(items, raw_tasks)
+        ]
+        tasks = Task.objects.bulk_create(tasks)
+
+    # bulk_create skips post_save, keep the occurrence and schedule caches in step by hand
+    invalidate_user_occurrences(user.id)
+    if any(task.is_recurring for task in tasks):
+        invalidate_user_schedule(user.id)
+    else:
+        invalidate_schedule_days(user.id, {task.scheduled_date for task in tasks})
+
+    return batch, [task.id for task in tasks]
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from task.sync import prune_tombstones
+
+
+class Command(BaseCommand):
+    help = "Delete task tombstones older than TASK_TOMBSTONE_RETENTION_DAYS"
+
+    def handle(self, *args, **options):
+        deleted = prune_tombstones()
+        self.stdout.write(f"Deleted {deleted} tombstone(s)")
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from authentication.models import User
+from task.rollups import rebuild_task_rollups
+
+
+class Command(BaseCommand):
+    help = "Recompute the per-user daily task statistics from the task table"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, help="Only rebuild the statistics of this user id")
+
+    def handle(self, *args, **options):
+        user = User.objects.get(pk=options['user']) if options['user'] else None
+        rows = rebuild_task_rollups(user=user)
+        self.stdout.write(f"Rebuilt {rows} task statistic row(s)")
@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from task.reminders import ReminderDispatcher
+
+
+class Command(BaseCommand):
+    help = "Send reminders shortly before tasks start, runs until stopped"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tick', type=float, default=5, help="Longest sleep between two iterations, in seconds")
+        parser.add_argument('--once', action='store_true', help="Run a single iteration and exit")
+
+    def handle(self, *args, **options):
+        dispatcher = ReminderDispatcher()
+
+        while True:
+            fired = dispatcher.tick()
+            if fired:
+                self.stdout.write(f"Sent {len(fired)} reminder(s), {len(dispatcher)} pending")
+
+            if options['once']:
+                break
+
+            # Sleep until the next reminder is due, but wake up every tick to apply task edits
+            next_fire_at = dispatcher.next_fire_at()
+            delay = options['tick']
+            if next_fire_at is not None:
+                delay = min(delay, max((next_fire_at - timezone.now()).total_seconds(), 0))
+            time.sleep(delay)
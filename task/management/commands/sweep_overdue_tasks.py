@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from task.overdue import SWEEP_CHUNK_SIZE, sweep_overdue_tasks
+
+
+class Command(BaseCommand):
+    help = "Mark pending tasks whose scheduled time has passed as overdue"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=SWEEP_CHUNK_SIZE, help="Rows updated per statement")
+        parser.add_argument('--interval', type=int, default=0, help="Repeat every N seconds instead of running once")
+
+    def handle(self, *args, **options):
+        while True:
+            moved = sweep_overdue_tasks(chunk_size=options['chunk_size'])
+            self.stdout.write(f"Marked {moved} task(s) as overdue")
+
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
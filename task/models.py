@@ -1,7 +1,15 @@
-from django.db import models
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
+from collections import Counter
+
+from django.db import connections, models, router, transaction
+from django.db.models import BooleanField, Case, PositiveSmallIntegerField, Q, Value, When
+from django.db.models.lookups import Exact
 from django.conf import settings
 from django.utils import timezone
 
+from commons.custom_model_field import CompressedJSONField, CompressedTextField
+
 
 class TaskCategory(models.Model):
     """Task categories for organization"""
@@ -26,6 +34,119 @@ class TaskCategory(models.Model):
         return f"{self.name} ({self.get_category_type_display()})"
 
 
+# Integer rank stored next to Task.priority so ordering by priority isn't alphabetical
+PRIORITY_RANKS = {
+    'low': 1,
+    'medium': 2,
+    'high': 3,
+    'urgent': 4,
+}
+DEFAULT_PRIORITY_RANK = PRIORITY_RANKS['medium']
+
+# Text search configuration of Task.search_vector, queries must use the same one
+TASK_SEARCH_CONFIG = 'english'
+
+
+# Columns a TaskDailyStat row is keyed on, in key order
+TASK_ROLLUP_FIELDS = ['created_by_id', 'scheduled_date', 'status', 'priority', 'assigned_to_type']
+# Names under which writes can change one of them
+TASK_ROLLUP_UPDATE_FIELDS = {'created_by', 'created_by_id', 'scheduled_date', 'status', 'priority', 'assigned_to_type'}
+
+
+def rollup_deltas(removed=(), added=()):
+    """Counter of TaskDailyStat changes for tasks leaving the ``removed`` keys and entering the ``added`` ones"""
+    deltas = Counter(tuple(key) for key in added)
+    deltas.subtract(tuple(key) for key in removed)
+    return deltas
+
+
+def priority_rank_for(priority):
+    """Rank of a priority value, or a CASE expression when the priority is itself an expression"""
+    if priority is None or isinstance(priority, str):
+        return PRIORITY_RANKS.get(priority, DEFAULT_PRIORITY_RANK)
+    return Case(
+        *[When(Exact(priority, Value(key)), then=Value(rank)) for key, rank in PRIORITY_RANKS.items()],
+        default=Value(DEFAULT_PRIORITY_RANK),
+        output_field=PositiveSmallIntegerField(),
+    )
+
+
+class TaskQuerySet(models.QuerySet):
+    """Task queries evaluated in the database instead of per instance in Python"""
+    OPEN_STATUSES = ['pending', 'in_progress', 'overdue']
+    # Large payloads list endpoints never show, read them through the detail endpoints
+    LIST_DEFERRED_FIELDS = ['raw_ai_response', 'search_vector']
+
+    def for_list(self):
+        return self.defer(*self.LIST_DEFERRED_FIELDS)
+
+    def overdue_condition(self, now=None):
+        """Open one-off tasks whose scheduled date and time (start of day when unset) lie before now.
+
+        Dates and times are stored in local time, so the comparison is split into a date and a
+        time part, which keeps it sargable on the (status, scheduled_date) index. A recurring
+        series is left out, its scheduled date is only its first occurrence and occurrences
+        inherit the series status.
+        """
+        now = timezone.localtime(now or timezone.now())
+        today = now.date()
+        return Q(status__in=self.OPEN_STATUSES, is_recurring=False) & (
+            Q(scheduled_date__lt=today)
+            | Q(scheduled_date=today, scheduled_time__isnull=True)
+            | Q(scheduled_date=today, scheduled_time__lt=now.time())
+        )
+
+    def with_overdue(self, now=None):
+        return self.annotate(overdue=Case(
+            When(self.overdue_condition(now), then=Value(True)),
+            default=Value(False),
+            output_field=BooleanField(),
+        ))
+
+    def overdue(self, now=None):
+        return self.filter(self.overdue_condition(now))
+
+    # Writes bypassing Task.save keep priority_rank in step with priority and the
+    # TaskDailyStat rollup in step with the rows, in the same transaction as the write
+
+    def update(self, **kwargs):
+        if 'priority' in kwargs and 'priority_rank' not in kwargs:
+            kwargs['priority_rank'] = priority_rank_for(kwargs['priority'])
+        if TASK_ROLLUP_UPDATE_FIELDS.isdisjoint(kwargs):
+            return super().update(**kwargs)
+
+        with transaction.atomic(using=self.db):
+            # Lock the matched rows so their keys can't move between the two reads
+            removed = list(self.order_by().select_for_update().values_list('id', *TASK_ROLLUP_FIELDS))
+            if not removed:
+                return 0
+            ids = [row[0] for row in removed]
+            updated = super(TaskQuerySet, self.model.objects.using(self.db).filter(pk__in=ids)).update(**kwargs)
+            added = self.model.objects.using(self.db).filter(pk__in=ids).values_list(*TASK_ROLLUP_FIELDS)
+            TaskDailyStat.objects.using(self.db).apply_deltas(rollup_deltas([row[1:] for row in removed], added))
+        return updated
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for obj in objs:
+            obj.priority_rank = priority_rank_for(obj.priority)
+        with transaction.atomic(using=self.db):
+            objs = super().bulk_create(objs, *args, **kwargs)
+            # Rows skipped by ignore_conflicts come back without a pk
+            added = [obj.rollup_key() for obj in objs if obj.pk is not None]
+            TaskDailyStat.objects.using(self.db).apply_deltas(rollup_deltas(added=added))
+        return objs
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        objs = list(objs)
+        if 'priority' in fields:
+            for obj in objs:
+                obj.priority_rank = priority_rank_for(obj.priority)
+            fields = [*fields, 'priority_rank']
+        # Django writes each batch through update() above, which already moves the rollup counts
+        return super().bulk_update(objs, fields, *args, **kwargs)
+
+
 class Task(models.Model):
     """Main task model based on AI response structure"""
     PRIORITY_CHOICES = [
@@ -66,6 +187,7 @@ class Task(models.Model):
     
     # Priority and status
     priority = models.CharField(max_length=20, choices=PRIORITY_CHOICES, default='medium')
+    priority_rank = models.PositiveSmallIntegerField(default=DEFAULT_PRIORITY_RANK, editable=False)  # Derived from priority
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     
     # Family and ownership
@@ -78,7 +200,8 @@ class Task(models.Model):
     # AI and metadata
     generated_by_ai = models.BooleanField(default=False)
     ai_session_id = models.CharField(max_length=100, blank=True, null=True)
-    raw_ai_response = models.JSONField(blank=True, null=True)  # Store original AI JSON
+    batch = models.ForeignKey('TaskBatch', on_delete=models.SET_NULL, null=True, blank=True, related_name='tasks')
+    raw_ai_response = CompressedJSONField(blank=True, null=True)  # Store original AI JSON, zlib-compressed
     
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
@@ -88,13 +211,51 @@ class Task(models.Model):
     # Recurring task support
     is_recurring = models.BooleanField(default=False)
     recurrence_pattern = models.CharField(max_length=50, blank=True, null=True)  # daily, weekly, monthly
+
+    # Full text search over name and description, kept up to date by PostgreSQL on every write
+    search_vector = models.GeneratedField(
+        expression=(
+            SearchVector('task_name', weight='A', config=TASK_SEARCH_CONFIG)
+            + SearchVector('description', weight='B', config=TASK_SEARCH_CONFIG)
+        ),
+        output_field=SearchVectorField(),
+        db_persist=True,
+    )
+
+    objects = TaskQuerySet.as_manager()
     
     class Meta:
-        ordering = ['scheduled_date', 'scheduled_time', 'priority']
+        ordering = ['scheduled_date', 'scheduled_time', '-priority_rank']
         indexes = [
-            models.Index(fields=['scheduled_date', 'created_by']),
             models.Index(fields=['assigned_user', 'status']),
             models.Index(fields=['priority', 'scheduled_date']),
+            # Keyset pagination seeks on (scheduled_date, id)
+            models.Index(fields=['scheduled_date', 'id']),
+            # Overdue filters and the sweeper scan (status, scheduled_date)
+            models.Index(fields=['status', 'scheduled_date']),
+            # Change feed reads (created_by, updated_at, id) after a watermark
+            models.Index(fields=['created_by', 'updated_at', 'id']),
+            # The reminder worker polls every change after its watermark
+            models.Index(fields=['updated_at', 'id'], name='task_updated_idx'),
+            # Default ordering, on its own for date ranges and behind each owner column
+            models.Index(fields=['scheduled_date', 'scheduled_time', '-priority_rank'], name='task_schedule_idx'),
+            models.Index(fields=['created_by', 'scheduled_date', 'scheduled_time', '-priority_rank'], name='task_creator_schedule_idx'),
+            models.Index(fields=['assigned_user', 'scheduled_date', 'scheduled_time', '-priority_rank'], name='task_assignee_schedule_idx'),
+            models.Index(fields=['assigned_partner', 'scheduled_date'], name='task_partner_schedule_idx'),
+            models.Index(fields=['assigned_child', 'scheduled_date'], name='task_child_schedule_idx'),
+            models.Index(fields=['task_category', 'scheduled_date'], name='task_category_schedule_idx'),
+            GinIndex(fields=['search_vector'], name='task_search_vector_idx'),
+            # Open (not completed or cancelled) tasks are most of what's read and a small part of what's stored
+            models.Index(
+                fields=['created_by', 'scheduled_date', 'scheduled_time'],
+                condition=Q(status__in=TaskQuerySet.OPEN_STATUSES),
+                name='task_open_creator_idx',
+            ),
+            models.Index(
+                fields=['assigned_user', 'scheduled_date'],
+                condition=Q(status__in=TaskQuerySet.OPEN_STATUSES),
+                name='task_open_assignee_idx',
+            ),
         ]
     
     def __str__(self):
@@ -102,8 +263,8 @@ class Task(models.Model):
     
     @property
     def is_overdue(self):
-        """Check if task is overdue"""
-        if self.status == 'completed':
+        """Check if task is overdue, mirrors TaskQuerySet.overdue_condition for a single instance"""
+        if self.status not in TaskQuerySet.OPEN_STATUSES or self.is_recurring:
             return False
         
         now = timezone.now()
@@ -112,11 +273,142 @@ class Task(models.Model):
         
         return now > scheduled_datetime
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Schedule as loaded, lets the signals also invalidate the day a task moved away from
+        instance._loaded_schedule = (instance.__dict__.get('scheduled_date'), instance.__dict__.get('is_recurring'))
+        return instance
+
+    def rollup_key(self):
+        """Key of the TaskDailyStat row counting this task"""
+        return tuple(getattr(self, field) for field in TASK_ROLLUP_FIELDS)
+
+    def save(self, *args, **kwargs):
+        self.priority_rank = priority_rank_for(self.priority)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'priority' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'priority_rank'}
+
+        tracked = update_fields is None or not TASK_ROLLUP_UPDATE_FIELDS.isdisjoint(update_fields)
+        using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using):
+            previous = None
+            if tracked and not self._state.adding:
+                previous = Task.objects.using(using).select_for_update().filter(pk=self.pk).values_list(*TASK_ROLLUP_FIELDS).first()
+            super().save(*args, **kwargs)
+            if tracked:
+                TaskDailyStat.objects.using(using).apply_deltas(rollup_deltas([previous] if previous else [], [self.rollup_key()]))
+    
     def mark_completed(self):
         """Mark task as completed"""
         self.status = 'completed'
         self.completed_at = timezone.now()
-        self.save()
+        self.save(update_fields=['status', 'completed_at', 'updated_at'])
+
+
+class TaskTombstone(models.Model):
+    """Record of a deleted task so the change feed can report deletions"""
+    task_id = models.BigIntegerField()
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['deleted_at', 'id']
+        indexes = [
+            models.Index(fields=['created_by', 'deleted_at', 'id']),
+            models.Index(fields=['deleted_at'], name='task_tombstone_deleted_idx'),
+        ]
+
+    def __str__(self):
+        return f"Task {self.task_id} deleted at {self.deleted_at}"
+
+
+class TaskDailyStatQuerySet(models.QuerySet):
+
+    def apply_deltas(self, deltas):
+        """Add ``{rollup key: delta}`` to the counters with a single upsert.
+
+        Rows are written in key order so concurrent writers lock them in the same order.
+        """
+        rows = sorted((key, delta) for key, delta in deltas.items() if delta and key[0] is not None)
+        if not rows:
+            return
+
+        table = self.model._meta.db_table
+        values = ', '.join(['(%s, %s, %s, %s, %s, %s)'] * len(rows))
+        sql = (
+            f'INSERT INTO {table} (user_id, day, status, priority, assigned_to_type, count) VALUES {values} '
+            f'ON CONFLICT (user_id, day, status, priority, assigned_to_type) '
+            f'DO UPDATE SET count = {table}.count + EXCLUDED.count'
+        )
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(sql, [value for key, delta in rows for value in (*key, delta)])
+
+
+class TaskDailyStat(models.Model):
+    """Number of a user's tasks per scheduled day, status, priority and assignee type.
+
+    Maintained by every Task write path in the same transaction as the write, so
+    dashboards read O(days) rows instead of the tasks themselves.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    day = models.DateField()  # Task.scheduled_date
+    status = models.CharField(max_length=20, choices=Task.STATUS_CHOICES)
+    priority = models.CharField(max_length=20, choices=Task.PRIORITY_CHOICES)
+    assigned_to_type = models.CharField(max_length=20, choices=Task.ASSIGNED_TO_CHOICES)
+    count = models.IntegerField(default=0)
+
+    objects = TaskDailyStatQuerySet.as_manager()
+
+    class Meta:
+        ordering = ['day']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'day', 'status', 'priority', 'assigned_to_type'],
+                name='unique_task_daily_stat',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} {self.day} {self.status}/{self.priority}/{self.assigned_to_type}: {self.count}"
+
+
+class TaskOccurrenceException(models.Model):
+    """Override for a single occurrence of a recurring task, only stored when it differs from the series"""
+    ACTION_COMPLETED = 'completed'
+    ACTION_MOVED = 'moved'
+    ACTION_CANCELLED = 'cancelled'
+
+    ACTION_CHOICES = [
+        (ACTION_COMPLETED, 'Completed'),
+        (ACTION_MOVED, 'Moved'),
+        (ACTION_CANCELLED, 'Cancelled')
+    ]
+
+    task = models.ForeignKey(Task, on_delete=models.CASCADE, related_name='occurrence_exceptions')
+    occurrence_date = models.DateField()  # Date the occurrence originally fell on
+    action = models.CharField(max_length=20, choices=ACTION_CHOICES)
+
+    # Only set for moved occurrences
+    new_date = models.DateField(blank=True, null=True)
+    new_time = models.TimeField(blank=True, null=True)
+
+    completed_at = models.DateTimeField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['occurrence_date']
+        constraints = [
+            models.UniqueConstraint(fields=['task', 'occurrence_date'], name='unique_task_occurrence_exception'),
+        ]
+        indexes = [
+            models.Index(fields=['new_date']),
+        ]
+
+    def __str__(self):
+        return f"{self.task_id} - {self.occurrence_date} ({self.get_action_display()})"
 
 
 class TaskBatch(models.Model):
@@ -198,11 +490,27 @@ class Recipe(models.Model):
     def __str__(self):
         return f"{self.name} - {self.get_meal_type_display()}"
 
+class ReceiptQuerySet(models.QuerySet):
+    # OCR output and the raw extraction are only read through the extraction endpoint
+    LIST_DEFERRED_FIELDS = ['extracted_text', 'extracted_data']
+
+    def for_list(self):
+        return self.defer(*self.LIST_DEFERRED_FIELDS)
+
+    def processed(self):
+        return self.filter(processed_at__isnull=False, extracted_data__isnull=False)
+
+    def own_duplicates(self):
+        # Re-uploads of the owner's own receipt, their line items are counted on the original
+        return self.filter(duplicate_of__created_by=models.F('created_by'))
+
+
 class Receipt(models.Model):
     # Basic information from the receipt
     image = models.ImageField(upload_to='receipts/')
-    extracted_text = models.TextField(blank=True, null=True)
-    extracted_data = models.JSONField(blank=True, null=True)
+    extracted_text = CompressedTextField(blank=True, null=True)  # zlib-compressed
+    extracted_data = CompressedJSONField(blank=True, null=True)  # zlib-compressed
+    ocr_digest = models.CharField(max_length=64, blank=True, null=True)  # Full OCR response, see core.models.OcrResult
 
     # Detailed receipt information
     date = models.CharField(max_length=10, blank=True, null=True)  # e.g., 17-07-2025
@@ -223,6 +531,17 @@ class Receipt(models.Model):
     discount = models.FloatField(blank=True, null=True)
     total_cost = models.FloatField(blank=True, null=True)
 
+    purchased_at = models.DateTimeField(blank=True, null=True)  # Parsed from date and time, see core/purchase_dates.py
+
+    # Image fingerprints, see core/fingerprint.py
+    content_sha256 = models.CharField(max_length=64, blank=True, null=True)
+    phash = models.BigIntegerField(blank=True, null=True)  # Signed 64 bit difference hash
+    phash_band_0 = models.PositiveIntegerField(blank=True, null=True)
+    phash_band_1 = models.PositiveIntegerField(blank=True, null=True)
+    phash_band_2 = models.PositiveIntegerField(blank=True, null=True)
+    phash_band_3 = models.PositiveIntegerField(blank=True, null=True)
+    duplicate_of = models.ForeignKey('self', on_delete=models.SET_NULL, related_name='+', null=True, blank=True)  # Receipt the extraction was copied from
+
     # Timestamps for when the receipt was uploaded and processed
     uploaded_at = models.DateTimeField(auto_now_add=True)
     processed_at = models.DateTimeField(blank=True, null=True)
@@ -231,12 +550,71 @@ class Receipt(models.Model):
 
     created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete= models.SET_NULL, related_name="+", null=True, blank=True)
     updated_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete= models.SET_NULL, related_name="+", null=True, blank=True)
-    
+
+    objects = ReceiptQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Statements and date range filters of one user
+            models.Index(fields=['created_by', 'purchased_at'], name='receipt_user_purchased_idx'),
+            models.Index(fields=['content_sha256'], name='receipt_sha256_idx'),
+            # One index per band, near duplicates share at least one band with the upload
+            models.Index(fields=['created_by', 'phash_band_0'], name='receipt_phash_band_0_idx'),
+            models.Index(fields=['created_by', 'phash_band_1'], name='receipt_phash_band_1_idx'),
+            models.Index(fields=['created_by', 'phash_band_2'], name='receipt_phash_band_2_idx'),
+            models.Index(fields=['created_by', 'phash_band_3'], name='receipt_phash_band_3_idx'),
+        ]
+
     def __str__(self):
         return f"Receipt {self.id} - {self.shop_name} - {self.date}"
 
+    def set_fingerprint(self, fingerprint):
+        self.content_sha256 = fingerprint.sha256
+        self.phash = fingerprint.phash
+        self.phash_band_0, self.phash_band_1, self.phash_band_2, self.phash_band_3 = fingerprint.bands or [None] * 4
+
     def save(self, *args, **kwargs):
         if self.extracted_data:
             # Automatically set the processed_at field when the receipt is processed
             self.processed_at = self.processed_at or models.DateTimeField(auto_now_add=True).default
-        super().save(*args, **kwargs)
\ No newline at end of file
+        super().save(*args, **kwargs)
+
+class ReceiptItem(models.Model):
+    """One purchased item or service of a receipt, split out of ``Receipt.items`` for SQL aggregation"""
+    KIND_ITEM = 'item'
+    KIND_SERVICE = 'service'
+
+    KIND_CHOICES = [
+        (KIND_ITEM, 'Item'),
+        (KIND_SERVICE, 'Service')
+    ]
+
+    receipt = models.ForeignKey(Receipt, on_delete=models.CASCADE, related_name='line_items')
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES, default=KIND_ITEM)
+    position = models.PositiveSmallIntegerField(default=0)  # Order on the receipt
+
+    product_name = models.CharField(max_length=255)
+    product_key = models.CharField(max_length=255)  # Normalized name, e.g. "Milk 2L" and "MILK 2 L" share "milk"
+    category = models.CharField(max_length=100, blank=True, null=True)
+    quantity = models.FloatField(default=1)
+    unit_price = models.FloatField(blank=True, null=True)
+    line_total = models.FloatField(blank=True, null=True)
+
+    # Copied from the receipt so every analytics query stays on this table's indexes
+    shop_name = models.CharField(max_length=255, blank=True, null=True)
+    shop_key = models.CharField(max_length=255, blank=True, default='')
+    purchased_on = models.DateField()
+
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete= models.SET_NULL, related_name="+", null=True, blank=True)
+
+    class Meta:
+        ordering = ['receipt', 'position']
+        indexes = [
+            models.Index(fields=['created_by', 'purchased_on'], name='receipt_item_user_day_idx'),
+            models.Index(fields=['created_by', 'product_key', 'purchased_on'], name='receipt_item_product_idx'),
+            models.Index(fields=['created_by', 'shop_key', 'purchased_on'], name='receipt_item_shop_idx'),
+            models.Index(fields=['created_by', 'category', 'purchased_on'], name='receipt_item_category_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_name} x {self.quantity} - {self.line_total}"
@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.utils import timezone
+
+from task.models import Task
+
+
+SWEEP_CHUNK_SIZE = getattr(settings, 'TASK_OVERDUE_SWEEP_CHUNK_SIZE', 1000)
+
+
+def sweep_overdue_tasks(chunk_size=SWEEP_CHUNK_SIZE, now=None):
+    """Move pending tasks past their scheduled date and time to 'overdue'.
+
+    Chunks are picked by ``id IN (SELECT id ... LIMIT n)`` on the (status, scheduled_date)
+    index, so locks stay short. ``TaskQuerySet.update`` locks the chunk and reads the ids and
+    rollup keys of its rows to move the TaskDailyStat counts, at most ``chunk_size`` small
+    tuples at a time. Returns the number of tasks moved.
+    """
+    now = now or timezone.now()
+    total = 0
+
+    while True:
+        chunk = Task.objects.filter(status='pending').overdue(now).order_by().values('id')[:chunk_size]
+        updated = Task.objects.filter(id__in=chunk).update(status='overdue', updated_at=timezone.now())
+        total += updated
+        if updated < chunk_size:
+            return total
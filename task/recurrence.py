@@ -0,0 +1,205 @@
+"""Lazy expansion of recurring tasks.
+
+A recurring ``Task`` is stored once, its ``scheduled_date`` is the first occurrence and
+``recurrence_pattern`` describes the series, either one of the plain words ``daily``,
+``weekly``, ``monthly``, ``yearly`` or an RFC 5545 RRULE such as
+``FREQ=WEEKLY;INTERVAL=2;BYDAY=MO,WE;UNTIL=20251231``. Occurrences are generated on demand
+for a date window and per-occurrence overrides live in sparse ``TaskOccurrenceException``
+rows, so nothing is pre-inserted.
+"""
+from collections import defaultdict, namedtuple
+from datetime import datetime, timedelta
+from itertools import takewhile
+
+from dateutil.rrule import DAILY, MONTHLY, WEEKLY, YEARLY, rrule, rrulestr
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils import timezone
+
+from task.models import Task, TaskOccurrenceException
+
+
+SIMPLE_PATTERNS = {
+    'daily': DAILY,
+    'weekly': WEEKLY,
+    'monthly': MONTHLY,
+    'yearly': YEARLY,
+}
+
+CACHE_DAYS = getattr(settings, 'TASK_OCCURRENCE_CACHE_DAYS', 14)
+CACHE_TIMEOUT = getattr(settings, 'TASK_OCCURRENCE_CACHE_TIMEOUT', 60 * 15)
+CACHE_MAX_OCCURRENCES = getattr(settings, 'TASK_OCCURRENCE_CACHE_MAX_OCCURRENCES', 2000)
+
+
+Occurrence = namedtuple('Occurrence', [
+    'task', 'original_date', 'scheduled_date', 'scheduled_time', 'status', 'completed_at', 'is_exception',
+])
+
+
+def build_rule(task):
+    """Return a dateutil rule for a recurring task, None when it doesn't recur or can't be parsed"""
+    pattern = (task.recurrence_pattern or '').strip()
+    if not task.is_recurring or not pattern:
+        return None
+
+    dtstart = datetime.combine(task.scheduled_date, datetime.min.time())
+    frequency = SIMPLE_PATTERNS.get(pattern.lower())
+    if frequency is not None:
+        return rrule(frequency, dtstart=dtstart)
+
+    if not pattern.upper().startswith('RRULE:'):
+        pattern = 'RRULE:' + pattern
+    try:
+        return rrulestr(pattern, dtstart=dtstart)
+    except (ValueError, TypeError):
+        return None
+
+
+def iter_dates(task, start, end):
+    """Yield the original dates of ``task`` falling in [start, end], lazily"""
+    rule = build_rule(task)
+    if rule is None:
+        if start <= task.scheduled_date <= end:
+            yield task.scheduled_date
+        return
+
+    after = datetime.combine(start, datetime.min.time())
+    before = datetime.combine(end, datetime.min.time())
+    for dt in takewhile(lambda dt: dt <= before, rule.xafter(after, inc=True)):
+        yield dt.date()
+
+
+def expand_task(task, start, end, exceptions=None):
+    """Yield the occurrences of one task in [start, end] with its exceptions applied.
+
+    ``exceptions`` maps an original occurrence date to its ``TaskOccurrenceException``.
+    Occurrences moved into the window from outside it are yielded as well.
+    """
+    exceptions = exceptions or {}
+
+    for original_date in iter_dates(task, start, end):
+        exception = exceptions.get(original_date)
+        if exception is None:
+            yield Occurrence(task, original_date, original_date, task.scheduled_time, task.status, task.completed_at, False)
+            continue
+        occurrence = _apply_exception(task, exception)
+        if occurrence is not None and start <= occurrence.scheduled_date <= end:
+            yield occurrence
+
+    for original_date, exception in exceptions.items():
+        moved_in = (
+            exception.new_date is not None
+            and not start <= original_date <= end
+            and start <= exception.new_date <= end
+        )
+        if moved_in:
+            occurrence = _apply_exception(task, exception)
+            if occurrence is not None:
+                yield occurrence
+
+
+def _apply_exception(task, exception):
+    if exception.action == TaskOccurrenceException.ACTION_CANCELLED:
+        return None
+
+    if exception.action == TaskOccurrenceException.ACTION_COMPLETED:
+        status, completed_at = 'completed', exception.completed_at
+    elif task.is_recurring:
+        # The series status describes the whole series, a moved occurrence starts out pending
+        status, completed_at = 'pending', None
+    else:
+        status, completed_at = task.status, task.completed_at
+
+    return Occurrence(
+        task,
+        exception.occurrence_date,
+        exception.new_date or exception.occurrence_date,
+        exception.new_time or task.scheduled_time,
+        status,
+        completed_at,
+        True,
+    )
+
+
+def series_queryset(queryset, start, end):
+    """Narrow a task queryset to the rows that can produce an occurrence in [start, end]"""
+    moved_in = TaskOccurrenceException.objects.filter(new_date__range=(start, end)).values('task_id')
+    return queryset.filter(
+        Q(is_recurring=False, scheduled_date__range=(start, end))
+        | Q(is_recurring=True, scheduled_date__lte=end)
+        | Q(id__in=moved_in)
+    )
+
+
+def expand_queryset(queryset, start, end):
+    """Yield every occurrence of the tasks in ``queryset`` within [start, end].
+
+    Runs two queries, one for the candidate series and one for their exceptions in the
+    window, then expands each series lazily. Occurrences come out grouped per task,
+    callers wanting a timeline should sort them.
+    """
+    tasks = list(series_queryset(queryset, start, end))
+    if not tasks:
+        return
+
+    exceptions = defaultdict(dict)
+    rows = TaskOccurrenceException.objects.filter(
+        Q(occurrence_date__range=(start, end)) | Q(new_date__range=(start, end)),
+        task_id__in=[task.id for task in tasks],
+    )
+    for exception in rows:
+        exceptions[exception.task_id][exception.occurrence_date] = exception
+
+    for task in tasks:
+        yield from expand_task(task, start, end, exceptions.get(task.id))
+
+
+def occurrence_sort_key(occurrence):
+    return (occurrence.scheduled_date, occurrence.scheduled_time or datetime.min.time(), occurrence.task.id)
+
+
+def occurrences_between(queryset, start, end):
+    return sorted(expand_queryset(queryset, start, end), key=occurrence_sort_key)
+
+
+def _cache_version_key(user_id):
+    return f'task_occurrences_version:{user_id}'
+
+
+def invalidate_user_occurrences(user_id):
+    """Drop every cached window of a user by bumping its cache version"""
+    if user_id is None:
+        return
+    try:
+        cache.incr(_cache_version_key(user_id))
+    except ValueError:
+        cache.set(_cache_version_key(user_id), 1, None)
+
+
+def upcoming_occurrences(user, start=None, end=None):
+    """Occurrences of a user's tasks in [start, end] served from a bounded cache.
+
+    Only windows inside the next ``TASK_OCCURRENCE_CACHE_DAYS`` days holding at most
+    ``TASK_OCCURRENCE_CACHE_MAX_OCCURRENCES`` occurrences are materialised, the cache
+    stores occurrences as (task id, field values) so task rows are re-read in one query.
+    """
+    today = timezone.localdate()
+    start = start or today
+    end = end or today + timedelta(days=CACHE_DAYS)
+    queryset = Task.objects.for_list().filter(created_by=user)
+
+    if start < today or end > today + timedelta(days=CACHE_DAYS):
+        return occurrences_between(queryset, start, end)
+
+    version = cache.get(_cache_version_key(user.id), 0)
+    key = f'task_occurrences:{user.id}:{version}:{start.isoformat()}:{end.isoformat()}'
+    cached = cache.get(key)
+    if cached is not None:
+        tasks = Task.objects.for_list().in_bulk({row[0] for row in cached})
+        return [Occurrence(tasks[row[0]], *row[1:]) for row in cached if row[0] in tasks]
+
+    occurrences = occurrences_between(queryset, start, end)
+    if len(occurrences) <= CACHE_MAX_OCCURRENCES:
+        cache.set(key, [(occurrence.task.id, *occurrence[1:]) for occurrence in occurrences], CACHE_TIMEOUT)
+    return occurrences
@@ -0,0 +1,247 @@
+"""Reminders for upcoming task start times.
+
+``ReminderDispatcher`` keeps the reminders due in the next refill window in a min-heap.
+Each refill loads one more window of start times with a range scan over
+(scheduled_date, scheduled_time), at most ``TASK_REMINDER_MAX_PENDING`` of them, so
+memory stays bounded however many tasks are scheduled. Between refills, task edits are
+applied per changed task from the change hook (rows whose ``updated_at`` moved, plus
+tombstones), never by rescanning the table.
+
+Due reminders go to every sink listed in ``TASK_REMINDER_SINKS``. A sink is a class with a
+``send(reminders)`` method, e.g. a push adapter wrapping a provider SDK.
+"""
+import heapq
+import itertools
+import logging
+import queue
+from collections import defaultdict, namedtuple
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.mail import send_mass_mail
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from authentication.models import User
+from task.models import Task, TaskOccurrenceException, TaskQuerySet, TaskTombstone
+from task.recurrence import expand_queryset
+
+
+logger = logging.getLogger(__name__)
+
+LEAD_TIME = timedelta(minutes=getattr(settings, 'TASK_REMINDER_LEAD_MINUTES', 10))
+REFILL_WINDOW = timedelta(minutes=getattr(settings, 'TASK_REMINDER_WINDOW_MINUTES', 30))
+MAX_PENDING = getattr(settings, 'TASK_REMINDER_MAX_PENDING', 50000)
+CHANGE_SAFETY_MARGIN = timedelta(seconds=getattr(settings, 'TASK_REMINDER_CHANGE_MARGIN_SECONDS', 5))
+DEFAULT_SINKS = ['task.reminders.LogSink']
+
+
+Reminder = namedtuple('Reminder', ['fire_at', 'starts_at', 'task_id', 'occurrence_date', 'task_name', 'user_id'])
+
+
+def occurrence_start(occurrence):
+    return timezone.make_aware(datetime.combine(occurrence.scheduled_date, occurrence.scheduled_time))
+
+
+# Sinks
+
+class LogSink:
+    """Writes reminders to the ``task.reminders`` logger"""
+
+    def send(self, reminders):
+        for reminder in reminders:
+            logger.info('Reminder: task %s "%s" of user %s starts at %s', reminder.task_id, reminder.task_name, reminder.user_id, reminder.starts_at)
+
+
+class QueueSink:
+    """Puts reminders on an in-process queue, a stand-in for a message broker"""
+
+    def __init__(self, target=None):
+        self.queue = target if target is not None else queue.Queue()
+
+    def send(self, reminders):
+        for reminder in reminders:
+            self.queue.put(reminder)
+
+
+class EmailSink:
+    """Emails each reminder to the task owner, one connection per batch"""
+
+    def send(self, reminders):
+        emails = dict(User.objects.filter(id__in={reminder.user_id for reminder in reminders}).values_list('id', 'email'))
+        messages = [
+            (
+                f'Reminder: {reminder.task_name}',
+                f'"{reminder.task_name}" starts at {timezone.localtime(reminder.starts_at):%H:%M}.',
+                settings.DEFAULT_FROM_EMAIL,
+                [emails[reminder.user_id]],
+            )
+            for reminder in reminders
+            if emails.get(reminder.user_id)
+        ]
+        send_mass_mail(messages, fail_silently=False)
+
+
+def load_sinks():
+    return [import_string(path)() for path in getattr(settings, 'TASK_REMINDER_SINKS', DEFAULT_SINKS)]
+
+
+class ReminderDispatcher:
+    """Min-heap of pending reminders with lazy deletion.
+
+    The heap holds ``(fire_at, sequence, key)`` entries, ``key`` being
+    ``(task id, occurrence date)``. Replacing or dropping a reminder only updates
+    ``self.pending``, stale heap entries are skipped when they reach the top.
+    """
+
+    def __init__(self, sinks=None, lead_time=LEAD_TIME, window=REFILL_WINDOW, max_pending=MAX_PENDING):
+        self.sinks = load_sinks() if sinks is None else sinks
+        self.lead_time = lead_time
+        self.window = window
+        self.max_pending = max_pending
+
+        self.heap = []
+        self.pending = {}
+        self.keys_by_task = defaultdict(set)
+        self.sequence = itertools.count()
+        # Start time of the reminders already sent, so editing a task doesn't send them twice
+        self.sent = {}
+
+        # Start times up to loaded_until have been loaded
+        self.loaded_until = None
+        self.watermark = None
+
+    def __len__(self):
+        return len(self.pending)
+
+    # Heap bookkeeping
+
+    def _push(self, reminder):
+        key = (reminder.task_id, reminder.occurrence_date)
+        self.pending[key] = reminder
+        self.keys_by_task[reminder.task_id].add(key)
+        heapq.heappush(self.heap, (reminder.fire_at, next(self.sequence), key))
+        if len(self.heap) > 2 * len(self.pending) + 1000:
+            # Mostly stale entries left behind by edits, rebuild from the live reminders
+            self.heap = [(entry.fire_at, next(self.sequence), entry_key) for entry_key, entry in self.pending.items()]
+            heapq.heapify(self.heap)
+
+    def _drop_task(self, task_id):
+        for key in self.keys_by_task.pop(task_id, ()):
+            self.pending.pop(key, None)
+
+    def _reminders(self, tasks, start, end):
+        """Reminders of the open, timed occurrences of ``tasks`` starting in [start, end)"""
+        first_day, last_day = timezone.localdate(start), timezone.localdate(end)
+        for occurrence in expand_queryset(tasks, first_day, last_day):
+            if occurrence.scheduled_time is None or occurrence.status not in TaskQuerySet.OPEN_STATUSES:
+                continue
+            starts_at = occurrence_start(occurrence)
+            if start <= starts_at < end:
+                task = occurrence.task
+                yield Reminder(starts_at - self.lead_time, starts_at, task.id, occurrence.original_date, task.task_name, task.created_by_id)
+
+    @staticmethod
+    def _candidates():
+        return Task.objects.only(
+            'id', 'task_name', 'created_by_id', 'status', 'scheduled_date', 'scheduled_time', 'completed_at',
+            'is_recurring', 'recurrence_pattern',
+        ).filter(status__in=TaskQuerySet.OPEN_STATUSES, scheduled_time__isnull=False)
+
+    # Refill
+
+    def refill(self, now=None):
+        """Load the next window of start times, returns how many reminders were added"""
+        now = now or timezone.now()
+        start = max(self.loaded_until or now, now)
+        end = now + self.lead_time + self.window
+        if end <= start:
+            return 0
+
+        room = self.max_pending - len(self.pending)
+        reminders = sorted(self._reminders(self._candidates(), start, end))
+        if len(reminders) > room:
+            # Stop the window at the first start time that doesn't fit, the next refill resumes there
+            end = reminders[max(room, 0)].starts_at if room > 0 else start
+            reminders = [reminder for reminder in reminders if reminder.starts_at < end]
+
+        for reminder in reminders:
+            self._push(reminder)
+        self.loaded_until = end
+        return len(reminders)
+
+    # Change hook
+
+    def apply_changes(self, task_ids, now=None):
+        """Re-evaluate some tasks against the loaded window, deleted or closed tasks just drop out"""
+        now = now or timezone.now()
+        for task_id in task_ids:
+            self._drop_task(task_id)
+        if not task_ids or self.loaded_until is None:
+            return
+        tasks = self._candidates().filter(pk__in=task_ids)
+        for reminder in self._reminders(tasks, now, self.loaded_until):
+            if self.sent.get((reminder.task_id, reminder.occurrence_date)) != reminder.starts_at:
+                self._push(reminder)
+
+    def poll_changes(self, now=None):
+        """Apply the tasks, occurrence overrides and deletions changed since the last poll.
+
+        Reads overlap the previous poll by ``TASK_REMINDER_CHANGE_MARGIN_SECONDS`` so late
+        committing writes aren't missed, re-applying a change is harmless.
+        """
+        now = now or timezone.now()
+        since = (self.watermark or now) - CHANGE_SAFETY_MARGIN
+        self.watermark = now
+
+        changed = set(Task.objects.filter(updated_at__gte=since).order_by().values_list('id', flat=True))
+        changed.update(TaskOccurrenceException.objects.filter(updated_at__gte=since).values_list('task_id', flat=True))
+        changed.update(TaskTombstone.objects.filter(deleted_at__gte=since).values_list('task_id', flat=True))
+
+        self.apply_changes(changed, now)
+        return len(changed)
+
+    # Dispatch
+
+    def next_fire_at(self):
+        while self.heap and self.pending.get(self.heap[0][2]) is None:
+            heapq.heappop(self.heap)
+        return self.heap[0][0] if self.heap else None
+
+    def pop_due(self, now=None):
+        now = now or timezone.now()
+        due = []
+        while self.heap and self.heap[0][0] <= now:
+            fire_at, _, key = heapq.heappop(self.heap)
+            reminder = self.pending.get(key)
+            if reminder is None or reminder.fire_at != fire_at:
+                continue
+            del self.pending[key]
+            task_keys = self.keys_by_task[reminder.task_id]
+            task_keys.discard(key)
+            if not task_keys:
+                del self.keys_by_task[reminder.task_id]
+            self.sent[key] = reminder.starts_at
+            due.append(reminder)
+        if due:
+            self.sent = {key: starts_at for key, starts_at in self.sent.items() if starts_at >= now}
+        return due
+
+    def fire_due(self, now=None):
+        """Send every reminder due by ``now`` to all sinks, returns them"""
+        due = self.pop_due(now)
+        if due:
+            for sink in self.sinks:
+                try:
+                    sink.send(due)
+                except Exception:
+                    logger.exception('Reminder sink %s failed', type(sink).__name__)
+        return due
+
+    def tick(self, now=None):
+        """One worker iteration: apply changes, top up the window, fire what's due"""
+        now = now or timezone.now()
+        self.poll_changes(now)
+        if self.loaded_until is None or self.loaded_until - now < self.lead_time + self.window / 2:
+            self.refill(now)
+        return self.fire_due(now)
@@ -0,0 +1,92 @@
+"""Dashboard statistics read from the TaskDailyStat rollup.
+
+The rollup is kept current by the Task write paths (see ``TaskQuerySet``), nothing here
+reads the task table except ``rebuild_task_rollups``.
+"""
+from django.db import connection, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncMonth, TruncWeek
+
+from task.models import TASK_ROLLUP_FIELDS, Task, TaskDailyStat
+
+
+PERIOD_DAY = 'day'
+PERIOD_WEEK = 'week'
+PERIOD_MONTH = 'month'
+PERIODS = {
+    PERIOD_DAY: F('day'),
+    PERIOD_WEEK: TruncWeek('day'),
+    PERIOD_MONTH: TruncMonth('day'),
+}
+
+BREAKDOWNS = ('status', 'priority', 'assigned_to_type')
+
+
+def _empty_bucket():
+    return {'total': 0, **{f'by_{field}': {} for field in BREAKDOWNS}}
+
+
+def _add(bucket, row):
+    bucket['total'] += row['total']
+    for field in BREAKDOWNS:
+        counts = bucket[f'by_{field}']
+        counts[row[field]] = counts.get(row[field], 0) + row['total']
+
+
+def task_stats(user, start, end, period=PERIOD_DAY):
+    """Task counts of ``user`` scheduled between ``start`` and ``end`` (inclusive).
+
+    Returns the overall ``totals`` and a ``series`` with one bucket per day, week or month,
+    each holding a total and its breakdown by status, priority and assignee type.
+    """
+    rows = (
+        TaskDailyStat.objects.filter(user=user, day__range=(start, end))
+        .exclude(count=0)
+        .annotate(period=PERIODS.get(period, PERIODS[PERIOD_DAY]))
+        .values('period', *BREAKDOWNS)
+        .annotate(total=Sum('count'))
+        .order_by('period')
+    )
+
+    totals = _empty_bucket()
+    series = {}
+    for row in rows:
+        _add(totals, row)
+        _add(series.setdefault(row['period'], {'period': row['period'], **_empty_bucket()}), row)
+
+    return {'totals': totals, 'series': list(series.values())}
+
+
+def rebuild_task_rollups(user=None):
+    """Recompute the rollup from the task table, for one user or everyone.
+
+    For backfills and repairs. The rollup table is locked until the rebuild commits, task
+    writes meanwhile wait for it and then apply their change on top.
+    """
+    stats = TaskDailyStat.objects.all()
+    tasks = Task.objects.all()
+    if user is not None:
+        stats = stats.filter(user=user)
+        tasks = tasks.filter(created_by=user)
+
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(f'LOCK TABLE {TaskDailyStat._meta.db_table} IN EXCLUSIVE MODE')
+        stats.delete()
+        rows = tasks.order_by().values(*TASK_ROLLUP_FIELDS).annotate(total=Count('id'))
+        created = TaskDailyStat.objects.bulk_create(
+            [
+                TaskDailyStat(
+                    user_id=row['created_by_id'],
+                    day=row['scheduled_date'],
+                    status=row['status'],
+                    priority=row['priority'],
+                    assigned_to_type=row['assigned_to_type'],
+                    count=row['total'],
+                )
+                for row in rows
+            ],
+            batch_size=1000,
+        )
+    return len(created)
@@ -0,0 +1,237 @@
+"""Free/busy lookups and conflict detection over a family's scheduled tasks.
+
+Each family member's open, timed occurrences of a day are held in an ``IntervalIndex``
+(an interval tree laid out over a sorted array), so "is this slot free" and "what does it
+collide with" cost O(log n + k). A day's indexes are cached per user and dropped day by day
+as tasks move, only recurring series invalidate every day of their owner.
+
+Members are named ``self``, ``partner:<id>`` and ``child:<id>``. Tasks assigned to the
+whole family (``family``) block every member.
+"""
+from datetime import time, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+
+from task.models import Task, TaskQuerySet
+from task.recurrence import expand_queryset
+
+
+MEMBER_SELF = 'self'
+MEMBER_FAMILY = 'family'
+
+DEFAULT_DURATION_MINUTES = getattr(settings, 'TASK_DEFAULT_DURATION_MINUTES', 30)
+WORKDAY_START = getattr(settings, 'TASK_WORKDAY_START', time(8))
+WORKDAY_END = getattr(settings, 'TASK_WORKDAY_END', time(20))
+CACHE_TIMEOUT = getattr(settings, 'TASK_SCHEDULE_CACHE_TIMEOUT', 60 * 15)
+MAX_SEARCH_DAYS = 60
+
+MINUTES_PER_DAY = 24 * 60
+
+
+def to_minutes(value):
+    return value.hour * 60 + value.minute
+
+
+def to_time(minutes):
+    # The end of the day is reported as 23:59 since time() can't hold 24:00
+    minutes = min(minutes, MINUTES_PER_DAY - 1)
+    return time(minutes // 60, minutes % 60)
+
+
+class IntervalIndex:
+    """Static interval tree over half-open ``(start, end, task_id)`` minute ranges.
+
+    Intervals are sorted by start and the array is read as an implicit balanced tree whose
+    root is the middle element, each node keeping the largest end of its subtree. Queries
+    skip subtrees ending before the slot or starting after it.
+    """
+
+    def __init__(self, intervals):
+        self.intervals = sorted(intervals)
+        self._max_end = [0] * len(self.intervals)
+        self._build(0, len(self.intervals) - 1)
+
+    def __len__(self):
+        return len(self.intervals)
+
+    def _build(self, lo, hi):
+        if lo > hi:
+            return 0
+        mid = (lo + hi) // 2
+        self._max_end[mid] = max(self.intervals[mid][1], self._build(lo, mid - 1), self._build(mid + 1, hi))
+        return self._max_end[mid]
+
+    def overlapping(self, start, end, limit=None):
+        """Intervals overlapping [start, end) in start order, at most ``limit`` of them"""
+        found = []
+        self._search(0, len(self.intervals) - 1, start, end, found, limit)
+        return found
+
+    def _search(self, lo, hi, start, end, found, limit):
+        if lo > hi or self._max_end[(lo + hi) // 2] <= start or (limit is not None and len(found) >= limit):
+            return
+        mid = (lo + hi) // 2
+        self._search(lo, mid - 1, start, end, found, limit)
+        interval = self.intervals[mid]
+        if interval[0] >= end or (limit is not None and len(found) >= limit):
+            return
+        if interval[1] > start:
+            found.append(interval)
+        self._search(mid + 1, hi, start, end, found, limit)
+
+
+def member_key(task):
+    """Member a task occupies, ``family`` for tasks of the whole family"""
+    if task.assigned_to_type == 'partner' and task.assigned_partner_id:
+        return f'partner:{task.assigned_partner_id}'
+    if task.assigned_to_type == 'child' and task.assigned_child_id:
+        return f'child:{task.assigned_child_id}'
+    if task.assigned_to_type == 'family':
+        return MEMBER_FAMILY
+    return MEMBER_SELF
+
+
+def _interval(scheduled_time, duration_minutes):
+    start = to_minutes(scheduled_time)
+    # Tasks running past midnight are clipped to their day
+    return start, min(start + (duration_minutes or DEFAULT_DURATION_MINUTES), MINUTES_PER_DAY)
+
+
+def _build_day(user, day):
+    intervals = {}
+    queryset = Task.objects.for_list().filter(created_by=user).exclude(status='cancelled')
+    for occurrence in expand_queryset(queryset, day, day):
+        if occurrence.scheduled_time is None or occurrence.status not in TaskQuerySet.OPEN_STATUSES:
+            continue
+        start, end = _interval(occurrence.scheduled_time, occurrence.task.duration_minutes)
+        intervals.setdefault(member_key(occurrence.task), []).append((start, end, occurrence.task.id))
+    return {member: IntervalIndex(rows) for member, rows in intervals.items()}
+
+
+# Cache
+
+def _version_key(user_id):
+    return f'task_schedule_version:{user_id}'
+
+
+def _day_key(user_id, version, day):
+    return f'task_schedule:{user_id}:{version}:{day.isoformat()}'
+
+
+def invalidate_schedule_days(user_id, days):
+    """Drop the cached indexes of some days of a user"""
+    if user_id is None:
+        return
+    version = cache.get(_version_key(user_id), 0)
+    cache.delete_many([_day_key(user_id, version, day) for day in days if day is not None])
+
+
+def invalidate_user_schedule(user_id):
+    """Drop every cached day of a user by bumping its cache version"""
+    if user_id is None:
+        return
+    try:
+        cache.incr(_version_key(user_id))
+    except ValueError:
+        cache.set(_version_key(user_id), 1, None)
+
+
+def day_schedule(user, day):
+    """``{member: IntervalIndex}`` of the open timed occurrences of ``user``'s family on ``day``"""
+    key = _day_key(user.id, cache.get(_version_key(user.id), 0), day)
+    schedule = cache.get(key)
+    if schedule is None:
+        schedule = _build_day(user, day)
+        cache.set(key, schedule, CACHE_TIMEOUT)
+    return schedule
+
+
+# Queries
+
+def _indexes(schedule, members):
+    if not members or MEMBER_FAMILY in members:
+        return list(schedule.values())
+    return [schedule[member] for member in {*members, MEMBER_FAMILY} if member in schedule]
+
+
+def find_conflicts(user, members, day, start_time, duration_minutes=None, exclude_task_id=None, limit=None):
+    """Task intervals overlapping the slot for any of ``members``, as (start, end, task id) minute ranges"""
+    start, end = _interval(start_time, duration_minutes)
+    conflicts = []
+    for index in _indexes(day_schedule(user, day), members):
+        conflicts.extend(interval for interval in index.overlapping(start, end) if interval[2] != exclude_task_id)
+    conflicts.sort()
+    return conflicts[:limit] if limit is not None else conflicts
+
+
+def is_free(user, members, day, start_time, duration_minutes=None, exclude_task_id=None):
+    start, end = _interval(start_time, duration_minutes)
+    for index in _indexes(day_schedule(user, day), members):
+        # Two hits are enough to know whether one of them is the task being moved
+        if any(interval[2] != exclude_task_id for interval in index.overlapping(start, end, limit=2)):
+            return False
+    return True
+
+
+def busy_blocks(user, members, day):
+    """Merged [start, end) minute ranges during which any of ``members`` is busy"""
+    intervals = sorted(
+        interval[:2]
+        for index in _indexes(day_schedule(user, day), members)
+        for interval in index.intervals
+    )
+    blocks = []
+    for start, end in intervals:
+        if blocks and start <= blocks[-1][1]:
+            blocks[-1][1] = max(blocks[-1][1], end)
+        else:
+            blocks.append([start, end])
+    return [tuple(block) for block in blocks]
+
+
+def free_slots(user, members, start_day, duration_minutes, count=1, day_start=None, day_end=None, not_before=None, max_days=MAX_SEARCH_DAYS):
+    """The first ``count`` free slots of ``duration_minutes`` for all of ``members``.
+
+    Slots lie within the working window of each day (``TASK_WORKDAY_START`` to
+    ``TASK_WORKDAY_END`` unless given) and, when ``not_before`` is a datetime, after it.
+    Returns ``(date, start time, end time)`` tuples, searching at most ``max_days`` days.
+    """
+    window_start = to_minutes(day_start or WORKDAY_START)
+    # An end of 00:00 means midnight
+    window_end = to_minutes(day_end or WORKDAY_END) or MINUTES_PER_DAY
+    slots = []
+
+    for offset in range(max_days):
+        day = start_day + timedelta(days=offset)
+        cursor = window_start
+        if not_before is not None and day < not_before.date():
+            continue
+        if not_before is not None and day == not_before.date():
+            # Round up to the next whole minute
+            cursor = max(cursor, to_minutes(not_before) + bool(not_before.second or not_before.microsecond))
+
+        for block_start, block_end in busy_blocks(user, members, day) + [(window_end, window_end)]:
+            if block_end <= cursor:
+                continue
+            while cursor + duration_minutes <= min(block_start, window_end):
+                slots.append((day, to_time(cursor), to_time(cursor + duration_minutes)))
+                if len(slots) == count:
+                    return slots
+                cursor += duration_minutes
+            cursor = max(cursor, block_end)
+            if cursor >= window_end:
+                break
+
+    return slots
+
+
+def task_members(data):
+    """Members a validated task payload occupies, for conflict checks before saving"""
+    probe = Task(
+        assigned_to_type=data.get('assigned_to_type') or MEMBER_SELF,
+        assigned_partner=data.get('assigned_partner'),
+        assigned_child=data.get('assigned_child'),
+    )
+    key = member_key(probe)
+    return [] if key == MEMBER_FAMILY else [key]
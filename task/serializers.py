@@ -9,6 +9,7 @@ from django_currentuser.middleware import (get_current_authenticated_user, get_c
 from djoser.serializers import UserCreateSerializer
 
 from task.models import *
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from authentication.models import User
 from djoser import signals
@@ -16,18 +17,30 @@ from django.core.mail import send_mail
 from django.template.loader import render_to_string
 
 
+MAX_BATCH_TASKS = getattr(settings, 'TASK_BATCH_MAX_TASKS', 500)
+MAX_BULK_TASK_IDS = getattr(settings, 'TASK_BULK_MAX_IDS', 500)
+
+
 class TaskListSerializer(serializers.ModelSerializer):
 	created_by = serializers.SerializerMethodField()
 	updated_by = serializers.SerializerMethodField()
+	overdue = serializers.SerializerMethodField()
 	class Meta:
 		model = Task
-		fields = '__all__'
+		# List querysets defer the AI payload, it's served by getTaskAIResponse
+		exclude = ['raw_ai_response', 'search_vector']
+
+	def get_overdue(self, obj):
+		# Annotated by Task.objects.with_overdue(), computed per instance otherwise
+		return obj.overdue if hasattr(obj, 'overdue') else obj.is_overdue
 
 	def get_created_by(self, obj):
 		return obj.created_by.email if obj.created_by else obj.created_by
 		
 	def get_updated_by(self, obj):
-		return obj.updated_by.email if obj.updated_by else obj.updated_by
+		# Task has no updated_by column
+		updated_by = getattr(obj, 'updated_by', None)
+		return updated_by.email if updated_by else updated_by
 
 
 
@@ -41,15 +54,14 @@ class TaskMinimalListSerializer(serializers.ModelSerializer):
 class TaskSerializer(serializers.ModelSerializer):
 	class Meta:
 		model = Task
-		fields = '__all__'
+		exclude = ['search_vector']
 	
 	def create(self, validated_data):
-		modelObject = super().create(validated_data=validated_data)
+		# Set the creator before the insert instead of saving the row a second time
 		user = get_current_authenticated_user()
 		if user is not None:
-			modelObject.created_by = user
-		modelObject.save()
-		return modelObject
+			validated_data['created_by'] = user
+		return super().create(validated_data=validated_data)
 	
 	def update(self, instance, validated_data):
 		modelObject = super().update(instance=instance, validated_data=validated_data)
@@ -57,4 +69,154 @@ class TaskSerializer(serializers.ModelSerializer):
 		if user is not None:
 			modelObject.updated_by = user
 		modelObject.save()
-		return modelObject
\ No newline at end of file
+		return modelObject
+
+
+
+class TaskOccurrenceSerializer(serializers.Serializer):
+	task_id = serializers.IntegerField(source='task.id')
+	task_name = serializers.CharField(source='task.task_name')
+	description = serializers.CharField(source='task.description', allow_null=True)
+	original_date = serializers.DateField()
+	scheduled_date = serializers.DateField()
+	scheduled_time = serializers.TimeField(allow_null=True)
+	duration_minutes = serializers.IntegerField(source='task.duration_minutes', allow_null=True)
+	assigned_to_type = serializers.CharField(source='task.assigned_to_type')
+	priority = serializers.CharField(source='task.priority')
+	status = serializers.CharField()
+	completed_at = serializers.DateTimeField(allow_null=True)
+	is_recurring = serializers.BooleanField(source='task.is_recurring')
+	is_exception = serializers.BooleanField()
+
+
+
+
+class TaskOccurrenceExceptionSerializer(serializers.ModelSerializer):
+	class Meta:
+		model = TaskOccurrenceException
+		fields = '__all__'
+
+	def validate(self, attrs):
+		action = attrs.get('action', getattr(self.instance, 'action', None))
+		if action == TaskOccurrenceException.ACTION_MOVED and not (attrs.get('new_date') or attrs.get('new_time')):
+			raise serializers.ValidationError({'new_date': 'A moved occurrence needs a new date or time.'})
+		if action == TaskOccurrenceException.ACTION_COMPLETED and not attrs.get('completed_at'):
+			attrs['completed_at'] = timezone.now()
+		return attrs
+
+
+
+
+
+class TaskBatchItemSerializer(serializers.Serializer):
+	"""One task of an AI response, foreign keys stay plain ids so a batch validates without queries"""
+	task_name = serializers.CharField(max_length=200)
+	description = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+	scheduled_date = serializers.DateField()
+	scheduled_time = serializers.TimeField(required=False, allow_null=True)
+	duration_minutes = serializers.IntegerField(required=False, allow_null=True, min_value=0)
+	assigned_to_type = serializers.ChoiceField(choices=Task.ASSIGNED_TO_CHOICES, default='self')
+	priority = serializers.ChoiceField(choices=Task.PRIORITY_CHOICES, default='medium')
+	assigned_partner = serializers.IntegerField(required=False, allow_null=True)
+	assigned_child = serializers.IntegerField(required=False, allow_null=True)
+	task_category = serializers.IntegerField(required=False, allow_null=True)
+	category = serializers.CharField(required=False, allow_blank=True, allow_null=True)  # Category name, used when no id is given
+	is_recurring = serializers.BooleanField(default=False)
+	recurrence_pattern = serializers.CharField(max_length=50, required=False, allow_blank=True, allow_null=True)
+
+
+
+
+class TaskGenerationSerializer(serializers.Serializer):
+	prompt = serializers.CharField(max_length=4000)
+
+
+
+
+class TaskBatchIngestSerializer(serializers.Serializer):
+	batch_id = serializers.CharField(max_length=100, required=False)
+	ai_prompt = serializers.CharField(allow_blank=True, default='')
+	generated_at = serializers.DateTimeField(required=False)
+	tasks = TaskBatchItemSerializer(many=True, allow_empty=False)
+
+	def validate_tasks(self, value):
+		if len(value) > MAX_BATCH_TASKS:
+			raise serializers.ValidationError(f'A batch can hold at most {MAX_BATCH_TASKS} tasks.')
+		return value
+
+
+
+
+
+class TaskBulkOperationSerializer(serializers.Serializer):
+	"""One bulk mutation applied to every task in ``ids``, only the fields of its ``op`` are read"""
+	OP_COMPLETE = 'complete'
+	OP_STATUS = 'status'
+	OP_RESCHEDULE = 'reschedule'
+	OP_REASSIGN = 'reassign'
+	OP_DELETE = 'delete'
+
+	OP_CHOICES = [OP_COMPLETE, OP_STATUS, OP_RESCHEDULE, OP_REASSIGN, OP_DELETE]
+
+	op = serializers.ChoiceField(choices=OP_CHOICES)
+	ids = serializers.ListField(child=serializers.IntegerField(min_value=1), allow_empty=False)
+
+	# status
+	status = serializers.ChoiceField(choices=Task.STATUS_CHOICES, required=False)
+
+	# reschedule, to a date or by a number of days
+	scheduled_date = serializers.DateField(required=False)
+	scheduled_time = serializers.TimeField(required=False, allow_null=True)
+	shift_days = serializers.IntegerField(required=False)
+
+	# reassign
+	assigned_to_type = serializers.ChoiceField(choices=Task.ASSIGNED_TO_CHOICES, required=False)
+	assigned_user = serializers.IntegerField(required=False, allow_null=True)
+	assigned_partner = serializers.IntegerField(required=False, allow_null=True)
+	assigned_child = serializers.IntegerField(required=False, allow_null=True)
+
+	def validate(self, attrs):
+		op = attrs['op']
+		if op == self.OP_STATUS and 'status' not in attrs:
+			raise serializers.ValidationError({'status': 'This field is required.'})
+		if op == self.OP_RESCHEDULE:
+			if ('scheduled_date' in attrs) == ('shift_days' in attrs):
+				raise serializers.ValidationError({'scheduled_date': 'Give either a scheduled_date or shift_days.'})
+		if op == self.OP_REASSIGN and 'assigned_to_type' not in attrs:
+			raise serializers.ValidationError({'assigned_to_type': 'This field is required.'})
+		return attrs
+
+
+
+
+class TaskBulkSerializer(serializers.Serializer):
+	operations = TaskBulkOperationSerializer(many=True, allow_empty=False)
+
+	def validate_operations(self, value):
+		if sum(len(operation['ids']) for operation in value) > MAX_BULK_TASK_IDS:
+			raise serializers.ValidationError(f'A bulk request can touch at most {MAX_BULK_TASK_IDS} task ids.')
+		return value
+
+
+
+
+
+class TaskAutoScheduleSerializer(serializers.Serializer):
+	"""Tasks to place, a batch, some ids, or by default every open task without a time"""
+	batch_id = serializers.CharField(max_length=100, required=False)
+	task_ids = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False, allow_empty=False)
+	start = serializers.DateField(required=False)
+	day_start = serializers.TimeField(required=False)
+	day_end = serializers.TimeField(required=False)
+	max_days = serializers.IntegerField(required=False, min_value=1, max_value=60)
+	dry_run = serializers.BooleanField(default=False)
+
+	def validate(self, attrs):
+		if 'batch_id' in attrs and 'task_ids' in attrs:
+			raise serializers.ValidationError({'task_ids': 'Give either a batch_id or task_ids.'})
+		if len(attrs.get('task_ids', [])) > MAX_BULK_TASK_IDS:
+			raise serializers.ValidationError({'task_ids': f'At most {MAX_BULK_TASK_IDS} tasks can be scheduled at once.'})
+		day_start, day_end = attrs.get('day_start'), attrs.get('day_end')
+		if day_start and day_end and day_end <= day_start:
+			raise serializers.ValidationError({'day_end': 'The working day must end after it starts.'})
+		return attrs
@@ -0,0 +1,47 @@
+from django.db.models.signals import post_delete, post_save
+
+from task.models import Task, TaskDailyStat, TaskOccurrenceException, TaskTombstone, rollup_deltas
+from task.recurrence import invalidate_user_occurrences
+from task.scheduling import invalidate_schedule_days, invalidate_user_schedule
+
+
+def task_occurrences_signals(sender, instance, **kwargs):
+	invalidate_user_occurrences(instance.created_by_id)
+
+
+def task_schedule_signals(sender, instance, **kwargs):
+	loaded_date, loaded_recurring = getattr(instance, '_loaded_schedule', (None, False))
+	if instance.is_recurring or loaded_recurring:
+		# A series covers an open ended range of days
+		invalidate_user_schedule(instance.created_by_id)
+	else:
+		invalidate_schedule_days(instance.created_by_id, {instance.scheduled_date, loaded_date})
+	instance._loaded_schedule = (instance.scheduled_date, instance.is_recurring)
+
+
+def task_tombstone_signals(sender, instance, **kwargs):
+	TaskTombstone.objects.create(task_id=instance.id, created_by_id=instance.created_by_id)
+
+
+def task_rollup_signals(sender, instance, using, **kwargs):
+	# Runs inside the delete transaction, so the counter drops together with the row
+	TaskDailyStat.objects.using(using).apply_deltas(rollup_deltas(removed=[instance.rollup_key()]))
+
+
+def occurrence_exception_signals(sender, instance, **kwargs):
+	created_by_id = Task.objects.filter(id=instance.task_id).values_list('created_by_id', flat=True).first()
+	invalidate_user_occurrences(created_by_id)
+	invalidate_user_schedule(created_by_id)
+
+
+# Task signals
+post_save.connect(task_occurrences_signals, sender=Task)
+post_delete.connect(task_occurrences_signals, sender=Task)
+post_save.connect(task_schedule_signals, sender=Task)
+post_delete.connect(task_schedule_signals, sender=Task)
+post_delete.connect(task_tombstone_signals, sender=Task)
+post_delete.connect(task_rollup_signals, sender=Task)
+
+# TaskOccurrenceException signals
+post_save.connect(occurrence_exception_signals, sender=TaskOccurrenceException)
+post_delete.connect(occurrence_exception_signals, sender=TaskOccurrenceException)
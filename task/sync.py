@@ -0,0 +1,118 @@
+"""Delta sync of a user's tasks.
+
+Clients keep the opaque watermark of their last sync and ask only for what changed after
+it. Changed rows are read from the (created_by, updated_at, id) index and deletions from
+``TaskTombstone``. Rows newer than ``now - TASK_SYNC_SAFETY_MARGIN_SECONDS`` are held back
+until the next sync so a transaction committing late with an older ``updated_at`` is never
+skipped. The watermark only moves forward.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from commons.pagination import decode_cursor, encode_cursor
+from task.models import Task, TaskTombstone
+
+
+SAFETY_MARGIN = timedelta(seconds=getattr(settings, 'TASK_SYNC_SAFETY_MARGIN_SECONDS', 2))
+TOMBSTONE_RETENTION = timedelta(days=getattr(settings, 'TASK_TOMBSTONE_RETENTION_DAYS', 30))
+DEFAULT_LIMIT = 500
+MAX_LIMIT = 2000
+
+
+def encode_watermark(tasks_position, deleted_position):
+    return encode_cursor({
+        't': [tasks_position[0].isoformat(), tasks_position[1]] if tasks_position else None,
+        'd': [deleted_position[0].isoformat(), deleted_position[1]] if deleted_position else None,
+    })
+
+
+def decode_watermark(value):
+    """Return the (updated_at, id) position of tasks and deletions, None for an unknown watermark"""
+    if not value:
+        return None, None
+    try:
+        payload = decode_cursor(value)
+        return _decode_position(payload.get('t')), _decode_position(payload.get('d'))
+    except (ValueError, TypeError, AttributeError, IndexError):
+        return None, None
+
+
+def _decode_position(position):
+    if not position:
+        return None
+    moment = parse_datetime(position[0])
+    if moment is None:
+        raise ValueError('Invalid watermark')
+    return moment, int(position[1])
+
+
+def _after(queryset, field, position):
+    if position is None:
+        return queryset
+    moment, pk = position
+    return queryset.filter(Q(**{f'{field}__gt': moment}) | Q(**{field: moment, 'id__gt': pk}))
+
+
+def task_changes(user, watermark=None, limit=DEFAULT_LIMIT):
+    """Tasks changed and deleted after ``watermark`` plus the watermark to send next time.
+
+    Returns a dict with ``changed`` tasks, ``deleted`` task ids, ``watermark``, ``has_more``
+    and ``full_resync`` (True when the client has to drop its copy and sync from scratch).
+    """
+    limit = max(1, min(int(limit or DEFAULT_LIMIT), MAX_LIMIT))
+    tasks_position, deleted_position = decode_watermark(watermark)
+    horizon = timezone.now() - SAFETY_MARGIN
+    if deleted_position is not None:
+        # Never hand out a watermark older than the one we got, even across skewed clocks
+        horizon = max(horizon, deleted_position[0])
+
+    # Tombstones older than the retention window are pruned, a client this far behind (or
+    # sending a watermark we can't read) can't know what it missed.
+    full_resync = bool(watermark) and (
+        deleted_position is None or deleted_position[0] < horizon - TOMBSTONE_RETENTION
+    )
+    if full_resync or not watermark:
+        # A fresh copy already excludes everything deleted so far
+        tasks_position, deleted_position = None, (horizon, 0)
+
+    changed = Task.objects.for_list().filter(created_by=user, updated_at__lte=horizon)
+    changed = list(_after(changed, 'updated_at', tasks_position).order_by('updated_at', 'id')[:limit + 1])
+
+    deleted = TaskTombstone.objects.filter(created_by=user, deleted_at__lte=horizon)
+    deleted = list(_after(deleted, 'deleted_at', deleted_position).order_by('deleted_at', 'id')[:limit + 1])
+
+    # A stream read to the end moves up to the horizon, a truncated one stops at its last row
+    if len(changed) > limit:
+        changed = changed[:limit]
+        tasks_position = (changed[-1].updated_at, changed[-1].id)
+        more_changed = True
+    else:
+        tasks_position = (horizon, 0)
+        more_changed = False
+
+    if len(deleted) > limit:
+        deleted = deleted[:limit]
+        deleted_position = (deleted[-1].deleted_at, deleted[-1].id)
+        more_deleted = True
+    else:
+        deleted_position = (horizon, 0)
+        more_deleted = False
+
+    return {
+        'changed': changed,
+        'deleted': [tombstone.task_id for tombstone in deleted],
+        'watermark': encode_watermark(tasks_position, deleted_position),
+        'has_more': more_changed or more_deleted,
+        'full_resync': full_resync,
+    }
+
+
+def prune_tombstones(now=None):
+    """Delete tombstones older than the retention window, returns how many were removed"""
+    cutoff = (now or timezone.now()) - TOMBSTONE_RETENTION
+    deleted, _ = TaskTombstone.objects.filter(deleted_at__lt=cutoff).delete()
+    return deleted
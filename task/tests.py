@@ -1,3 +1,723 @@
-from django.test import TestCase
+from datetime import date, datetime, time, timedelta
+import csv
+import io
+import json
+import threading
+from unittest import mock, skipUnless
+
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, models
+from django.db.models import QuerySet
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+
+from rest_framework.serializers import ValidationError
+
+from authentication.models import Child, Partner, User
+from commons.pagination import KeysetPagination
+from commons.streaming import EXPORT_CSV, EXPORT_NDJSON, stream_export
+from commons.generation_cache import GenerationCache
+from commons.json_stream import JSONArrayStream
+from task.ai_stream import stream_task_generation
+from task.autoschedule import auto_schedule
+from task.bulk import apply_bulk_operations
+from task.ingestion import ingest_task_batch
+from task.reminders import QueueSink, ReminderDispatcher
+from task.filters import TaskFilter
+from task.overdue import sweep_overdue_tasks
+from task.models import PRIORITY_RANKS, Receipt, Task, TaskBatch, TaskCategory, TaskComment, TaskDailyStat, TaskOccurrenceException, TaskQuerySet, TaskTombstone
+from task.recurrence import occurrences_between, upcoming_occurrences
+from task.rollups import PERIOD_WEEK, rebuild_task_rollups, task_stats
+from task.scheduling import IntervalIndex, find_conflicts, free_slots, is_free
+from task.serializers import TaskBatchIngestSerializer, TaskListSerializer
+from task.sync import TOMBSTONE_RETENTION, encode_watermark, task_changes
 
 # Create your tests here.
+
+
+class TaskPriorityRankTest(TestCase):
+
+	def setUp(self):
+		self.user = User.objects.create_user(email='rank@example.com', password='secret', image=None)
+
+	def test_save_sets_rank(self):
+		task = Task.objects.create(task_name='t', scheduled_date=date(2025, 1, 1), assigned_to_type='self', priority='urgent', created_by=self.user)
+		self.assertEqual(task.priority_rank, PRIORITY_RANKS['urgent'])
+
+	def test_update_and_bulk_create_keep_rank_in_sync(self):
+		tasks = Task.objects.bulk_create([
+			Task(task_name=f't{i}', scheduled_date=date(2025, 1, 1), assigned_to_type='self', priority=priority, created_by=self.user)
+			for i, priority in enumerate(['low', 'high'])
+		])
+		self.assertEqual([task.priority_rank for task in tasks], [PRIORITY_RANKS['low'], PRIORITY_RANKS['high']])
+
+		Task.objects.filter(created_by=self.user).update(priority='urgent')
+		self.assertEqual(set(Task.objects.values_list('priority_rank', flat=True)), {PRIORITY_RANKS['urgent']})
+
+	def test_default_ordering_puts_urgent_first(self):
+		for priority in ['medium', 'urgent', 'low']:
+			Task.objects.create(task_name=priority, scheduled_date=date(2025, 1, 1), scheduled_time=time(9), assigned_to_type='self', priority=priority, created_by=self.user)
+		self.assertEqual(list(Task.objects.values_list('priority', flat=True)), ['urgent', 'medium', 'low'])
+
+
+class KeysetPaginationTest(TestCase):
+
+	def setUp(self):
+		user = User.objects.create_user(email='keyset@example.com', password='secret', image=None)
+		days = [date(2025, 1, 1)] * 3 + [date(2025, 1, 2)] * 2 + [date(2025, 1, 3)] * 2
+		for i, day in enumerate(days):
+			Task.objects.create(task_name=f't{i}', scheduled_date=day, assigned_to_type='self', created_by=user)
+
+	def walk(self, ordering):
+		pages, cursor = [], ''
+		while cursor is not None:
+			pagination = KeysetPagination(ordering=ordering)
+			pagination.cursor = cursor
+			pagination.size = 2
+			pages.append([task.id for task in pagination.paginate_data(Task.objects.all())])
+			self.assertEqual((pagination.page, pagination.total_pages), (len(pages), 4))
+			cursor = pagination.next_cursor
+		return pages
+
+	def test_cursor_walks_ties_without_gaps_or_repeats(self):
+		for ordering in ('scheduled_date', '-scheduled_date'):
+			expected = list(Task.objects.order_by(ordering, ordering.replace('scheduled_date', 'id')).values_list('id', flat=True))
+			pages = self.walk(ordering)
+			self.assertEqual([len(page) for page in pages], [2, 2, 2, 1], ordering)
+			self.assertEqual(sum(pages, []), expected, ordering)
+
+	def test_unreadable_cursor_starts_over(self):
+		pagination = KeysetPagination(ordering='scheduled_date')
+		pagination.cursor = 'not-a-cursor'
+		pagination.size = 2
+		first = pagination.paginate_data(Task.objects.all())
+		self.assertEqual((pagination.page, [task.task_name for task in first]), (1, ['t0', 't1']))
+
+
+class TaskRecurrenceTest(TestCase):
+
+	def setUp(self):
+		cache.clear()
+		self.user = User.objects.create_user(email='recur@example.com', password='secret', image=None)
+
+	def test_rrule_with_exceptions(self):
+		series = Task.objects.create(
+			task_name='swim', scheduled_date=date(2025, 1, 6), scheduled_time=time(17), assigned_to_type='child',
+			is_recurring=True, recurrence_pattern='FREQ=WEEKLY;BYDAY=MO,WE', created_by=self.user,
+		)
+		exceptions = TaskOccurrenceException.objects
+		exceptions.create(task=series, occurrence_date=date(2025, 1, 8), action=TaskOccurrenceException.ACTION_CANCELLED)
+		exceptions.create(task=series, occurrence_date=date(2025, 1, 13), action=TaskOccurrenceException.ACTION_MOVED, new_date=date(2025, 1, 14), new_time=time(9, 30))
+		exceptions.create(task=series, occurrence_date=date(2025, 1, 15), action=TaskOccurrenceException.ACTION_COMPLETED, completed_at=timezone.now())
+		# Moved into the window from the week after
+		exceptions.create(task=series, occurrence_date=date(2025, 1, 20), action=TaskOccurrenceException.ACTION_MOVED, new_date=date(2025, 1, 17))
+
+		occurrences = occurrences_between(Task.objects.filter(created_by=self.user), date(2025, 1, 6), date(2025, 1, 19))
+		self.assertEqual([(o.original_date, o.scheduled_date, o.scheduled_time, o.status) for o in occurrences], [
+			(date(2025, 1, 6), date(2025, 1, 6), time(17), 'pending'),
+			(date(2025, 1, 13), date(2025, 1, 14), time(9, 30), 'pending'),
+			(date(2025, 1, 15), date(2025, 1, 15), time(17), 'completed'),
+			(date(2025, 1, 20), date(2025, 1, 17), time(17), 'pending'),
+		])
+
+	def test_cached_window_is_invalidated_by_exceptions(self):
+		today = timezone.localdate()
+		series = Task.objects.create(
+			task_name='walk', scheduled_date=today, assigned_to_type='self', is_recurring=True, recurrence_pattern='daily', created_by=self.user,
+		)
+		self.assertEqual(len(upcoming_occurrences(self.user)), 15)
+		# Served from the cache, only the task rows are read again
+		with self.assertNumQueries(1):
+			self.assertEqual(len(upcoming_occurrences(self.user)), 15)
+
+		TaskOccurrenceException.objects.create(task=series, occurrence_date=today + timedelta(days=1), action=TaskOccurrenceException.ACTION_CANCELLED)
+		self.assertEqual(len(upcoming_occurrences(self.user)), 14)
+
+		series.recurrence_pattern = 'FREQ=DAILY;INTERVAL=7'
+		series.save()
+		self.assertEqual([o.scheduled_date for o in upcoming_occurrences(self.user)], [today, today + timedelta(days=7), today + timedelta(days=14)])
+
+
+class TaskOverdueTest(TestCase):
+
+	def test_sweep_skips_recurring_series(self):
+		user = User.objects.create_user(email='overdue@example.com', password='secret', image=None)
+		fields = {'scheduled_date': date(2025, 1, 6), 'scheduled_time': time(9), 'assigned_to_type': 'self', 'created_by': user}
+		one_off = Task.objects.create(task_name='one-off', **fields)
+		series = Task.objects.create(task_name='series', is_recurring=True, recurrence_pattern='weekly', **fields)
+		future = Task.objects.create(task_name='future', **{**fields, 'scheduled_date': date(2025, 1, 8)})
+
+		now = timezone.make_aware(datetime(2025, 1, 7, 12))
+		self.assertEqual(sweep_overdue_tasks(now=now), 1)
+		self.assertEqual(dict(Task.objects.values_list('task_name', 'status')), {'one-off': 'overdue', 'series': 'pending', 'future': 'pending'})
+		overdue = dict(Task.objects.with_overdue(now).values_list('id', 'overdue'))
+		self.assertEqual(overdue, {one_off.id: True, series.id: False, future.id: False})
+		self.assertFalse(series.is_overdue)
+
+
+class TaskDailyStatTest(TestCase):
+
+	def setUp(self):
+		self.user = User.objects.create_user(email='stats@example.com', password='secret', image=None)
+		self.day = date(2025, 3, 3)
+
+	def create(self, **kwargs):
+		fields = {'task_name': 't', 'scheduled_date': self.day, 'assigned_to_type': 'self', 'created_by': self.user, **kwargs}
+		return Task.objects.create(**fields)
+
+	def counts(self):
+		stats = TaskDailyStat.objects.filter(user=self.user).exclude(count=0)
+		return {(stat.day, stat.status, stat.priority): stat.count for stat in stats}
+
+	def assertMatchesRebuild(self):
+		counts = self.counts()
+		rebuild_task_rollups(self.user)
+		self.assertEqual(counts, self.counts())
+
+	def test_save_and_delete(self):
+		task = self.create()
+		other = self.create(priority='high')
+		self.assertEqual(self.counts(), {(self.day, 'pending', 'medium'): 1, (self.day, 'pending', 'high'): 1})
+
+		task.mark_completed()
+		task.scheduled_date = self.day + timedelta(days=1)
+		task.save(update_fields=['scheduled_date'])
+		other.delete()
+		self.assertEqual(self.counts(), {(self.day + timedelta(days=1), 'completed', 'medium'): 1})
+		self.assertMatchesRebuild()
+
+	def test_bulk_paths(self):
+		tasks = Task.objects.bulk_create([Task(task_name=f't{i}', scheduled_date=self.day, assigned_to_type='self', created_by=self.user) for i in range(4)])
+		Task.objects.filter(pk__in=[task.pk for task in tasks[:2]]).update(status='completed')
+		tasks[3].priority = 'urgent'
+		Task.objects.bulk_update([tasks[3]], ['priority'])
+		Task.objects.filter(pk=tasks[2].pk).delete()
+		self.assertEqual(self.counts(), {(self.day, 'completed', 'medium'): 2, (self.day, 'pending', 'urgent'): 1})
+		self.assertMatchesRebuild()
+
+	def test_stats_by_week(self):
+		self.create(status='completed')
+		self.create(scheduled_date=self.day + timedelta(days=7), assigned_to_type='family')
+		stats = task_stats(self.user, self.day, self.day + timedelta(days=13), PERIOD_WEEK)
+		self.assertEqual(stats['totals']['total'], 2)
+		self.assertEqual([bucket['total'] for bucket in stats['series']], [1, 1])
+		self.assertEqual(stats['series'][0]['by_status'], {'completed': 1})
+		self.assertEqual(stats['series'][1]['by_assigned_to_type'], {'family': 1})
+
+
+class TaskBatchIngestTest(TestCase):
+
+	def setUp(self):
+		self.user = User.objects.create_user(email='ingest@example.com', password='secret', image=None)
+
+	def ingest(self, tasks, **data):
+		serializer = TaskBatchIngestSerializer(data={'ai_prompt': 'plan', 'tasks': tasks, **data})
+		serializer.is_valid(raise_exception=True)
+		return ingest_task_batch(self.user, serializer.validated_data, raw_tasks=tasks)
+
+	def test_ingests_batch_with_own_references(self):
+		partner = Partner.objects.create(user=self.user, name='Sam')
+		category = TaskCategory.objects.create(name='Meals', category_type='family', created_by=self.user)
+		tasks = [
+			{'task_name': 'cook', 'scheduled_date': '2025-01-06', 'assigned_to_type': 'partner', 'assigned_partner': partner.id, 'category': 'Meals'},
+			{'task_name': 'shop', 'scheduled_date': '2025-01-07', 'task_category': category.id, 'priority': 'high'},
+		]
+		batch, task_ids = self.ingest(tasks, batch_id='batch-ok')
+
+		self.assertEqual((batch.batch_id, batch.total_tasks), ('batch-ok', 2))
+		rows = Task.objects.filter(pk__in=task_ids).order_by('scheduled_date')
+		self.assertEqual([(task.assigned_partner_id, task.task_category_id, task.raw_ai_response) for task in rows], [
+			(partner.id, category.id, tasks[0]),
+			(None, category.id, tasks[1]),
+		])
+
+	def test_references_of_other_users_are_rejected(self):
+		other = User.objects.create_user(email='ingest-other@example.com', password='secret', image=None)
+		child = Child.objects.create(user=other, name='Alex')
+		tasks = [
+			{'task_name': 'fine', 'scheduled_date': '2025-01-06'},
+			{'task_name': 'theirs', 'scheduled_date': '2025-01-06', 'assigned_child': child.id, 'task_category': 999999},
+		]
+		with self.assertRaises(ValidationError) as raised:
+			self.ingest(tasks, batch_id='batch-bad')
+
+		self.assertEqual(set(raised.exception.detail['tasks']), {1})
+		self.assertEqual(set(raised.exception.detail['tasks'][1]), {'assigned_child', 'task_category'})
+		# Nothing of the batch is written
+		self.assertFalse(TaskBatch.objects.filter(batch_id='batch-bad').exists())
+		self.assertFalse(Task.objects.filter(created_by=self.user).exists())
+
+	def test_duplicate_batch_id_is_rejected(self):
+		tasks = [{'task_name': 'a', 'scheduled_date': '2025-01-06'}]
+		self.ingest(tasks, batch_id='batch-1')
+		with self.assertRaises(ValidationError) as raised:
+			self.ingest(tasks, batch_id='batch-1')
+		self.assertIn('batch_id', raised.exception.detail)
+		self.assertEqual(Task.objects.filter(created_by=self.user).count(), 1)
+
+	def test_concurrent_duplicate_batch_id_is_rejected(self):
+		tasks = [{'task_name': 'a', 'scheduled_date': '2025-01-06'}]
+		self.ingest(tasks, batch_id='batch-1')
+
+		# As if the other request committed between this one's check and insert
+		real_exists = QuerySet.exists
+		calls = []
+		def exists(queryset):
+			calls.append(queryset)
+			return False if len(calls) == 1 else real_exists(queryset)
+
+		with mock.patch.object(QuerySet, 'exists', exists):
+			with self.assertRaises(ValidationError) as raised:
+				self.ingest(tasks, batch_id='batch-1')
+		self.assertIn('batch_id', raised.exception.detail)
+		self.assertEqual(Task.objects.filter(created_by=self.user).count(), 1)
+
+
+@mock.patch('task.sync.SAFETY_MARGIN', timedelta(0))
+class TaskSyncTest(TestCase):
+
+	def setUp(self):
+		self.user = User.objects.create_user(email='sync@example.com', password='secret', image=None)
+		self.tasks = [
+			Task.objects.create(task_name=f't{i}', scheduled_date=date(2025, 1, 6), assigned_to_type='self', created_by=self.user)
+			for i in range(3)
+		]
+
+	def test_changes_and_tombstones_after_watermark(self):
+		first = task_changes(self.user)
+		self.assertEqual([task.id for task in first['changed']], [task.id for task in self.tasks])
+		self.assertEqual((first['deleted'], first['has_more'], first['full_resync']), ([], False, False))
+
+		edited, deleted, _ = self.tasks
+		edited.mark_completed()
+		deleted_id = deleted.id
+		deleted.delete()
+
+		second = task_changes(self.user, first['watermark'])
+		self.assertEqual(([task.id for task in second['changed']], second['deleted']), ([edited.id], [deleted_id]))
+		self.assertFalse(second['full_resync'])
+
+		# Nothing new since, and the watermark never moves back
+		third = task_changes(self.user, second['watermark'])
+		self.assertEqual((third['changed'], third['deleted']), ([], []))
+
+	def test_limit_pages_through_changes(self):
+		watermark = task_changes(self.user)['watermark']
+		for task in self.tasks:
+			task.mark_completed()
+
+		seen = []
+		while True:
+			changes = task_changes(self.user, watermark, limit=2)
+			seen += [task.id for task in changes['changed']]
+			watermark = changes['watermark']
+			if not changes['has_more']:
+				break
+		self.assertEqual(seen, [task.id for task in self.tasks])
+
+	def test_stale_or_unreadable_watermark_asks_for_full_resync(self):
+		stale = timezone.now() - TOMBSTONE_RETENTION - timedelta(days=1)
+		for watermark in (encode_watermark((stale, 0), (stale, 0)), 'garbage'):
+			changes = task_changes(self.user, watermark)
+			self.assertTrue(changes['full_resync'], watermark)
+			self.assertEqual(len(changes['changed']), 3)
+			self.assertEqual(changes['deleted'], [])
+			self.assertFalse(task_changes(self.user, changes['watermark'])['full_resync'])
+
+
+class CompressedFieldTest(TestCase):
+
+	def test_json_round_trip_and_isnull(self):
+		user = User.objects.create_user(email='compressed@example.com', password='secret', image=None)
+		payload = {'task_name': 'Café run', 'tags': ['a', 'b'], 'nested': {'n': 1.5, 'none': None}}
+		fields = {'scheduled_date': date(2025, 1, 6), 'assigned_to_type': 'self', 'created_by': user}
+		stored = Task.objects.create(task_name='stored', raw_ai_response=payload, **fields)
+		empty = Task.objects.create(task_name='empty', raw_ai_response=None, **fields)
+
+		self.assertEqual(Task.objects.get(pk=stored.pk).raw_ai_response, payload)
+		self.assertIsNone(Task.objects.get(pk=empty.pk).raw_ai_response)
+		self.assertEqual(list(Task.objects.filter(raw_ai_response__isnull=True).values_list('id', flat=True)), [empty.id])
+		self.assertEqual(list(Task.objects.filter(raw_ai_response__isnull=False).values_list('id', flat=True)), [stored.id])
+
+		Task.objects.filter(pk=empty.pk).update(raw_ai_response=[1, 2])
+		self.assertEqual(Task.objects.get(pk=empty.pk).raw_ai_response, [1, 2])
+
+	def test_text_round_trip_compressed(self):
+		text = 'TOTAL 1.00\n' * 500
+		stored = Receipt.objects.create(image='receipts/a.png', extracted_text=text)
+		blank = Receipt.objects.create(image='receipts/b.png', extracted_text='')
+		missing = Receipt.objects.create(image='receipts/c.png')
+
+		texts = dict(Receipt.objects.values_list('id', 'extracted_text'))
+		self.assertEqual(texts, {stored.id: text, blank.id: '', missing.id: None})
+		self.assertEqual(list(Receipt.objects.filter(extracted_text__isnull=True).values_list('id', flat=True)), [missing.id])
+
+		with connection.cursor() as cursor:
+			cursor.execute('SELECT octet_length(extracted_text) FROM task_receipt WHERE id = %s', [stored.id])
+			self.assertLess(cursor.fetchone()[0], len(text) // 10)
+			# Rows written before the column was compressed are still readable
+			cursor.execute('UPDATE task_receipt SET extracted_text = %s WHERE id = %s', [b'plain text', blank.id])
+		self.assertEqual(Receipt.objects.get(pk=blank.pk).extracted_text, 'plain text')
+
+
+class TaskExportTest(TestCase):
+
+	def setUp(self):
+		user = User.objects.create_user(email='export@example.com', password='secret', image=None)
+		for i in range(3):
+			Task.objects.create(task_name=f't{i}', description='Milk, eggs\n"bread"', scheduled_date=date(2025, 1, 6 + i), assigned_to_type='self', created_by=user)
+		self.tasks = Task.objects.for_list().with_overdue().order_by('id')
+		self.expected = TaskListSerializer(self.tasks, many=True).data
+
+	def content(self, response):
+		return b''.join(response.streaming_content).decode()
+
+	def test_ndjson_one_object_per_line(self):
+		response = stream_export(self.tasks, TaskListSerializer, EXPORT_NDJSON, filename='tasks', chunk_size=2)
+		self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+		self.assertIn('filename="tasks.ndjson"', response['Content-Disposition'])
+		lines = self.content(response).splitlines()
+		self.assertEqual([json.loads(line) for line in lines], json.loads(json.dumps(self.expected, cls=DjangoJSONEncoder)))
+
+	def test_csv_header_and_quoted_rows(self):
+		response = stream_export(self.tasks, TaskListSerializer, EXPORT_CSV, filename='tasks', chunk_size=2)
+		self.assertEqual(response['Content-Type'], 'text/csv')
+		rows = list(csv.DictReader(io.StringIO(self.content(response))))
+		self.assertEqual(list(rows[0]), list(self.expected[0]))
+		self.assertEqual([row['task_name'] for row in rows], ['t0', 't1', 't2'])
+		self.assertEqual({row['description'] for row in rows}, {'Milk, eggs\n"bread"'})
+
+	def test_empty_export(self):
+		for export_format in (EXPORT_NDJSON, EXPORT_CSV):
+			self.assertEqual(self.content(stream_export(Task.objects.none(), TaskListSerializer, export_format)), '')
+
+
+class TaskBulkOperationTest(TestCase):
+
+	def setUp(self):
+		self.user = User.objects.create_user(email='bulk@example.com', password='secret', image=None)
+		self.other = User.objects.create_user(email='bulk-other@example.com', password='secret', image=None)
+		self.day = date(2025, 4, 1)
+		self.tasks = Task.objects.bulk_create([
+			Task(task_name=f't{i}', scheduled_date=self.day, assigned_to_type='self', created_by=self.user)
+			for i in range(4)
+		])
+		self.foreign = Task.objects.create(task_name='x', scheduled_date=self.day, assigned_to_type='self', created_by=self.other)
+
+	def test_reschedule_reopens_overdue_tasks(self):
+		overdue, completed = self.tasks[:2]
+		Task.objects.filter(pk=overdue.pk).update(status='overdue')
+		Task.objects.filter(pk=completed.pk).update(status='completed')
+
+		apply_bulk_operations(self.user, [{'op': 'reschedule', 'ids': [overdue.id, completed.id], 'scheduled_date': self.day + timedelta(days=7)}])
+
+		self.assertEqual(Task.objects.get(pk=overdue.pk).status, 'pending')
+		self.assertEqual(Task.objects.get(pk=completed.pk).status, 'completed')
+		counts = {(stat.day, stat.status): stat.count for stat in TaskDailyStat.objects.filter(user=self.user).exclude(count=0)}
+		self.assertEqual(counts, {(self.day, 'pending'): 2, (self.day + timedelta(days=7), 'pending'): 1, (self.day + timedelta(days=7), 'completed'): 1})
+
+	def test_operations_apply_in_order(self):
+		ids = [task.id for task in self.tasks]
+		results = apply_bulk_operations(self.user, [
+			{'op': 'complete', 'ids': ids[:2] + [self.foreign.id]},
+			{'op': 'reschedule', 'ids': ids[2:], 'shift_days': 2},
+			{'op': 'delete', 'ids': [ids[3]]},
+			{'op': 'status', 'ids': [ids[3]], 'status': 'pending'},
+		])
+
+		self.assertEqual([item['result'] for item in results], ['updated', 'updated', 'not_found', 'updated', 'updated', 'deleted', 'not_found'])
+		self.assertEqual(Task.objects.get(pk=ids[0]).status, 'completed')
+		self.assertIsNotNone(Task.objects.get(pk=ids[0]).completed_at)
+		self.assertEqual(Task.objects.get(pk=ids[2]).scheduled_date, self.day + timedelta(days=2))
+		self.assertEqual(Task.objects.get(pk=self.foreign.id).status, 'pending')
+		self.assertTrue(TaskTombstone.objects.filter(task_id=ids[3], created_by=self.user).exists())
+
+		counts = {(stat.day, stat.status): stat.count for stat in TaskDailyStat.objects.filter(user=self.user).exclude(count=0)}
+		self.assertEqual(counts, {(self.day, 'completed'): 2, (self.day + timedelta(days=2), 'pending'): 1})
+
+
+	def test_delete_refuses_unhandled_relations(self):
+		relation = next(relation for relation in Task._meta.related_objects if relation.related_model is TaskComment)
+		protected = mock.Mock(related_model=TaskComment, field=relation.field, on_delete=models.PROTECT)
+		with mock.patch.object(Task._meta, 'related_objects', [protected]), self.assertRaises(NotImplementedError):
+			apply_bulk_operations(self.user, [{'op': 'delete', 'ids': [self.tasks[0].id]}])
+
+		self.assertTrue(Task.objects.filter(pk=self.tasks[0].id).exists())
+		self.assertFalse(TaskTombstone.objects.exists())
+
+
+class IntervalIndexTest(SimpleTestCase):
+
+	def test_overlapping_matches_brute_force(self):
+		intervals = [(start, start + length, i) for i, (start, length) in enumerate([(0, 30), (10, 5), (20, 60), (100, 10), (105, 1), (200, 15)])]
+		index = IntervalIndex(intervals)
+		for start, end in [(0, 1), (14, 21), (30, 100), (106, 107), (150, 200), (300, 400)]:
+			expected = sorted(interval for interval in intervals if interval[0] < end and interval[1] > start)
+			self.assertEqual(index.overlapping(start, end), expected)
+
+
+class TaskSchedulingTest(TestCase):
+
+	def setUp(self):
+		self.user = User.objects.create_user(email='schedule@example.com', password='secret', image=None)
+		self.day = date(2025, 5, 5)
+
+	def create(self, hour, minutes=60, **kwargs):
+		fields = {'task_name': 't', 'scheduled_date': self.day, 'scheduled_time': time(hour), 'duration_minutes': minutes, 'assigned_to_type': 'self', 'created_by': self.user, **kwargs}
+		return Task.objects.create(**fields)
+
+	def test_conflicts_and_free_slots(self):
+		task = self.create(9)
+		self.create(11, assigned_to_type='family')
+
+		self.assertEqual([conflict[2] for conflict in find_conflicts(self.user, ['self'], self.day, time(9, 30))], [task.id])
+		self.assertTrue(is_free(self.user, ['self'], self.day, time(10), 60))
+		self.assertFalse(is_free(self.user, ['child:1'], self.day, time(11, 15)))
+
+		slots = free_slots(self.user, ['self'], self.day, 60, count=3, day_start=time(8), day_end=time(13))
+		self.assertEqual([slot[1] for slot in slots], [time(8), time(10), time(12)])
+
+	def test_cached_day_follows_task_writes(self):
+		task = self.create(9)
+		self.assertFalse(is_free(self.user, ['self'], self.day, time(9)))
+
+		task.scheduled_date = self.day + timedelta(days=1)
+		task.save()
+		self.assertTrue(is_free(self.user, ['self'], self.day, time(9)))
+		self.assertFalse(is_free(self.user, ['self'], self.day + timedelta(days=1), time(9)))
+
+		task.delete()
+		self.assertTrue(is_free(self.user, ['self'], self.day + timedelta(days=1), time(9)))
+
+
+	def test_auto_schedule_packs_by_priority(self):
+		day = timezone.localdate() + timedelta(days=1)
+		kept = self.create(9, scheduled_date=day)
+		clashing = self.create(9, minutes=30, scheduled_date=day, priority='low')
+		urgent = self.create(9, scheduled_date=day, scheduled_time=None, priority='urgent')
+		family = self.create(9, minutes=30, scheduled_date=day, scheduled_time=None, assigned_to_type='family')
+
+		placed, unplaced = auto_schedule(self.user, [clashing, urgent, family, kept], day_start=time(9), day_end=time(12))
+
+		self.assertEqual(unplaced, [])
+		slots = {task.id: (task.scheduled_time, moved) for task, moved in placed}
+		self.assertEqual(slots[kept.id], (time(9), False))
+		self.assertEqual(slots[urgent.id], (time(10), True))
+		self.assertEqual(slots[family.id], (time(11), True))
+		self.assertEqual(slots[clashing.id], (time(11, 30), True))
+		self.assertEqual(Task.objects.get(pk=clashing.id).scheduled_time, time(11, 30))
+
+	def test_auto_schedule_reopens_overdue_tasks(self):
+		late = self.create(9, scheduled_date=timezone.localdate() - timedelta(days=2))
+		Task.objects.filter(pk=late.pk).update(status='overdue')
+		late.refresh_from_db()
+
+		placed, unplaced = auto_schedule(self.user, [late], day_start=time(9), day_end=time(12))
+
+		self.assertEqual((len(placed), unplaced), (1, []))
+		late.refresh_from_db()
+		self.assertEqual(late.status, 'pending')
+		self.assertGreaterEqual(late.scheduled_date, timezone.localdate())
+
+class ReminderDispatcherTest(TestCase):
+
+	def setUp(self):
+		self.user = User.objects.create_user(email='remind@example.com', password='secret', image=None)
+		self.now = timezone.now().replace(second=0, microsecond=0)
+		self.sink = QueueSink()
+		self.dispatcher = ReminderDispatcher(sinks=[self.sink], lead_time=timedelta(minutes=10), window=timedelta(hours=1))
+
+	def create(self, starts_at, **kwargs):
+		starts_at = timezone.localtime(starts_at)
+		fields = {'task_name': 't', 'scheduled_date': starts_at.date(), 'scheduled_time': starts_at.time(), 'assigned_to_type': 'self', 'created_by': self.user, **kwargs}
+		return Task.objects.create(**fields)
+
+	def test_fires_once_at_lead_time(self):
+		task = self.create(self.now + timedelta(minutes=30))
+		self.create(self.now + timedelta(minutes=40), status='completed')
+		self.assertEqual(self.dispatcher.tick(self.now), [])
+		self.assertEqual(len(self.dispatcher), 1)
+
+		fired = self.dispatcher.fire_due(self.now + timedelta(minutes=20))
+		self.assertEqual([reminder.task_id for reminder in fired], [task.id])
+		self.assertEqual(self.sink.queue.get_nowait().task_id, task.id)
+		self.assertNotIn(task.id, self.dispatcher.keys_by_task)
+
+		# An edit after sending doesn't send the same reminder again
+		task.task_name = 'renamed'
+		task.save()
+		self.dispatcher.apply_changes({task.id})
+		self.assertEqual(len(self.dispatcher), 0)
+
+	def test_edits_are_applied_incrementally(self):
+		moved = self.create(self.now + timedelta(minutes=30))
+		deleted = self.create(self.now + timedelta(minutes=35))
+		self.dispatcher.tick(self.now)
+
+		starts_at = timezone.localtime(self.now + timedelta(minutes=50))
+		moved.scheduled_date, moved.scheduled_time = starts_at.date(), starts_at.time()
+		moved.save()
+		deleted.delete()
+		self.dispatcher.poll_changes()
+
+		self.assertEqual(self.dispatcher.fire_due(self.now + timedelta(minutes=30)), [])
+		self.assertEqual([reminder.task_id for reminder in self.dispatcher.fire_due(self.now + timedelta(minutes=40))], [moved.id])
+
+	def test_changes_use_the_given_clock(self):
+		now = self.now - timedelta(days=1)
+		task = self.create(now + timedelta(minutes=30))
+		self.dispatcher.tick(now)
+
+		starts_at = timezone.localtime(now + timedelta(minutes=50))
+		task.scheduled_date, task.scheduled_time = starts_at.date(), starts_at.time()
+		task.save()
+		self.dispatcher.poll_changes(now)
+
+		self.assertEqual([reminder.task_id for reminder in self.dispatcher.fire_due(now + timedelta(minutes=40))], [task.id])
+
+class TaskGenerationStreamTest(TestCase):
+
+	def test_stops_reading_completion_at_task_limit(self):
+		user = User.objects.create_user(email='generate@example.com', password='secret', image=None)
+		read, closed = [], []
+
+		def completion(prompt, partners, children):
+			try:
+				yield '{"tasks": ['
+				for number in range(10):
+					read.append(number)
+					yield json.dumps({'task_name': f'task {number}', 'scheduled_date': '2025-01-06'}) + ','
+				yield ']}'
+			finally:
+				closed.append(True)
+
+		with mock.patch('task.ai_stream._completion_text', completion), mock.patch('task.ai_stream.MAX_GENERATED_TASKS', 2):
+			events = list(stream_task_generation(user, 'plan my week'))
+
+		self.assertEqual(Task.objects.filter(created_by=user).count(), 2)
+		self.assertEqual((read, closed), ([0, 1], [True]))
+		self.assertTrue(events[-1].startswith('event: done'))
+
+
+class JSONArrayStreamTest(SimpleTestCase):
+
+	def test_objects_come_out_as_soon_as_they_close(self):
+		text = '```json\n{"tasks": [{"task_name": "a} [\\"x", "tags": [1, {}]}, {"task_name": "b"}], "extra": [{"c": 1}]}\n```'
+		parser = JSONArrayStream()
+		seen = [(index, item['task_name']) for index, char in enumerate(text) for item in parser.feed(char)]
+		self.assertEqual([name for _, name in seen], ['a} ["x', 'b'])
+		self.assertEqual(text[seen[0][0]], '}')
+
+
+class GenerationCacheTest(SimpleTestCase):
+
+	def test_normalized_prompts_share_an_entry(self):
+		generation_cache = GenerationCache('test-normalize', shared=False)
+		generation_cache.get_or_generate('Plan my week!', lambda: ['a'], context={'user': 1})
+		self.assertEqual(generation_cache.get_or_generate('  plan MY   week ', lambda: ['b'], context={'user': 1}), (['a'], True))
+		self.assertEqual(generation_cache.get_or_generate('plan my week', lambda: ['c'], context={'user': 2}), (['c'], False))
+
+	def test_lru_eviction(self):
+		generation_cache = GenerationCache('test-lru', max_entries=2, shared=False)
+		for prompt in ['a', 'b']:
+			generation_cache.get_or_generate(prompt, lambda: prompt)
+		generation_cache.get_or_generate('a', lambda: 'again')
+		generation_cache.get_or_generate('c', lambda: 'c')
+		self.assertEqual(generation_cache.get_or_generate('a', lambda: 'again'), ('a', True))
+		self.assertEqual(generation_cache.get_or_generate('b', lambda: 'b2'), ('b2', False))
+		self.assertEqual(generation_cache.stats()['evictions'], 2)
+
+	def test_concurrent_requests_are_coalesced(self):
+		generation_cache = GenerationCache('test-coalesce', shared=False)
+		started, release, calls, results = threading.Event(), threading.Event(), [], []
+
+		def generate():
+			calls.append(1)
+			started.set()
+			release.wait(5)
+			return 'tasks'
+
+		leader = threading.Thread(target=lambda: results.append(generation_cache.get_or_generate('p', generate)))
+		leader.start()
+		started.wait(5)
+		follower = threading.Thread(target=lambda: results.append(generation_cache.get_or_generate('p', generate)))
+		follower.start()
+		while generation_cache.stats()['coalesced'] == 0:
+			pass
+		release.set()
+		leader.join()
+		follower.join()
+
+		self.assertEqual(len(calls), 1)
+		self.assertEqual(sorted(results), [('tasks', False), ('tasks', True)])
+
+@skipUnless(connection.vendor == 'postgresql', 'EXPLAIN output is PostgreSQL specific')
+class TaskQueryPlanTest(TestCase):
+	"""The main task queries must be answerable from an index.
+
+	The test table is tiny, so sequential scans are disabled for the session, which makes the
+	planner pick an index whenever one can serve the query.
+	"""
+
+	@classmethod
+	def setUpTestData(cls):
+		cls.user = User.objects.create_user(email='plan@example.com', password='secret', image=None)
+		start = date(2025, 1, 1)
+		Task.objects.bulk_create([
+			Task(
+				task_name=f'Task {i}',
+				description='Weekly groceries' if i % 5 == 0 else 'Tidy up',
+				scheduled_date=start + timedelta(days=i % 60),
+				scheduled_time=time(8 + i % 10),
+				assigned_to_type='self',
+				assigned_user=cls.user,
+				priority=['low', 'medium', 'high', 'urgent'][i % 4],
+				status=['pending', 'completed', 'in_progress'][i % 3],
+				created_by=cls.user,
+			)
+			for i in range(300)
+		])
+
+	def setUp(self):
+		with connection.cursor() as cursor:
+			cursor.execute('ANALYZE task_task')
+			cursor.execute('SET LOCAL enable_seqscan = off')
+
+	def assertUsesIndex(self, queryset, without_sort=False):
+		plan = queryset.explain()
+		self.assertRegex(plan, r'Index (Only )?Scan|Bitmap Index Scan', plan)
+		if without_sort:
+			self.assertNotIn('Sort', plan, plan)
+
+	def test_creator_list(self):
+		self.assertUsesIndex(Task.objects.filter(created_by=self.user)[:20], without_sort=True)
+
+	def test_assignee_list(self):
+		self.assertUsesIndex(Task.objects.filter(assigned_user=self.user)[:20], without_sort=True)
+
+	def test_calendar_range(self):
+		queryset = Task.objects.filter(created_by=self.user, scheduled_date__range=(date(2025, 1, 10), date(2025, 1, 17)))
+		# A page of it, the whole range is small enough that the planner may as well sort it
+		self.assertUsesIndex(queryset[:20], without_sort=True)
+		self.assertIn('task_creator_schedule_idx', queryset[:20].explain())
+
+	def test_status_search(self):
+		self.assertUsesIndex(Task.objects.filter(status='pending', scheduled_date__gte=date(2025, 1, 15)))
+
+	def test_open_tasks(self):
+		queryset = Task.objects.filter(created_by=self.user, status__in=TaskQuerySet.OPEN_STATUSES)
+		self.assertUsesIndex(queryset.order_by('scheduled_date', 'scheduled_time')[:20])
+
+	def test_overdue_sweep(self):
+		self.assertUsesIndex(Task.objects.filter(status='pending').overdue().values('id')[:100])
+
+	def test_filtered_search(self):
+		params = {'status': 'pending,in_progress', 'assigned_user': self.user.id, 'date_from': '2025-01-10', 'date_to': '2025-01-20'}
+		self.assertUsesIndex(TaskFilter(params, queryset=Task.objects.all()).qs)
+
+	def test_text_search(self):
+		queryset = TaskFilter({'q': 'groceries'}, queryset=Task.objects.all()).qs
+		self.assertIn('task_search_vector_idx', queryset.explain())
+		self.assertEqual(queryset.count(), 60)
+		self.assertTrue(all(task.rank > 0 for task in queryset))
@@ -10,14 +10,44 @@ urlpatterns = [
 
 	path('api/v1/task/<int:pk>', views.getATask),
 
+	path('api/v1/task/<int:pk>/ai_response/', views.getTaskAIResponse),
+
 	path('api/v1/task/search/', views.searchTask),
 
+	path('api/v1/task/changes/', views.getTaskChanges),
+
+	path('api/v1/task/stats/', views.getTaskStats),
+
 	path('api/v1/task/create/', views.createTask),
 
 	path('api/v1/task/update/<int:pk>', views.updateTask),
 
 	path('api/v1/task/delete/<int:pk>', views.deleteTask),
 
+	path('api/v1/task/batch/create/', views.createTaskBatch),
+
+	path('api/v1/task/bulk/', views.bulkUpdateTask),
+
+	path('api/v1/task/generation/stream/', views.streamTaskGeneration),
+
+	path('api/v1/task/generation/lookup/', views.lookupTaskGeneration),
+
+	path('api/v1/task/generation/stats/', views.getGenerationCacheStats),
+
+	path('api/v1/task/occurrences/', views.getTaskOccurrences),
+
+	path('api/v1/task/occurrences/today/', views.getTodayTaskOccurrences),
+
+	path('api/v1/task/<int:pk>/occurrence/', views.createTaskOccurrenceException),
+
+	path('api/v1/task/schedule/busy/', views.getTaskBusy),
+
+	path('api/v1/task/schedule/conflicts/', views.getTaskConflicts),
+
+	path('api/v1/task/schedule/free_slots/', views.getTaskFreeSlots),
+
+	path('api/v1/task/schedule/auto/', views.autoScheduleTask),
+
 
 
 ]
\ No newline at end of file
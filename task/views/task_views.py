@@ -1,20 +1,39 @@
+from datetime import timedelta
+
 from django.core.exceptions import ObjectDoesNotExist
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_time
 
 from rest_framework import serializers, status
 from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.serializers import ValidationError
 
 from drf_spectacular.utils import  extend_schema, OpenApiParameter
 
 from authentication.decorators import has_permissions
-from task.models import Task
-from task.serializers import TaskSerializer, TaskListSerializer,TaskMinimalListSerializer
+from task.models import Task, TaskBatch, TaskOccurrenceException
+from task.serializers import MAX_BULK_TASK_IDS, TaskSerializer, TaskListSerializer,TaskMinimalListSerializer, TaskOccurrenceSerializer, TaskOccurrenceExceptionSerializer, TaskBatchIngestSerializer, TaskBulkSerializer, TaskAutoScheduleSerializer, TaskGenerationSerializer
+from task.ingestion import ingest_task_batch
+from task.bulk import apply_bulk_operations
+from task.autoschedule import auto_schedule
+from task.generation import cached_generation, remember_generation
+from task.ai_stream import stream_task_generation
+from task.sync import task_changes
+from task.rollups import PERIODS, PERIOD_DAY, task_stats
+from task.scheduling import MAX_SEARCH_DAYS, busy_blocks, find_conflicts, free_slots, task_members, to_time
 from task.filters import TaskFilter
+from task.recurrence import iter_dates, upcoming_occurrences
 
 from commons.enums import PermissionEnum
-from commons.pagination import Pagination
+from commons.pagination import COUNT_NONE, get_pagination
+from commons.streaming import EXPORT_FORMATS, sse_response, stream_export
+from commons.generation_cache import generation_cache_stats
+
 
+MAX_OCCURRENCE_WINDOW_DAYS = 366
+MAX_STATS_WINDOW_DAYS = 3 * 366
 
 
 
@@ -25,6 +44,9 @@ from commons.pagination import Pagination
 		OpenApiParameter("page"),
 		
 		OpenApiParameter("size"),
+		OpenApiParameter("cursor"),
+		OpenApiParameter("count"),
+		OpenApiParameter("overdue"),
   ],
 	request=TaskSerializer,
 	responses=TaskSerializer
@@ -33,16 +55,14 @@ from commons.pagination import Pagination
 # @permission_classes([IsAuthenticated])
 # @has_permissions([PermissionEnum.PERMISSION_LIST_VIEW.name])
 def getAllTask(request):
-	tasks = Task.objects.all()
-	total_elements = tasks.count()
+	tasks = Task.objects.for_list().with_overdue()
 
-	page = request.query_params.get('page')
-	size = request.query_params.get('size')
+	overdue = request.query_params.get('overdue')
+	if overdue in ('true', 'false'):
+		tasks = tasks.filter(overdue=overdue == 'true')
 
-	# Pagination
-	pagination = Pagination()
-	pagination.page = page
-	pagination.size = size
+	# Pagination, keyset pagination when the client sends a cursor
+	pagination = get_pagination(request, ordering='scheduled_date')
 	tasks = pagination.paginate_data(tasks)
 
 	serializer = TaskListSerializer(tasks, many=True)
@@ -52,7 +72,8 @@ def getAllTask(request):
 		'page': pagination.page,
 		'size': pagination.size,
 		'total_pages': pagination.total_pages,
-		'total_elements': total_elements,
+		'total_elements': pagination.total_elements,
+		'next_cursor': pagination.next_cursor,
 	}
 
 	return Response(response, status=status.HTTP_200_OK)
@@ -64,6 +85,7 @@ def getAllTask(request):
 	parameters=[
 		OpenApiParameter("page"),
 		OpenApiParameter("size"),
+		OpenApiParameter("export"),
   ],
 	request=TaskSerializer,
 	responses=TaskSerializer
@@ -72,7 +94,13 @@ def getAllTask(request):
 # @permission_classes([IsAuthenticated])
 # @has_permissions([PermissionEnum.PERMISSION_LIST_VIEW.name])
 def getAllTaskWithoutPagination(request):
-	tasks = Task.objects.all()
+	tasks = Task.objects.for_list().with_overdue()
+
+	# ?export=ndjson|csv streams the rows instead of building one response in memory
+	export_format = request.query_params.get('export')
+	if export_format in EXPORT_FORMATS:
+		tasks = tasks.select_related('created_by')
+		return stream_export(tasks, TaskListSerializer, export_format, filename='tasks')
 
 	serializer = TaskListSerializer(tasks, many=True)
 
@@ -100,21 +128,48 @@ def getATask(request, pk):
 @api_view(['GET'])
 # @permission_classes([IsAuthenticated])
 # @has_permissions([PermissionEnum.PERMISSION_DETAILS_VIEW.name])
-def searchTask(request):
-	tasks = TaskFilter(request.GET, queryset=Task.objects.all())
-	tasks = tasks.qs
+def getTaskAIResponse(request, pk):
+	try:
+		raw_ai_response = Task.objects.values_list('raw_ai_response', flat=True).get(pk=pk)
+		return Response({'id': pk, 'raw_ai_response': raw_ai_response}, status=status.HTTP_200_OK)
+	except ObjectDoesNotExist:
+		return Response({'detail': f"Task id - {pk} doesn't exists"}, status=status.HTTP_400_BAD_REQUEST)
 
-	print('searched_products: ', tasks)
 
-	total_elements = tasks.count()
 
-	page = request.query_params.get('page')
-	size = request.query_params.get('size')
 
-	# Pagination
-	pagination = Pagination()
-	pagination.page = page
-	pagination.size = size
+@extend_schema(
+	parameters=[
+		OpenApiParameter("q"),
+		OpenApiParameter("status"),
+		OpenApiParameter("priority"),
+		OpenApiParameter("assigned_to_type"),
+		OpenApiParameter("assigned_user"),
+		OpenApiParameter("assigned_partner"),
+		OpenApiParameter("assigned_child"),
+		OpenApiParameter("task_category"),
+		OpenApiParameter("generated_by_ai"),
+		OpenApiParameter("date_from"),
+		OpenApiParameter("date_to"),
+		OpenApiParameter("page"),
+		OpenApiParameter("size"),
+		OpenApiParameter("cursor"),
+		OpenApiParameter("count"),
+	],
+	request=TaskSerializer,
+	responses=TaskSerializer
+)
+@api_view(['GET'])
+# @permission_classes([IsAuthenticated])
+# @has_permissions([PermissionEnum.PERMISSION_DETAILS_VIEW.name])
+def searchTask(request):
+	tasks = TaskFilter(request.GET, queryset=Task.objects.for_list().with_overdue())
+	tasks = tasks.qs
+
+	# Pagination, text results are ordered by rank so they always use page/size. No count
+	# query unless the client asks for one, has_next comes from fetching one extra row.
+	ranked = bool(request.query_params.get('q'))
+	pagination = get_pagination(request, ordering='scheduled_date', keyset=not ranked, default_count=COUNT_NONE)
 	tasks = pagination.paginate_data(tasks)
 
 	serializer = TaskListSerializer(tasks, many=True)
@@ -124,7 +179,8 @@ def searchTask(request):
 		'page': pagination.page,
 		'size': pagination.size,
 		'total_pages': pagination.total_pages,
-		'total_elements': total_elements,
+		'total_elements': pagination.total_elements,
+		'next_cursor': pagination.next_cursor,
 	}
 
 	if len(tasks) > 0:
@@ -135,7 +191,7 @@ def searchTask(request):
 
 
 
-@extend_schema(request=TaskSerializer, responses=TaskSerializer)
+@extend_schema(parameters=[OpenApiParameter("check_conflicts")], request=TaskSerializer, responses=TaskSerializer)
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 # @has_permissions([PermissionEnum.PERMISSION_CREATE.name])
@@ -150,6 +206,9 @@ def createTask(request):
 	serializer = TaskSerializer(data=filtered_data)
 
 	if serializer.is_valid():
+		conflicts = _schedule_conflicts(request, request.user, serializer.validated_data)
+		if conflicts:
+			return Response({'detail': 'The task overlaps other tasks', 'conflicts': conflicts}, status=status.HTTP_409_CONFLICT)
 		serializer.save()
 		return Response(serializer.data, status=status.HTTP_201_CREATED)
 	else:
@@ -158,7 +217,7 @@ def createTask(request):
 
 
 
-@extend_schema(request=TaskSerializer, responses=TaskSerializer)
+@extend_schema(parameters=[OpenApiParameter("check_conflicts")], request=TaskSerializer, responses=TaskSerializer)
 @api_view(['PUT'])
 @permission_classes([IsAuthenticated])
 # @has_permissions([PermissionEnum.PERMISSION_UPDATE.name, PermissionEnum.PERMISSION_PARTIAL_UPDATE.name])
@@ -168,6 +227,9 @@ def updateTask(request,pk):
 		data = request.data
 		serializer = TaskSerializer(tasks, data=data)
 		if serializer.is_valid():
+			conflicts = _schedule_conflicts(request, tasks.created_by, serializer.validated_data, exclude_task_id=tasks.id)
+			if conflicts:
+				return Response({'detail': 'The task overlaps other tasks', 'conflicts': conflicts}, status=status.HTTP_409_CONFLICT)
 			serializer.save()
 			return Response(serializer.data, status=status.HTTP_200_OK)
 		else:
@@ -190,3 +252,432 @@ def deleteTask(request, pk):
 	except ObjectDoesNotExist:
 		return Response({'detail': f"Task id - {pk} doesn't exists"}, status=status.HTTP_400_BAD_REQUEST)
 
+
+
+
+
+def _parse_date_param(value):
+	try:
+		return parse_date(str(value or ''))
+	except ValueError:
+		return None
+
+
+
+
+def _occurrence_window(request, default_days=7):
+	start = _parse_date_param(request.query_params.get('start')) or timezone.localdate()
+	end = _parse_date_param(request.query_params.get('end')) or start + timedelta(days=default_days)
+	if end < start:
+		raise ValidationError({'end': 'End date must not be before start date.'})
+	if (end - start).days > MAX_OCCURRENCE_WINDOW_DAYS:
+		raise ValidationError({'end': f'The window can span at most {MAX_OCCURRENCE_WINDOW_DAYS} days.'})
+	return start, end
+
+
+
+
+@extend_schema(
+	parameters=[
+		OpenApiParameter("start"),
+		OpenApiParameter("end"),
+  ],
+	request=TaskOccurrenceSerializer,
+	responses=TaskOccurrenceSerializer
+)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def getTaskOccurrences(request):
+	try:
+		start, end = _occurrence_window(request)
+	except ValidationError as e:
+		return Response(e.detail, status=status.HTTP_400_BAD_REQUEST)
+
+	occurrences = upcoming_occurrences(request.user, start, end)
+	serializer = TaskOccurrenceSerializer(occurrences, many=True)
+
+	response = {
+		'occurrences': serializer.data,
+		'start': start,
+		'end': end,
+		'total_elements': len(occurrences),
+	}
+
+	return Response(response, status=status.HTTP_200_OK)
+
+
+
+
+@extend_schema(request=TaskOccurrenceSerializer, responses=TaskOccurrenceSerializer)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def getTodayTaskOccurrences(request):
+	today = timezone.localdate()
+	occurrences = upcoming_occurrences(request.user, today, today)
+	serializer = TaskOccurrenceSerializer(occurrences, many=True)
+
+	return Response({'occurrences': serializer.data, 'date': today}, status=status.HTTP_200_OK)
+
+
+
+
+def _conflict_items(conflicts):
+	return [{'task': task_id, 'start': to_time(start), 'end': to_time(end)} for start, end, task_id in conflicts]
+
+
+
+
+def _schedule_conflicts(request, owner, data, exclude_task_id=None):
+	# Opt-in check run by createTask and updateTask before saving
+	if request.query_params.get('check_conflicts') != 'true' or not data.get('scheduled_time'):
+		return []
+	conflicts = find_conflicts(
+		owner,
+		task_members(data),
+		data['scheduled_date'],
+		data['scheduled_time'],
+		data.get('duration_minutes'),
+		exclude_task_id=exclude_task_id,
+	)
+	return _conflict_items(conflicts)
+
+
+
+
+def _members_param(request):
+	return [member.strip() for member in request.query_params.get('members', '').split(',') if member.strip()]
+
+
+
+
+def _positive_int_param(request, name, default):
+	try:
+		value = int(request.query_params.get(name, default))
+	except (TypeError, ValueError):
+		raise ValidationError({name: 'A positive integer is required.'})
+	if value < 1:
+		raise ValidationError({name: 'A positive integer is required.'})
+	return value
+
+
+
+
+@extend_schema(
+	parameters=[
+		OpenApiParameter("date"),
+		OpenApiParameter("members"),
+  ],
+)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def getTaskBusy(request):
+	day = _parse_date_param(request.query_params.get('date')) or timezone.localdate()
+	members = _members_param(request)
+	busy = [{'start': to_time(start), 'end': to_time(end)} for start, end in busy_blocks(request.user, members, day)]
+
+	return Response({'date': day, 'members': members, 'busy': busy}, status=status.HTTP_200_OK)
+
+
+
+
+@extend_schema(
+	parameters=[
+		OpenApiParameter("date"),
+		OpenApiParameter("time"),
+		OpenApiParameter("duration"),
+		OpenApiParameter("members"),
+		OpenApiParameter("exclude"),
+  ],
+)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def getTaskConflicts(request):
+	day = _parse_date_param(request.query_params.get('date'))
+	start_time = parse_time(request.query_params.get('time', ''))
+	if day is None or start_time is None:
+		return Response({'detail': 'A valid date and time are required.'}, status=status.HTTP_400_BAD_REQUEST)
+	try:
+		duration = _positive_int_param(request, 'duration', 30)
+		exclude = _positive_int_param(request, 'exclude', 1) if request.query_params.get('exclude') else None
+	except ValidationError as e:
+		return Response(e.detail, status=status.HTTP_400_BAD_REQUEST)
+
+	conflicts = find_conflicts(request.user, _members_param(request), day, start_time, duration, exclude_task_id=exclude)
+
+	return Response({'free': not conflicts, 'conflicts': _conflict_items(conflicts)}, status=status.HTTP_200_OK)
+
+
+
+
+@extend_schema(
+	parameters=[
+		OpenApiParameter("duration"),
+		OpenApiParameter("count"),
+		OpenApiParameter("start"),
+		OpenApiParameter("members"),
+		OpenApiParameter("day_start"),
+		OpenApiParameter("day_end"),
+  ],
+)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def getTaskFreeSlots(request):
+	try:
+		duration = _positive_int_param(request, 'duration', 30)
+		count = min(_positive_int_param(request, 'count', 5), 50)
+	except ValidationError as e:
+		return Response(e.detail, status=status.HTTP_400_BAD_REQUEST)
+
+	now = timezone.localtime()
+	start = _parse_date_param(request.query_params.get('start')) or now.date()
+	day_start = parse_time(request.query_params.get('day_start', '')) or None
+	day_end = parse_time(request.query_params.get('day_end', '')) or None
+
+	slots = free_slots(
+		request.user,
+		_members_param(request),
+		start,
+		duration,
+		count=count,
+		day_start=day_start,
+		day_end=day_end,
+		not_before=now.replace(tzinfo=None),
+	)
+	slots = [{'date': day, 'start': slot_start, 'end': slot_end} for day, slot_start, slot_end in slots]
+
+	return Response({'slots': slots, 'duration': duration}, status=status.HTTP_200_OK)
+
+
+
+
+@extend_schema(request=TaskAutoScheduleSerializer, responses=TaskAutoScheduleSerializer)
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def autoScheduleTask(request):
+	serializer = TaskAutoScheduleSerializer(data=request.data)
+
+	if not serializer.is_valid():
+		return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+	data = serializer.validated_data
+
+	tasks = Task.objects.for_list().filter(created_by=request.user)
+	if 'batch_id' in data:
+		batch = TaskBatch.objects.filter(batch_id=data['batch_id'], created_by=request.user).first()
+		if batch is None:
+			return Response({'detail': f"Batch {data['batch_id']} doesn't exists"}, status=status.HTTP_400_BAD_REQUEST)
+		tasks = tasks.filter(batch=batch)
+	elif 'task_ids' in data:
+		tasks = tasks.filter(pk__in=data['task_ids'])
+	else:
+		tasks = tasks.filter(scheduled_time__isnull=True, scheduled_date__gte=timezone.localdate())[:MAX_BULK_TASK_IDS]
+
+	placed, unplaced = auto_schedule(
+		request.user,
+		list(tasks),
+		start_day=data.get('start'),
+		day_start=data.get('day_start'),
+		day_end=data.get('day_end'),
+		max_days=data.get('max_days', MAX_SEARCH_DAYS),
+		commit=not data['dry_run'],
+	)
+
+	response = {
+		'scheduled': [
+			{'id': task.id, 'scheduled_date': task.scheduled_date, 'scheduled_time': task.scheduled_time, 'moved': moved}
+			for task, moved in placed
+		],
+		'unscheduled': [task.id for task in unplaced],
+		'dry_run': data['dry_run'],
+	}
+
+	return Response(response, status=status.HTTP_200_OK)
+
+
+
+
+@extend_schema(
+	parameters=[
+		OpenApiParameter("start"),
+		OpenApiParameter("end"),
+		OpenApiParameter("period", enum=list(PERIODS)),
+  ],
+)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def getTaskStats(request):
+	today = timezone.localdate()
+	start = _parse_date_param(request.query_params.get('start')) or today - timedelta(days=today.weekday())
+	end = _parse_date_param(request.query_params.get('end')) or start + timedelta(days=6)
+	if end < start:
+		return Response({'end': 'End date must not be before start date.'}, status=status.HTTP_400_BAD_REQUEST)
+	if (end - start).days > MAX_STATS_WINDOW_DAYS:
+		return Response({'end': f'The window can span at most {MAX_STATS_WINDOW_DAYS} days.'}, status=status.HTTP_400_BAD_REQUEST)
+
+	period = request.query_params.get('period', PERIOD_DAY)
+	if period not in PERIODS:
+		return Response({'period': f"Period must be one of {', '.join(PERIODS)}."}, status=status.HTTP_400_BAD_REQUEST)
+
+	response = {
+		'start': start,
+		'end': end,
+		'period': period,
+		**task_stats(request.user, start, end, period),
+	}
+
+	return Response(response, status=status.HTTP_200_OK)
+
+
+
+
+@extend_schema(request=TaskOccurrenceExceptionSerializer, responses=TaskOccurrenceExceptionSerializer)
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def createTaskOccurrenceException(request, pk):
+	try:
+		task = Task.objects.get(pk=pk, created_by=request.user)
+	except ObjectDoesNotExist:
+		return Response({'detail': f"Task id - {pk} doesn't exists"}, status=status.HTTP_400_BAD_REQUEST)
+
+	occurrence_date = _parse_date_param(request.data.get('occurrence_date'))
+	if occurrence_date is None or occurrence_date not in iter_dates(task, occurrence_date, occurrence_date):
+		return Response({'detail': f"Task id - {pk} has no occurrence on {request.data.get('occurrence_date')}"}, status=status.HTTP_400_BAD_REQUEST)
+
+	data = {key: value for key, value in request.data.items() if value != ''}
+	data['task'] = task.id
+
+	# One exception row per occurrence, a second override replaces the first
+	instance = TaskOccurrenceException.objects.filter(task=task, occurrence_date=occurrence_date).first()
+	serializer = TaskOccurrenceExceptionSerializer(instance, data=data)
+
+	if serializer.is_valid():
+		serializer.save()
+		return Response(serializer.data, status=status.HTTP_201_CREATED if instance is None else status.HTTP_200_OK)
+	else:
+		return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+
+
+
+@extend_schema(request=TaskBatchIngestSerializer, responses=TaskBatchIngestSerializer)
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def createTaskBatch(request):
+	serializer = TaskBatchIngestSerializer(data=request.data)
+
+	if not serializer.is_valid():
+		return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+	try:
+		batch, task_ids = ingest_task_batch(request.user, serializer.validated_data, raw_tasks=request.data.get('tasks'))
+	except ValidationError as e:
+		return Response(e.detail, status=status.HTTP_400_BAD_REQUEST)
+
+	# Lets the next identical prompt skip the LLM, see lookupTaskGeneration
+	remember_generation(request.user, batch.ai_prompt, request.data.get('tasks'))
+
+	response = {
+		'batch_id': batch.batch_id,
+		'total_tasks': batch.total_tasks,
+		'task_ids': task_ids,
+	}
+
+	return Response(response, status=status.HTTP_201_CREATED)
+
+
+
+
+
+@extend_schema(request=TaskGenerationSerializer, responses=TaskListSerializer)
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def streamTaskGeneration(request):
+	serializer = TaskGenerationSerializer(data=request.data)
+
+	if not serializer.is_valid():
+		return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+	# Server-sent events, one per task as soon as it has been generated and saved
+	return sse_response(stream_task_generation(request.user, serializer.validated_data['prompt']))
+
+
+
+
+@extend_schema(request=TaskBatchIngestSerializer, responses=TaskBatchIngestSerializer)
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def lookupTaskGeneration(request):
+	prompt = request.data.get('prompt') or request.data.get('ai_prompt')
+	if not prompt:
+		return Response({'prompt': 'This field is required.'}, status=status.HTTP_400_BAD_REQUEST)
+
+	tasks = cached_generation(request.user, prompt)
+	if tasks is None:
+		return Response({'hit': False}, status=status.HTTP_404_NOT_FOUND)
+
+	return Response({'hit': True, 'tasks': tasks}, status=status.HTTP_200_OK)
+
+
+
+
+@extend_schema(request=None, responses=None)
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def getGenerationCacheStats(request):
+	return Response(generation_cache_stats(), status=status.HTTP_200_OK)
+
+
+
+
+@extend_schema(request=TaskBulkSerializer, responses=TaskBulkSerializer)
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def bulkUpdateTask(request):
+	serializer = TaskBulkSerializer(data=request.data)
+
+	if not serializer.is_valid():
+		return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+	try:
+		results = apply_bulk_operations(request.user, serializer.validated_data['operations'])
+	except ValidationError as e:
+		return Response(e.detail, status=status.HTTP_400_BAD_REQUEST)
+
+	response = {
+		'results': results,
+		'not_found': sum(1 for item in results if item['result'] == 'not_found'),
+	}
+
+	return Response(response, status=status.HTTP_200_OK)
+
+
+
+
+
+@extend_schema(
+	parameters=[
+		OpenApiParameter("watermark"),
+		OpenApiParameter("limit"),
+  ],
+	request=TaskListSerializer,
+	responses=TaskListSerializer
+)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def getTaskChanges(request):
+	try:
+		changes = task_changes(request.user, request.query_params.get('watermark'), request.query_params.get('limit'))
+	except ValueError:
+		return Response({'detail': "Limit must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+
+	serializer = TaskListSerializer(changes['changed'], many=True)
+
+	response = {
+		'tasks': serializer.data,
+		'deleted': changes['deleted'],
+		'watermark': changes['watermark'],
+		'has_more': changes['has_more'],
+		'full_resync': changes['full_resync'],
+	}
+
+	return Response(response, status=status.HTTP_200_OK)